@@ -5,10 +5,9 @@ from __future__ import print_function, with_statement
 import argparse
 import os
 import sys
-import xml
 
 from pom_utils import PomUtils
-from pom_handlers import _DFPomContentHandler
+from pom_handlers import PomHandlerManager
 
 
 class PomDetails(object):
@@ -21,7 +20,7 @@ class PomDetails(object):
 
     :param string repo_dir:
     :param string module_dir:
-    :param _DFPomContentHandler dm_pom_content_handler:
+    :param PomHandlerManager dm_pom_content_handler:
     :return:
     """
     self.project_name = module_dir
@@ -90,12 +89,8 @@ class ArtifactDependencyAnalysis(object):
       module = module_list.pop()
       if module in self._pom_details.keys():
         continue
-      full_source_path = os.path.join(repo_dir, module, 'pom.xml')
-      pom_handler = _DFPomContentHandler()
-      try:
-        with open(full_source_path) as source:
-          xml.sax.parse(source, pom_handler)
-      except IOError:
+      pom_handler = PomHandlerManager.parse(os.path.join(module, 'pom.xml'), rootdir=repo_dir)
+      if pom_handler is None:
         # assume this file has been removed for a good reason and just continue normally
         continue
       self._pom_details[module] = PomDetails(repo_dir, module, pom_handler)
@@ -153,8 +153,7 @@ class SubdirectoryComponent(BuildComponent):
 
   @property
   def exists(self):
-    subdir = self.directory
-    return os.path.exists(subdir) and os.path.isdir(subdir) and os.listdir(subdir)
+    return self.gen_context.has_source_files(self.directory)
 
   def inject_generated_dependencies(self):
     """Powers the mechanism by which generated targets are injected as dependencies into other
@@ -571,8 +570,7 @@ class ExternalProtosMixin(object):
   def is_external_protos(self):
     if not 'external-protos.mask' in self.pom.properties:
       return False
-    subdir = self.directory
-    if os.path.exists(subdir) and os.path.isdir(subdir) and os.listdir(subdir):
+    if self.gen_context.has_source_files(self.directory):
       return True
     return not self.subdirectory.startswith('src/test/')
 
@@ -740,8 +738,7 @@ class JooqGenComponent(BuildComponent):
       return ''
 
     config_path = os.path.join(self.pom.directory, self.gen_context.jooq_config_file)
-    with open(config_path, 'w+') as f:
-      f.write(config_data.strip())
+    self.gen_context.write_generated_file(config_path, config_data.strip())
 
     setup_target = None
     if not self.pom.jooq_info.skip_setup:
@@ -15,13 +15,18 @@ import os
 import re
 from shutil import copyfile, rmtree
 import signal
+import stat
 import subprocess
 import sys
 import time
 
+from file_utils import find_files
+from pom_handlers import CachedDependencyInfos, PomHandlerManager
+from pom_parse_cache import PomParseCache
 from pom_utils import PomUtils
 from pom_to_build import PomToBuild
 from generate_3rdparty import ThirdPartyBuildGenerator
+from profiling import Profiler
 
 
 def _get_dependency_patterns():
@@ -35,14 +40,24 @@ def _get_dependency_patterns():
 # GLOBAL CONFIGURATION VARIABLES
 # -------------------------------------------------
 _CACHE_DIRECTORY = './.pants.d/pom-gen/'
-_EXCLUDE_CONTAINS = ('/target/', './parents/', '/hack-protos/', '/dist/', '/.pants.d/',)
+# Under _CACHE_DIRECTORY. Git branch names can't start with '.', so this can't collide with the
+# per-branch index directories.
+_PARSE_CACHE_DIRECTORY = '.pom-parse-cache'
+_EXCLUDE_CONTAINS = ('/target/', './parents/', '/hack-protos/', '/dist/', '/.pants.d/', '/.git/',)
+# Directories which never contain generated BUILD files.
+_GEN_EXCLUDE_CONTAINS = ('/target/', '/.pants.d/', '/.git/',)
 _EXCLUDE_FILES = ('pom.xml',)
 _DEPENDENCY_PATTERNS = _get_dependency_patterns()
 _GENERATOR_PATHS = ['squarepants',]
 _GENERATOR_PATTERNS = ['*/bin/*', '*/src/main/python/*.py', '*/src/main/python/*/*.py',]
 _SCRIPT_DIR = 'squarepants/src/main/python/squarepants'
-_VERSION = 1.7
+_VERSION = 1.8
 _GEN_NAMES = set(['BUILD.gen', 'BUILD.aux',])
+# Under the per-branch index directory. Maps each pom to the modules depending on it, as of the
+# cached BUILD files.
+_DEPENDEES_INDEX = 'dependees.index'
+# 3rdparty/BUILD.gen is generated from the dependencyManagement section of this pom.
+_THIRD_PARTY_POM = 'parents/base/pom.xml'
 _BUILD_GEN_CACHING_ENABLED = True
 # -------------------------------------------------
 
@@ -90,44 +105,14 @@ class Task(object):
   def __call__(self):
     logger.debug('Starting %s.' % self.name)
     start = time.time()
-    value = self.run()
+    with Profiler.phase(self.name):
+      value = self.run()
     end = time.time()
     self._time_taken = end - start
     logger.debug('Done with %s (took %0.03f seconds).' % (self.name, self.duration))
     return value
 
 
-def find_files(roots, patterns):
-  """Recursively finds files in the given list of root directories which match any of the naming
-  patterns
-  :param roots: root paths to search under
-  :param patterns: filename patterns to search for
-  :return: list of files files that match the pattern
-  """
-  configs = {}
-  for pattern in patterns:
-    # Runs a second faster when in parallel.
-    key = len(configs)
-    if not key in configs:
-      configs[key] = []
-    names = configs[key]
-    if names:
-      names.append('-or')
-    names.extend(['-name' if '/' not in pattern else '-path', pattern])
-  try:
-    popen_list = []
-    for root in roots:
-      for key in configs:
-        popen_list.append(subprocess.Popen(['find', root] + configs[key], stdout=subprocess.PIPE))
-    logger.debug('Number of spawned tasks: {num_tasks}'.format(num_tasks=len(popen_list)))
-    results = set(line.strip() for line in stream_stdout(popen_list))
-    # If the empty string gets in the results, it mucks up the works.
-    if '' in results:
-      results.remove('')
-    return results
-  except OSError:
-    raise MissingToolError("Missing tool 'find'!")
-
 def find_branch():
   """:return: the name of the current git branch."""
   try:
@@ -152,8 +137,8 @@ def get_branch_cache(index_base, path):
   try:
     branch_name = Task('find_branch', find_branch)()
   except MissingToolError as e:
-    warn('%s, falling back on input hash.' % e)
-    branch_name = hash(path)
+    logger.warning('%s, falling back on input hash.' % e)
+    branch_name = str(hash(path))
   return os.path.join(index_base, branch_name)
 
 def exec_binaries(args_groups, env=None):
@@ -235,51 +220,101 @@ def find_gen_deps(baseroot):
   :param paths: list of root paths (typically just the project directory)
   """
   dep_patterns = _DEPENDENCY_PATTERNS
-  deps = find_files([baseroot], dep_patterns)
-  deps = deps.union(find_files(_GENERATOR_PATHS, _GENERATOR_PATTERNS))
+  deps = find_files([baseroot], dep_patterns, exclude_contains=_EXCLUDE_CONTAINS)
+  deps = deps.union(find_files(_GENERATOR_PATHS, _GENERATOR_PATTERNS,
+                               exclude_contains=_EXCLUDE_CONTAINS))
   # trim out deps we don't want
-  taboo_contains = _EXCLUDE_CONTAINS
-  taboo_equals = [os.path.join(baseroot, name) for name in _EXCLUDE_FILES]
-  deps = Task('trimming deps', lambda: [dep for dep in deps
-      if not any((n in dep) for n in taboo_contains) and not any((n == dep) for n in taboo_equals)
-    ])()
-  return deps
-
-def compute_hashes(paths, path_only=lambda p: False):
+  taboo_equals = set(os.path.join(baseroot, name) for name in _EXCLUDE_FILES)
+  return [dep for dep in deps if dep not in taboo_equals]
+
+def compute_hashes(paths, path_only=lambda p: False, stat_cache=None, stats=None):
   """Computes strong hashes of the contents of all the files paths, and returns them as a list.
   :param path_only: Optional lambda function which takes in a path, and returns true if that path
     should be hashed using only its pathname, rather than its binary contents.
+  :param stat_cache: Optional dict mapping paths to (hash, stat key) tuples, as returned by
+    load_stat_cache(). Files whose stat key still matches are not re-read.
+  :param stats: Optional list, which is filled with the stat key of each path (see stat_key()).
   """
   hashes = []
   for path in paths:
-    if path_only(path) or os.path.isdir(path):
+    st = _stat(path)
+    key = _stat_key(st)
+    if stats is not None:
+      stats.append(key)
+    if path_only(path) or (st and stat.S_ISDIR(st.st_mode)):
       hashes.append(sha1(path).hexdigest())
       continue
+    if stat_cache and path in stat_cache:
+      cached_hash, cached_key = stat_cache[path]
+      if key == cached_key:
+        Profiler.increment('stat_cache.hits')
+        hashes.append(cached_hash)
+        continue
+      Profiler.increment('stat_cache.misses')
     try:
       with open(path, 'rb') as f:
-        hashes.append(sha1(f.read()).hexdigest())
+        data = f.read()
+      hashes.append(sha1(data).hexdigest())
+      Profiler.increment('fs.files_hashed')
+      Profiler.increment('fs.bytes_hashed', len(data))
     except:
       hashes.append('0') # Probably a broken symlink.
   return hashes
 
-def read_index(index_file, force=False):
+def stat_key(path):
+  """:return: a (mtime, size, inode) tuple of strings used to detect modified files, like git's
+    index does. Missing files get a key which never matches.
+  """
+  return _stat_key(_stat(path))
+
+def _stat(path):
+  """:return: the os.stat() of the path, or None if it doesn't exist."""
+  try:
+    return os.stat(path)
+  except OSError:
+    return None
+
+def _stat_key(st):
+  if st is None:
+    return ('-', '-', '-')
+  return (repr(st.st_mtime), str(st.st_size), str(st.st_ino))
+
+def load_stat_cache(entries, trusted_before):
+  """Builds the stat_cache for compute_hashes() from entries read out of an index.
+
+  Files modified in the same timestamp tick that the index was written in could have been changed
+  again after they were hashed without altering their stat key, so (like git) only entries with an
+  mtime strictly before the index's own mtime are trusted.
+  :param entries: iterable of (path, hash, mtime, size, inode) tuples.
+  :param float trusted_before: the mtime of the index file the entries were read from.
+  :return: dict mapping paths to (hash, stat key) tuples.
+  """
+  stat_cache = {}
+  for path, sha, mtime, size, inode in entries:
+    if mtime == '-' or float(mtime) >= trusted_before:
+      continue
+    stat_cache[path] = (sha, (mtime, size, inode))
+  return stat_cache
+
+def read_index(index_file, force=False, num_fields=2):
   """Reads the index file and returns its contents as set of tuples. An index file is expected to be
   formatted such that each tuple is on its own line, with elements separated by tabs.
   :param boolean force: continue if index appears to be an incompatible version
+  :param int num_fields: the expected number of elements in each tuple.
   """
   with open(index_file, 'r') as f:
     lines = f.readlines()
   if lines and lines[0].startswith('#'):
     version = float(lines[0].split(' ')[-1])
     if version < _VERSION:
-      warn('Index file is outdated (version %.3f vs %.3f)' % (version, _VERSION))
+      logger.warning('Index file is outdated (version %.3f vs %.3f)' % (version, _VERSION))
       # If the index is outdated, we should force a complete regeneration.
       return set()
     elif version > _VERSION:
       # Nothing we can really do but warn the user and exit.
       err = OutdatedError(version)
       if force:
-        warn(str(err))
+        logger.warning(str(err))
       else:
         raise err
   results = set()
@@ -289,10 +324,10 @@ def read_index(index_file, force=False):
     line = line.strip()
     if line and not line.startswith('#'):
       result = line.split('\t')
-      if len(result) != 2:
+      if len(result) != num_fields:
         raise IndexFormatError(
-          "Expected 2 entries separated by tabs, got: {line} in {file}:{line_number}"
-          .format(line=line, file=index_file, line_number=line_number))
+          "Expected {num_fields} entries separated by tabs, got: {line} in {file}:{line_number}"
+          .format(num_fields=num_fields, line=line, file=index_file, line_number=line_number))
   return set(tuple(line.strip().split('\t')) for line in lines
                                              if line.strip() and not line.startswith('#'))
 
@@ -308,16 +343,134 @@ def write_index(index_file, pairs):
       f.write('\t'.join(pair) + '\n')
   os.rename(tmp_file, index_file)
 
-def find_and_hash_deps(root):
-  """Finds all files that matter to BUILD.gen's, hashes them, and returns both lists."""
+def find_and_hash_deps(root, stat_cache=None):
+  """Finds all files that matter to BUILD.gen's, hashes them, and returns the lists of files, hashes,
+  and stat keys.
+  :param stat_cache: Optional cache of previously computed hashes (see compute_hashes()).
+  """
   logger.debug('Indexing pom.xml/BUILD files...')
   # Order matters here, so list().
   deps = list(Task('finding deps', lambda: find_gen_deps(root))())
   logger.debug('Hashing pom.xml/BUILD files...')
+  stats = []
   keys = Task('hashing deps', lambda: compute_hashes(deps,
       lambda p: (os.path.basename(p) not in _GEN_NAMES
-                 and os.path.basename(p).startswith('BUILD'))))()
-  return deps, keys
+                 and os.path.basename(p).startswith('BUILD')),
+      stat_cache=stat_cache, stats=stats))()
+  return deps, keys, stats
+
+def compute_module_dependees(modules):
+  """Maps each pom to the modules whose generated BUILD files may change when it changes.
+
+  A module is a dependee of the poms in its parent chain, and of the module poms providing its
+  dependencies.
+  :param modules: list of module directories, relative to the current directory.
+  :return: dict of pom path to set of dependee module directories.
+  """
+  pom_provides_target = PomUtils.pom_provides_target()
+  dependees = {}
+  for module in modules:
+    pom = os.path.join(module, 'pom.xml')
+    df = CachedDependencyInfos.get(pom)
+    parent = df
+    while parent and parent.parent_path:
+      dependees.setdefault(parent.parent_path, set()).add(module)
+      parent = parent.parent
+    for dep in df.dependencies:
+      target = '{groupId}.{artifactId}'.format(groupId=dep.get('groupId'),
+                                               artifactId=dep.get('artifactId'))
+      for provider in pom_provides_target.find_target(target):
+        dependees.setdefault(os.path.normpath(provider), set()).add(module)
+  return dependees
+
+def read_dependees_index(index_file, force=False):
+  """:returns: the dependees written by write_dependees_index(), or {} if there is no index file."""
+  dependees = {}
+  if os.path.exists(index_file):
+    for pom, module in read_index(index_file, force):
+      dependees.setdefault(pom, set()).add(module)
+  return dependees
+
+def write_dependees_index(index_file, dependees):
+  """Writes the output of compute_module_dependees() to the index file."""
+  write_index(index_file, set((pom, module) for pom, modules in dependees.items()
+                                           for module in modules))
+
+def find_enclosing_module(directory, module_set):
+  """:returns: the closest module at or above the directory, or None if it isn't in any module.
+  :param directory: a directory relative to the root of the repo.
+  :param module_set: set of module directories, relative to the root of the repo.
+  """
+  while directory and directory not in module_set:
+    directory = os.path.dirname(directory)
+  return directory or None
+
+def generated_files_of_modules(baseroot, modules, affected_modules, generated_paths):
+  """Picks out the generated files which belong to one of the affected modules.
+
+  Files in a module nested inside an affected module belong to the nested module.
+  :param baseroot: absolute path to the root of the repo.
+  :param modules: list of all module directories, relative to baseroot.
+  :param affected_modules: set of module directories, relative to baseroot.
+  :param generated_paths: absolute paths of generated BUILD files.
+  :return: list of the paths belonging to the affected modules.
+  """
+  module_set = set(modules)
+  return [path for path in generated_paths
+          if find_enclosing_module(os.path.dirname(os.path.relpath(path, baseroot)), module_set)
+          in affected_modules]
+
+def compute_affected_modules(baseroot, modules, changed_paths, dependees=None,
+                             previous_dependees=None):
+  """Computes which modules need their BUILD files regenerated.
+
+  :param baseroot: absolute path to the root of the repo.
+  :param modules: list of module directories, relative to baseroot.
+  :param changed_paths: absolute paths of added, removed, or changed files, as found by
+    find_gen_deps().
+  :param dependees: the output of compute_module_dependees(modules), computed if it is None.
+  :param previous_dependees: the dependees as of the BUILD files being updated, as read by
+    read_dependees_index(). Modules only depending on a pom by an artifactId it no longer provides
+    are only found in there.
+  :return: set of affected module directories, or None if everything should be regenerated.
+  """
+  module_set = set(modules)
+  seeds = set()
+  for path in changed_paths:
+    if not path.startswith(os.path.join(baseroot, '')):
+      return None # Probably a change to squarepants itself.
+    relpath = os.path.relpath(path, baseroot)
+    if relpath == _THIRD_PARTY_POM:
+      # Its dependencyManagement decides which dependencies of any module are 3rdparty targets.
+      return None
+    if os.path.basename(relpath) == 'pom.xml':
+      if not os.path.exists(path):
+        return None # Removed poms may leave dangling references anywhere.
+      seeds.add(relpath)
+      continue
+    # Source directories and hand-written BUILD files belong to the closest enclosing module.
+    directory = find_enclosing_module(os.path.dirname(relpath), module_set)
+    if not directory:
+      return None
+    seeds.add(os.path.join(directory, 'pom.xml'))
+
+  if dependees is None:
+    dependees = compute_module_dependees(modules)
+  if previous_dependees:
+    dependees = dict((pom, dependees.get(pom, set()) | previous_dependees.get(pom, set()))
+                     for pom in set(dependees) | set(previous_dependees))
+  affected = set()
+  queue = list(seeds)
+  while queue:
+    pom = queue.pop()
+    module = os.path.dirname(pom)
+    if module in module_set and module not in affected:
+      affected.add(module)
+    for dependee in dependees.get(pom, ()):
+      if dependee not in affected:
+        affected.add(dependee)
+        queue.append(os.path.join(dependee, 'pom.xml'))
+  return affected
 
 def compute_dep_differences(old_pairs, new_pairs):
   """:param old_pairs: list of (dep, sha) tuples retrieved from the index
@@ -370,8 +523,8 @@ class CheckPoms(object):
     # unpickle previous state to start with, pickle new state to end with. Remove need for ad-hoc
     # I/O in-between.
     self._check_pex_health()
-    self._find_dependencies()
     self._execute_clean_flags()
+    self._find_dependencies()
     self._find_dependency_differences()
     self._regenerate_if_necessary_and_reindex()
 
@@ -402,9 +555,11 @@ class CheckPoms(object):
 
   def _find_dependencies(self):
     logger.info('Checking to see if generated BUILD.* files are outdated in %s ...' % self.baseroot)
+    logger.debug('Loading index file...')
+    self.old_pairs = self._load_previous_depset()
     # TODO: Not use absolute paths? What should they be relative to? User? Workdir?
-    self.dep_files, self.dep_hashes = Task('find_and_hash_deps',
-                                           lambda: find_and_hash_deps(self.baseroot))()
+    self.dep_files, self.dep_hashes, self.dep_stats = Task('find_and_hash_deps',
+      lambda: find_and_hash_deps(self.baseroot, stat_cache=self.stat_cache))()
     self.new_pairs = set(zip(self.dep_files, self.dep_hashes))
 
   def _execute_clean_flags(self):
@@ -418,8 +573,6 @@ class CheckPoms(object):
       self._clean_index_dir()
 
   def _find_dependency_differences(self):
-    logger.debug('Loading index file...')
-    self.old_pairs = self._load_previous_depset()
     self.removed_deps, self.added_deps, self.changed_deps = compute_dep_differences(
         self.old_pairs, self.new_pairs)
 
@@ -435,8 +588,11 @@ class CheckPoms(object):
         logger.debug(s)
 
   def _load_previous_depset(self):
+    """Reads the (dep, sha) pairs from the index, and initializes self.stat_cache from it."""
     index_dir, index_file = self.index_dir, self.index_file
     old_pairs = set()
+    self.old_entries = set()
+    self.stat_cache = {}
     if not os.path.exists(index_file):
       logger.debug('No index file exists at "%s"' % index_file)
       if not os.path.exists(index_dir):
@@ -444,7 +600,10 @@ class CheckPoms(object):
     else:
       # Need to read in previous index file.
       logger.debug('Reading index file "%s"' % index_file)
-      old_pairs = read_index(index_file, '-f' in self.flags or '--force' in self.flags)
+      entries = read_index(index_file, '-f' in self.flags or '--force' in self.flags, num_fields=5)
+      self.old_entries = entries
+      old_pairs = set((dep, sha) for dep, sha, _, _, _ in entries)
+      self.stat_cache = load_stat_cache(entries, os.path.getmtime(index_file))
       logger.debug('Read %d hashed deps.' % len(old_pairs))
     return old_pairs
 
@@ -452,8 +611,17 @@ class CheckPoms(object):
     if Task('poms_to_builds', self._regenerate_maybe)():
       if os.path.exists(self.index_file):
         os.remove(self.index_file)
-      p, h = Task('find_and_hash_deps', lambda: find_and_hash_deps(self.baseroot))()
-      Task('write_index', lambda: write_index(self.index_file, set(zip(p, h))))()
+      p, h, s = Task('find_and_hash_deps',
+                     lambda: find_and_hash_deps(self.baseroot, stat_cache=self.stat_cache))()
+      entries = set((dep, sha) + key for dep, sha, key in zip(p, h, s))
+      Task('write_index', lambda: write_index(self.index_file, entries))()
+    else:
+      entries = set((dep, sha) + key
+                    for dep, sha, key in zip(self.dep_files, self.dep_hashes, self.dep_stats))
+      if entries != self.old_entries:
+        # The contents are the same, but some stat keys changed (eg, after a git checkout). Store
+        # the new keys so the next run doesn't hash these files again.
+        Task('write_index', lambda: write_index(self.index_file, entries))()
 
   def _clean_generated_builds(self):
     """Removes all generated BUILD files from the source diretory"""
@@ -477,42 +645,70 @@ class CheckPoms(object):
     added_deps = self.added_deps
     changed_deps = self.changed_deps
 
-    force_rebuild = not _BUILD_GEN_CACHING_ENABLED or '--rebuild' in self.flags
+    rebuild_all = not _BUILD_GEN_CACHING_ENABLED or '--rebuild' in self.flags
 
-    if not force_rebuild and  self.total_diffs == 0:
+    if not rebuild_all and  self.total_diffs == 0:
       return False # Nothing to do.
 
     self._clean_generated_builds()
+    self._enable_parse_cache()
 
-    if not force_rebuild:
-      for dep in iter_multi(removed_deps, added_deps, changed_deps):
-        filename = os.path.basename(dep)
-        if fnmatch.fnmatch(filename, 'BUILD*'):
-          continue
-        logger.debug('Matched non-BUILD file %s, forcing rebuild' % (dep))
-        force_rebuild = True
-        break
+    # Inputs to the generated BUILD files which changed since they were cached.
+    generation_inputs = set()
+    for dep in iter_multi(removed_deps, added_deps, changed_deps):
+      filename = os.path.basename(dep)
+      if fnmatch.fnmatch(filename, 'BUILD*'):
+        continue
+      logger.debug('Matched non-BUILD file %s, forcing regeneration' % (dep))
+      generation_inputs.add(dep)
 
-    if not force_rebuild:
-      # GEN's need to be re-gen'd if a BUILD file was removed.
-      # AUX's need to be re-gen'd if a BUILD file was added.
-      for dep in iter_multi(removed_deps, added_deps):
-        name = os.path.basename(dep)
-        if name.startswith('BUILD') and name not in _GEN_NAMES:
-          force_rebuild = True
-          break
+    # GEN's need to be re-gen'd if a BUILD file was removed.
+    # AUX's need to be re-gen'd if a BUILD file was added.
+    for dep in iter_multi(removed_deps, added_deps):
+      name = os.path.basename(dep)
+      if name.startswith('BUILD') and name not in _GEN_NAMES:
+        generation_inputs.add(dep)
 
     builds_index = os.path.join(cache_dir, 'build_gen.index')
     gens_dir = os.path.join(cache_dir, 'gens')
-
-    if not force_rebuild and os.path.exists(builds_index):
-      logger.info('Generated BUILD.* files are outdated, loading correct versions from cache.')
-      self._restore_cache(gens_dir, builds_index)
-    else:
-      logger.info('Generated BUILD.* files are outdated, Regenerating.')
-      self._rebuild_everything(gens_dir, builds_index)
+    dependees_index = os.path.join(cache_dir, _DEPENDEES_INDEX)
+    force = '-f' in self.flags or '--force' in self.flags
+
+    if not rebuild_all and os.path.exists(builds_index):
+      affected_modules = set()
+      if generation_inputs:
+        modules = PomUtils.get_modules()
+        dependees = Task('compute_module_dependees',
+                         lambda: compute_module_dependees(modules))()
+        affected_modules = Task('find_affected_modules', lambda: compute_affected_modules(
+          self.baseroot, modules, generation_inputs, dependees=dependees,
+          previous_dependees=read_dependees_index(dependees_index, force)))()
+      if affected_modules is not None:
+        logger.info('Generated BUILD.* files are outdated, loading correct versions from cache.')
+        self._restore_cache(gens_dir, builds_index)
+        if generation_inputs:
+          logger.info('Generated BUILD.* files are outdated, Regenerating {count} affected modules.'
+                      .format(count=len(affected_modules)))
+          self._rebuild_modules(affected_modules, gens_dir, builds_index)
+          write_dependees_index(dependees_index, dependees)
+        self._prune_parse_cache()
+        return True
+
+    logger.info('Generated BUILD.* files are outdated, Regenerating.')
+    self._rebuild_everything(gens_dir, builds_index)
+    write_dependees_index(dependees_index, compute_module_dependees(PomUtils.get_modules()))
+    self._prune_parse_cache()
     return True
 
+  def _enable_parse_cache(self):
+    self._parse_cache = PomParseCache(os.path.join(self.index_base, _PARSE_CACHE_DIRECTORY))
+    PomHandlerManager.persistent_cache = self._parse_cache
+
+  def _prune_parse_cache(self):
+    logger.debug('Pom parse cache: {hits} hits, {misses} misses.'
+                 .format(hits=self._parse_cache.hits, misses=self._parse_cache.misses))
+    Task('prune_parse_cache', self._parse_cache.prune)()
+
   def _restore_cache(self, gens_dir, builds_index):
     for dep in self.added_deps:
       if os.path.basename(dep) in _GEN_NAMES:
@@ -526,7 +722,7 @@ class CheckPoms(object):
     for source, target in read_index(builds_index, '-f' in self.flags or '--force' in self.flags):
       target_dir = os.path.dirname(target)
       if not os.path.exists(target_dir):
-        warn('Missing directory for target %s' % target_dir)
+        logger.warning('Missing directory for target %s' % target_dir)
         continue # What? Okay, skip it, I guess.
       if not '3rdparty' in target_dir:
         if any(f.startswith('BUILD') and f != 'BUILD.gen' for f in os.listdir(target_dir)):
@@ -543,21 +739,49 @@ class CheckPoms(object):
           # Generally isn't any output, and we don't care if there is.
           # Just here to make the stream is drained and the subprocess is closed.
           pass
+        Profiler.increment('fs.files_copied')
 
-  def _rebuild_everything(self, gens_dir, builds_index):
-    # The cached BUILD files are now invalid. Remove them first
-    rmtree(gens_dir, ignore_errors=True)
+  def _regenerate_3rdparty(self):
+    logger.info('Re-generating 3rdparty/BUILD.gen')
+    contents = ThirdPartyBuildGenerator().generate()
+    with open('3rdparty/BUILD.gen', 'w') as build_file:
+      build_file.write(contents)
+    Profiler.increment('fs.files_written')
+    Profiler.increment('fs.bytes_written', len(contents))
+
+  def _rebuild_modules(self, modules, gens_dir, builds_index):
+    """Regenerates the BUILD files of just the given modules, on top of the restored cache."""
+    # Remove everything restored for these modules first, in case the new conversion no longer
+    # writes it (eg, switching between BUILD.gen and BUILD.aux, or a source directory went away).
+    force = '-f' in self.flags or '--force' in self.flags
+    restored = [target for source, target in read_index(builds_index, force)]
+    for gen in generated_files_of_modules(self.baseroot, PomUtils.get_modules(), modules, restored):
+      if os.path.exists(gen):
+        logger.debug('Removing %s' % gen)
+        os.remove(gen)
+    for module in sorted(modules):
+      logger.debug('Regenerating {module}'.format(module=module))
+      pom_file_name = os.path.join(module, 'pom.xml')
+      with Profiler.module(pom_file_name):
+        PomToBuild().convert_pom(pom_file_name, rootdir=self.baseroot)
+
+    self._cache_generated_builds(gens_dir, builds_index)
 
+  def _rebuild_everything(self, gens_dir, builds_index):
     poms = [x + '/pom.xml' for x in PomUtils.get_modules()]
     # Convert pom files to BUILD files
     for pom_file_name in poms:
-      PomToBuild().convert_pom(pom_file_name, rootdir=self.baseroot)
+      with Profiler.module(pom_file_name):
+        PomToBuild().convert_pom(pom_file_name, rootdir=self.baseroot)
 
-    logger.info('Re-generating 3rdparty/BUILD.gen')
-    with open('3rdparty/BUILD.gen', 'w') as build_file:
-      build_file.write(ThirdPartyBuildGenerator().generate())
+    self._regenerate_3rdparty()
+    self._cache_generated_builds(gens_dir, builds_index)
+
+  def _cache_generated_builds(self, gens_dir, builds_index):
+    # The cached BUILD files are now invalid. Remove them first
+    rmtree(gens_dir, ignore_errors=True)
 
-    new_gens = find_files([self.baseroot], _GEN_NAMES)
+    new_gens = find_files([self.baseroot], _GEN_NAMES, exclude_contains=_GEN_EXCLUDE_CONTAINS)
     logger.info('Caching {num_build_files} regenerated BUILD.* files. '
                 .format(num_build_files=len(new_gens)))
     os.makedirs(gens_dir)
@@ -572,6 +796,7 @@ class CheckPoms(object):
       cache_name += str(index)
       cache_path = os.path.join(gens_dir, cache_name)
       copyfile(gen, cache_path)
+      Profiler.increment('fs.files_copied')
       gen_pairs.add((cache_path, gen))
     write_index(builds_index, gen_pairs)
 
@@ -582,6 +807,8 @@ def usage():
   print "-?,-h         Show this message"
   print "--rebuild     unconditionally rebuild the BUILD files from pom.xml"
   print "-f, --force   force the use of a seemingly incompatible index version"
+  print "--profile-json=<file>"
+  print "              write phase timings, per-module times and counters to <file>"
   PomUtils.common_usage()
 
 def main():
@@ -598,6 +825,7 @@ def main():
 
   path = os.path.realpath(paths[0])
 
+  profile_json = None
   for f in flags:
     if f == '-h' or f == '-?':
       usage()
@@ -606,13 +834,19 @@ def main():
       pass
     elif f == '-f' or f == '--force':
       pass
+    elif f.startswith('--profile-json='):
+      profile_json = f[len('--profile-json='):]
     else:
       print ("Unknown flag %s" % f)
       usage()
       return
+  if profile_json:
+    Profiler.enable()
   main_run = Task('main', lambda: CheckPoms(path, flags).execute())
   main_run()
   logger.info('Finish checking BUILD.* health in %0.3f seconds.' % main_run.duration)
+  if profile_json:
+    Profiler.write_json(profile_json)
 
 
 if __name__ == '__main__':
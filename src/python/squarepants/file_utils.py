@@ -1,7 +1,19 @@
+import fnmatch
 import os
+import re
 import shutil
 from contextlib import contextmanager
-from tempfile import mkdtemp, mktemp
+from tempfile import mkdtemp, mkstemp, mktemp
+
+try:
+  from os import scandir
+except ImportError:
+  try:
+    from scandir import scandir
+  except ImportError:
+    scandir = None
+
+from profiling import Profiler
 
 
 @contextmanager
@@ -62,3 +74,102 @@ def touch(fname, times=None, makedirs=False):
       os.makedirs(directory)
   with open(fname, 'a'):
     os.utime(fname, times)
+
+
+def _list_dir(path):
+  """:return: list of (name, is_dir) tuples for the entries of the directory, not following
+    symlinks.
+  """
+  Profiler.increment('fs.listdir')
+  if scandir:
+    return [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in scandir(path)]
+  entries = []
+  for name in os.listdir(path):
+    entry_path = os.path.join(path, name)
+    entries.append((name, os.path.isdir(entry_path) and not os.path.islink(entry_path)))
+  return entries
+
+
+def _compile_patterns(patterns):
+  if not patterns:
+    return None
+  return re.compile('|'.join('(?:{})'.format(fnmatch.translate(p)) for p in patterns))
+
+
+def find_files(roots, patterns, exclude_contains=()):
+  """Recursively finds files in the given list of root directories which match any of the naming
+  patterns
+  :param roots: root paths to search under
+  :param patterns: filename patterns to search for. Like find's -name, patterns are matched against
+    the basename, unless they contain a '/', in which case they are matched against the whole path
+    like find's -path.
+  :param exclude_contains: paths containing any of these strings are excluded. Directories whose
+    contents would all be excluded are not descended into.
+  :return: list of files files that match the pattern
+  """
+  name_regex = _compile_patterns([p for p in patterns if '/' not in p])
+  path_regex = _compile_patterns([p for p in patterns if '/' in p])
+
+  def matches(path, name):
+    return ((name_regex and name_regex.match(name)) or (path_regex and path_regex.match(path))) \
+      and not any(n in path for n in exclude_contains)
+
+  results = set()
+  for root in roots:
+    if not os.path.exists(root):
+      continue
+    if matches(root, os.path.basename(root)):
+      results.add(root)
+    directories = [root]
+    while directories:
+      directory = directories.pop()
+      try:
+        entries = _list_dir(directory)
+      except OSError:
+        continue # Permission denied, or removed while we were walking.
+      for name, is_dir in entries:
+        path = os.path.join(directory, name)
+        if matches(path, name):
+          results.add(path)
+        if is_dir and not any(n in os.path.join(path, '') for n in exclude_contains):
+          directories.append(path)
+  return results
+
+
+def _umask():
+  mask = os.umask(0)
+  os.umask(mask)
+  return mask
+
+
+def write_file_if_changed(path, contents):
+  """Replaces the contents of the file, unless it already has exactly these contents.
+
+  Unchanged files keep their mtime, so tools watching them (pants' BUILD file caches, IDEs) don't
+  see a change. Changed files are written to a temporary file which is then renamed over the
+  original, so readers never see a partially written file.
+
+  :param string path: the file to write.
+  :param string contents: the new contents.
+  :returns: True if the file was written, False if it already had these contents.
+  :rtype: bool
+  """
+  try:
+    if os.path.getsize(path) == len(contents):
+      with open(path, 'r') as f:
+        if f.read() == contents:
+          return False
+  except (IOError, OSError):
+    pass # Missing or unreadable, so write it.
+  directory, name = os.path.split(path)
+  fd, temp_path = mkstemp(dir=directory or '.', prefix='.{}.tmp-'.format(name))
+  try:
+    with os.fdopen(fd, 'w') as f:
+      f.write(contents)
+    # mkstemp creates files which only the owner can read.
+    os.chmod(temp_path, 0o666 & ~_umask())
+    os.rename(temp_path, path)
+  except:
+    os.remove(temp_path)
+    raise
+  return True
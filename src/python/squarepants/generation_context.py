@@ -4,6 +4,9 @@ import json
 import os
 import sys
 
+from file_utils import write_file_if_changed
+from profiling import Profiler
+
 
 class GenerationContext(object):
 
@@ -56,6 +59,7 @@ class GenerationContext(object):
     self.settings_to_platforms = {}
     self.pom_file_cache = {}
     self.os_to_java_homes = {}
+    self.written_files = set()
 
   def get_pants_ini_gen(self):
     return [
@@ -119,6 +123,23 @@ class GenerationContext(object):
     self.settings_to_platforms[data] = name
     return name
 
+  @property
+  def generated_file_names(self):
+    """The names of the files this context generates."""
+    return (self.build_file_name, self.aux_build_file_name, self.jooq_config_file)
+
+  def has_source_files(self, directory):
+    """Returns whether directory exists and contains anything other than generated files.
+
+    Files generated by the previous run are only removed after all poms are converted, so they must
+    not make an otherwise empty directory look populated.
+    """
+    if not os.path.isdir(directory):
+      return False
+    Profiler.increment('fs.listdir')
+    generated_file_names = set(self.generated_file_names)
+    return any(name not in generated_file_names for name in os.listdir(directory))
+
   def format_spec(self, path=None, name=None):
     return "'{}:{}'".format(path or '', name or '')
 
@@ -145,5 +166,70 @@ class GenerationContext(object):
         filepath=outfile_name,
         gen_script=os.path.basename(sys.argv[0]))
       contents = header + contents
-    with open(outfile_name, 'w') as outfile:
-      outfile.write(contents)
+    self.write_generated_file(outfile_name, contents)
+
+  def write_generated_file(self, path, contents):
+    """Writes out a generated file, leaving it untouched if it already has these contents.
+
+    The path is recorded in written_files, so callers can tell which previously generated files
+    are now stale.
+    """
+    self.written_files.add(os.path.abspath(path))
+    if write_file_if_changed(path, contents):
+      Profiler.increment('fs.files_written')
+      Profiler.increment('fs.bytes_written', len(contents))
+    else:
+      Profiler.increment('fs.files_unchanged')
+
+  def merge_deferred(self, deferred_platforms, deferred_build_files, written_files=()):
+    """Registers the jvm platforms recorded by a DeferredGenerationContext and writes out its BUILD
+    files.
+
+    Merging deferred results in the same order that their poms would have been converted serially
+    yields the same platform names as a serial conversion.
+
+    :param list deferred_platforms: DeferredGenerationContext.deferred_platforms
+    :param list deferred_build_files: DeferredGenerationContext.deferred_build_files
+    :param written_files: DeferredGenerationContext.written_files, for the other generated files
+      (eg jooq configs) which it wrote directly.
+    """
+    self.written_files.update(written_files)
+    placeholders = {}
+    for index, (source_level, target_level, compile_args) in enumerate(deferred_platforms):
+      name = self.jvm_platform(target_level, source_level, list(compile_args))
+      placeholders[DeferredGenerationContext.platform_placeholder(index)] = name
+    for path, contents in deferred_build_files:
+      for placeholder, name in placeholders.items():
+        contents = contents.replace(placeholder, name)
+      self.write_build_file(path, contents)
+
+
+class DeferredGenerationContext(GenerationContext):
+  """A GenerationContext which records jvm platforms and BUILD files instead of resolving them.
+
+  Platform names depend on the order in which platforms are first seen, so contexts used to convert
+  poms in parallel hand out placeholder names; GenerationContext.merge_deferred() replaces them
+  with the final names.
+  """
+
+  def __init__(self, **kwargs):
+    super(DeferredGenerationContext, self).__init__(**kwargs)
+    self.deferred_platforms = []
+    self.deferred_build_files = []
+
+  @classmethod
+  def platform_placeholder(cls, index):
+    return '__deferred_jvm_platform_{}__'.format(index)
+
+  def jvm_platform(self, target_level, source_level, compile_args):
+    if target_level is None and source_level is None:
+      return None
+    source_level = source_level or target_level
+    target_level = target_level or source_level
+    data = (source_level, target_level, tuple(compile_args or ()))
+    if data not in self.deferred_platforms:
+      self.deferred_platforms.append(data)
+    return self.platform_placeholder(self.deferred_platforms.index(data))
+
+  def write_build_file(self, path, contents):
+    self.deferred_build_files.append((path, contents))
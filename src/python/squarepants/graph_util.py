@@ -3,7 +3,7 @@
 
 import heapq
 import functools
-from collections import defaultdict
+from collections import Sequence, defaultdict, deque
 
 
 class Graph(object):
@@ -17,6 +17,7 @@ class Graph(object):
       self._src = src
       self._dst = dst
       self._weight = weight
+      self._key = None
 
     @property
     def src(self):
@@ -38,7 +39,10 @@ class Graph(object):
       return Graph.Edge(self.dst, self.src, self._weight)
 
     def __str__(self):
-      return '{} -> {}'.format(self.src, self.dst)
+      # Edges are immutable, and hashed and compared often, so the string is only built once.
+      if self._key is None:
+        self._key = '{} -> {}'.format(self.src, self.dst)
+      return self._key
 
     def __hash__(self):
       return hash(str(self))
@@ -65,7 +69,7 @@ class Graph(object):
   @property
   def edges(self):
     """All directed edges in this graph."""
-    return reduce(set.union, self._incomingEdges.values(), set())
+    return set(edge for edges in self._incomingEdges.values() for edge in edges)
 
   def incoming(self, vertex):
     """Returns the set of edges which lead to this vertex."""
@@ -101,53 +105,85 @@ class Graph(object):
 
   def remove_vertex(self, vertex):
     """Removes the vertex from the graph."""
-    for edge in self.edges:
-      if edge.is_adjacent(vertex):
-        self.remove_edge(edge)
+    for edge in self._outgoingEdges.pop(vertex, ()):
+      self._incomingEdges[edge.dst].discard(edge)
+    for edge in self._incomingEdges.pop(vertex, ()):
+      self._outgoingEdges[edge.src].discard(edge)
     self.vertices.discard(vertex)
 
   def search(self, start, adjacent=None, next_index=None, multistart=False, cycle_handler=None):
     """Performs a graph search, yielding (path, vertex) pairs.
 
-    If visit is set, simply searches the whole graph without yielding, passing all (path, vertex)
-    pairs to visit(), terminating early if visit ever returns True.
-
     :param start: the starting (source) vertex.
     :param adjacent: the adjacency(vertex) function, defaulting to graph.outgoing.
-    :param next_index: choose which index of the frontier to expand next.
-      (lambda _: 0) will be a BFS (default).
+    :param next_index: choose which index of the frontier to expand next. The frontier is a sequence
+      of the pending paths, each a tuple of vertices ending in the vertex to expand.
+      None or (lambda _: 0) will be a BFS (default).
       (lambda _:-1) will be a DFS.
       (lambda _: min(range(len(_)), key=_.__getitem__) will be a uniform cost search.
     :param multistart: if True, treats 'start' as a list of sources, rather than a single source.
     :param cycle_handler: function(path, vertex) to call if a cycle is detected.
     """
+    for entry in self._search(start, adjacent, next_index, multistart, cycle_handler):
+      yield self._path_to(entry), entry[0]
+
+  def search_set(self, *vargs, **kwargs):
+    """Returns the set of vertices hit by the given graph.search() parameters."""
+    return set(entry[0] for entry in self._search(*vargs, **kwargs))
+
+  @staticmethod
+  def _path_to(entry):
+    """Returns the path of vertices leading up to (but not including) the vertex of the entry."""
+    path = []
+    entry = entry[1]
+    while entry is not None:
+      path.append(entry[0])
+      entry = entry[1]
+    path.reverse()
+    return tuple(path)
+
+  def _search(self, start, adjacent=None, next_index=None, multistart=False, cycle_handler=None):
+    """Does the work for search(), yielding (vertex, parent entry) frontier entries.
+
+    Paths are only materialized when asked for, by following the parent entries back to the start.
+    """
     # Default to forward-directed search.
     adjacent = adjacent or self.outgoing_vertices
-    # Default to queue-like behavior, resulting in BFS.
-    next_index = next_index or (lambda ls: 0)
-    # Default to no-op.
-    cycle_handler = cycle_handler or (lambda p,v: None)
 
-    frontier = [(start,)] if not multistart else [(src,) for src in start]
+    frontier = deque((src, None) for src in (start if multistart else [start]))
+    if next_index is None:
+      # Queue-like behavior, resulting in BFS.
+      pop_next = frontier.popleft
+    else:
+      frontier_paths = _FrontierPaths(frontier)
+
+      def pop_next():
+        index = next_index(frontier_paths)
+        if index == 0:
+          return frontier.popleft()
+        if index == -1 or index == len(frontier) - 1:
+          return frontier.pop()
+        entry = frontier[index]
+        del frontier[index]
+        return entry
+
     visited = set()
     while frontier:
-      next = frontier.pop(next_index(frontier))
-      path, vertex = next[:-1], next[-1]
+      entry = pop_next()
+      vertex = entry[0]
       if vertex in visited:
         continue
       visited.add(vertex)
 
-      yield path, vertex
+      yield entry
 
       for neighbor in adjacent(vertex):
         if neighbor not in visited:
-          frontier.append(path + (vertex,neighbor,))
-        elif neighbor in (path + (vertex,)):
-          cycle_handler(path + (vertex,), neighbor)
-
-  def search_set(self, *vargs, **kwargs):
-    """Returns the set of vertices hit by the given graph.search() parameters."""
-    return set(vertex for path, vertex in self.search(*vargs, **kwargs))
+          frontier.append((neighbor, entry))
+        elif cycle_handler:
+          path = self._path_to(entry) + (vertex,)
+          if neighbor in path:
+            cycle_handler(path, neighbor)
 
   def topological_ordering(self, stable=False):
     """Returns a topologically-ordered list of this graph's vertices.
@@ -171,18 +207,25 @@ class Graph(object):
       pop_vertex = functools.partial(heapq.heappop, leaves)
     else:
       push_vertex, pop_vertex = leaves.add, leaves.pop
-    removed_edges = set()
+    # Number of incoming edges of each vertex which haven't been removed yet, filled in lazily.
+    remaining_incoming = {}
+    removed_edge_count = 0
     while leaves:
       leaf = pop_vertex()
       ordering.append(leaf)
-      for edge in self.outgoing(leaf):
-        if edge in removed_edges:
-          continue
-        removed_edges.add(edge)
-        if self.incoming(edge.dst) <= removed_edges:
-          push_vertex(edge.dst)
-    remaining_edges = self.edges - removed_edges
-    if remaining_edges:
+      for edge in self._outgoingEdges.get(leaf, ()):
+        removed_edge_count += 1
+        dst = edge.dst
+        count = remaining_incoming.get(dst)
+        if count is None:
+          count = len(self._incomingEdges[dst])
+        remaining_incoming[dst] = count - 1
+        if count == 1:
+          push_vertex(dst)
+    if removed_edge_count < sum(len(edges) for edges in self._outgoingEdges.values()):
+      # Edges are only removed along with their source vertex.
+      ordered = set(ordering)
+      remaining_edges = {edge for edge in self.edges if edge.src not in ordered}
       raise self.CycleError('Cycle detected involving edges:{}'.format(''.join(
         '\n  {} -> {}'.format(edge.src, edge.dst) for edge in sorted(remaining_edges),
       )))
@@ -205,3 +248,247 @@ class Graph(object):
       vertex_text='\n'.join('  {}'.format(vertex) for vertex in vertex_strings),
       edges_text='\n'.join('  {}'.format(edge) for edge in edge_strings)
     )
+
+
+class _FrontierPaths(Sequence):
+  """Read-only view of a Graph.search() frontier as the paths to its vertices.
+
+  The frontier itself only holds (vertex, parent entry) pairs, so a path is built only for the
+  indexes next_index actually looks at.
+  """
+
+  def __init__(self, frontier):
+    self._frontier = frontier
+
+  def __len__(self):
+    return len(self._frontier)
+
+  def __getitem__(self, index):
+    entry = self._frontier[index]
+    return Graph._path_to(entry) + (entry[0],)
+
+class CompactGraph(object):
+  """Directed graph over vertices interned to dense integer ids.
+
+  Vertices can be any hashable values, but are stored once and referred to by their integer id
+  everywhere else, which makes this much smaller than Graph for large graphs. Reachability queries
+  are answered in O(1) from a transitive closure which stores the vertices reachable from each
+  vertex as the bits of a python int. Cycles are allowed: the closure is computed over the strongly
+  connected components of the graph, in reverse topological order.
+
+  A python int is dense up to its highest set bit, so the closure takes up to V^2/8 bytes for V
+  vertices, no matter how few vertices each one reaches.
+  """
+
+  def __init__(self, vertices=None, edges=None):
+    """
+    :param vertices: iterable of vertices to add.
+    :param edges: iterable of (src, dst) vertex pairs to add.
+    """
+    self._ids = {}
+    self._vertices = []
+    self._successors = []
+    self._closure = None
+    self._components = None
+    for vertex in vertices or ():
+      self.add_vertex(vertex)
+    for src, dst in edges or ():
+      self.add_edge(src, dst)
+
+  @classmethod
+  def from_graph(cls, graph):
+    """Returns a CompactGraph with the same vertices and edges as the Graph."""
+    return cls(graph.vertices, ((edge.src, edge.dst) for edge in graph.edges))
+
+  @property
+  def vertices(self):
+    """All vertices in this graph, in the order they were added."""
+    return list(self._vertices)
+
+  @property
+  def edges(self):
+    """Yields all directed edges in this graph as (src, dst) pairs."""
+    for src_id, successors in enumerate(self._successors):
+      src = self._vertices[src_id]
+      for dst_id in successors:
+        yield src, self._vertices[dst_id]
+
+  def __len__(self):
+    return len(self._vertices)
+
+  def __contains__(self, vertex):
+    return vertex in self._ids
+
+  def add_vertex(self, vertex):
+    """Adds the vertex to the graph if necessary, and returns its id."""
+    vertex_id = self._ids.get(vertex)
+    if vertex_id is None:
+      vertex_id = len(self._vertices)
+      self._ids[vertex] = vertex_id
+      self._vertices.append(vertex)
+      self._successors.append(set())
+      self._closure = None
+    return vertex_id
+
+  def add_edge(self, src, dst):
+    """Adds the directed edge src -> dst, adding the vertices as well if necessary."""
+    src_id = self.add_vertex(src)
+    dst_id = self.add_vertex(dst)
+    if dst_id not in self._successors[src_id]:
+      self._successors[src_id].add(dst_id)
+      self._closure = None
+
+  def vertex_id(self, vertex):
+    return self._ids[vertex]
+
+  def vertex(self, vertex_id):
+    return self._vertices[vertex_id]
+
+  def outgoing_vertices(self, vertex):
+    """Returns the set of destination vertices of the edges departing from this vertex."""
+    return {self._vertices[dst_id] for dst_id in self._successors[self._ids[vertex]]}
+
+  def _strongly_connected_components(self):
+    """Returns the list of component indexes of each vertex id, and the list of components, each a
+    list of vertex ids.
+
+    Uses an iterative version of Tarjan's algorithm, which finds the components in reverse
+    topological order: every component comes after all the components it has edges to.
+    """
+    count = len(self._vertices)
+    index = [None] * count
+    lowlink = [0] * count
+    on_stack = [False] * count
+    component_of = [None] * count
+    components = []
+    stack = []
+    next_index = 0
+    for root in range(count):
+      if index[root] is not None:
+        continue
+      work = [(root, iter(self._successors[root]))]
+      index[root] = lowlink[root] = next_index
+      next_index += 1
+      stack.append(root)
+      on_stack[root] = True
+      while work:
+        vertex_id, successors = work[-1]
+        for dst_id in successors:
+          if index[dst_id] is None:
+            index[dst_id] = lowlink[dst_id] = next_index
+            next_index += 1
+            stack.append(dst_id)
+            on_stack[dst_id] = True
+            work.append((dst_id, iter(self._successors[dst_id])))
+            break
+          elif on_stack[dst_id]:
+            lowlink[vertex_id] = min(lowlink[vertex_id], index[dst_id])
+        else:
+          work.pop()
+          if work:
+            parent_id = work[-1][0]
+            lowlink[parent_id] = min(lowlink[parent_id], lowlink[vertex_id])
+          if lowlink[vertex_id] == index[vertex_id]:
+            component = []
+            while True:
+              member = stack.pop()
+              on_stack[member] = False
+              component_of[member] = len(components)
+              component.append(member)
+              if member == vertex_id:
+                break
+            components.append(component)
+    return component_of, components
+
+  def strongly_connected_components(self):
+    """Returns the strongly connected components of the graph, each a list of vertices.
+
+    The components are in reverse topological order, so they can be processed bottom-up: every
+    component comes after all the components it has edges to.
+    """
+    _, components = self._strongly_connected_components()
+    return [[self._vertices[member] for member in component] for component in components]
+
+  def transitive_closure(self):
+    """Computes (or returns the cached) closure, as a list of the bitsets of the vertex ids
+    reachable from each vertex id by paths of one or more edges.
+    """
+    if self._closure is not None:
+      return self._closure
+    component_of, components = self._strongly_connected_components()
+    reachable = [0] * len(components)
+    for component_index, component in enumerate(components):
+      members = 0
+      for member in component:
+        members |= 1 << member
+      bits = 0
+      cyclic = len(component) > 1
+      for member in component:
+        for dst_id in self._successors[member]:
+          dst_component = component_of[dst_id]
+          if dst_component == component_index:
+            cyclic = True # Includes self loops.
+          else:
+            bits |= reachable[dst_component] | (1 << dst_id)
+      if cyclic:
+        bits |= members
+      reachable[component_index] = bits
+    self._components = component_of
+    self._closure = [reachable[component_of[vertex_id]] for vertex_id in range(len(self._vertices))]
+    return self._closure
+
+  def reaches(self, src, dst):
+    """Returns True if there is a path of one or more edges from src to dst."""
+    return bool((self.transitive_closure()[self._ids[src]] >> self._ids[dst]) & 1)
+
+  def _vertices_in(self, bits):
+    vertices = []
+    while bits:
+      lowest = bits & -bits
+      vertices.append(self._vertices[lowest.bit_length() - 1])
+      bits ^= lowest
+    return vertices
+
+  def reachable_vertices(self, vertex):
+    """Returns the set of vertices reachable from this vertex by paths of one or more edges."""
+    return set(self._vertices_in(self.transitive_closure()[self._ids[vertex]]))
+
+  def _implied_successor_ids(self, src_id):
+    closure = self.transitive_closure()
+    component_of = self._components
+    successors = self._successors[src_id]
+    # Successors in src's own component could only reach dst through src again, so they don't make
+    # the src -> dst edge redundant.
+    others = [dst_id for dst_id in successors if component_of[dst_id] != component_of[src_id]]
+    via_others = 0
+    for dst_id in others:
+      via_others |= closure[dst_id]
+    implied = set()
+    for dst_id in others:
+      if not (via_others >> dst_id) & 1:
+        continue
+      if not (closure[dst_id] >> dst_id) & 1:
+        # dst isn't on a cycle, so via_others only contains it if another successor reaches it.
+        implied.add(dst_id)
+      elif any((closure[other] >> dst_id) & 1 for other in others
+               if component_of[other] != component_of[dst_id]):
+        implied.add(dst_id)
+    return implied
+
+  def implied_successors(self, vertex):
+    """Returns the set of direct successors of this vertex which are also reachable through one of
+    its other successors, ie whose edges would be removed by a transitive reduction.
+    """
+    return {self._vertices[dst_id] for dst_id in self._implied_successor_ids(self._ids[vertex])}
+
+  def transitive_reduction(self):
+    """Returns a new CompactGraph without the edges which are implied by other paths.
+
+    Edges within a cycle are always kept. So are edges which are only implied by paths through the
+    source's own cycle, because those paths may themselves depend on the edge.
+    """
+    reduced = CompactGraph(self._vertices)
+    for src_id, successors in enumerate(self._successors):
+      implied = self._implied_successor_ids(src_id)
+      reduced._successors[src_id] = {dst_id for dst_id in successors if dst_id not in implied}
+    return reduced
@@ -5,6 +5,7 @@ from __future__ import (absolute_import, division, generators, nested_scopes, pr
                         unicode_literals, with_statement)
 
 import datetime
+import json
 import os
 import sys
 from collections import defaultdict
@@ -14,11 +15,13 @@ from subprocess import Popen, PIPE
 from shutil import rmtree
 
 from pants.task.task import Task
+from pants.base.build_environment import get_buildroot
 from pants.base.exceptions import TaskError
 from pants.base.workunit import WorkUnitLabel
-from pants.util.memo import memoized
+from pants.util.memo import memoized, memoized_property
 
-from squarepants.graph_util import Graph
+from squarepants.graph_util import CompactGraph
+from squarepants.pom_directory_index import PomDirectoryIndex
 
 
 class SquareDepmap(Task):
@@ -44,10 +47,14 @@ class SquareDepmap(Task):
              help='Assigns arbitrary colors to projects to aid readability.',)
     register('--reduce-transitive', action='store_true', default=True,
              help='Simplify the graph by removing edges already implied by transitive '
-                  'dependencies. Requires graphviz commandline tools. ',)
+                  'dependencies.',)
     register('--run-dot', action='store_true', default=True,
              help='Automatically runs dot on the generated graph to produce an svg. '
-                  'Requires graphviz commandline tools.',)
+                  'Requires graphviz commandline tools. Only applies to the gv output format.',)
+    register('--output-format', choices=['gv', 'jsonl', 'csv'], default='gv',
+             help='Format of the generated graph: graphviz dot (gv), newline-delimited json '
+                  'objects for each vertex and edge (jsonl), or an adjacency list where each row '
+                  'is a vertex followed by its dependencies (csv).',)
 
   def __init__(self, *vargs, **kwargs):
     super(SquareDepmap, self).__init__(*vargs, **kwargs)
@@ -98,7 +105,12 @@ class SquareDepmap(Task):
     except:
       return '{}???'.format('  '*depth)
 
-  @memoized(key_factory=lambda self, targets: frozenset(targets))
+  @memoized_property
+  def pom_index(self):
+    """Index of the pom.xml files in the buildroot, scanned the first time it is needed."""
+    return PomDirectoryIndex.scan(get_buildroot())
+
+  @memoized(key_factory=lambda self, targets: (self, frozenset(targets)))
   def _target_to_project_map(self, targets):
     targets_to_projects = {}
     for target in targets:
@@ -110,10 +122,7 @@ class SquareDepmap(Task):
         if 'src' in path_parts:
           project_dir = os.path.join(*path_parts[:path_parts.index('src')])
         else:
-          while not os.path.exists(os.path.join(project_dir, 'pom.xml')):
-            if os.path.abspath(project_dir) == os.path.abspath('.'):
-              break # We can't go any higher.
-            project_dir = os.path.dirname(project_dir)
+          project_dir = self.pom_index.closest_pom_dir(os.path.dirname(project_dir)) or ''
       targets_to_projects[target.id] = project_dir
     return targets_to_projects
 
@@ -126,12 +135,12 @@ class SquareDepmap(Task):
 
   def _create_target_graph(self, targets, predicate=None):
     predicate = predicate or (lambda x: True)
-    graph = Graph()
+    graph = CompactGraph()
     for target in self._collect_dependencies(targets, predicate):
       graph.add_vertex(target.id)
       for dep in self._target_dependencies(target):
         if predicate(dep):
-          graph.add_edge(Graph.Edge(target.id, dep.id))
+          graph.add_edge(target.id, dep.id)
     return graph
 
   def execute(self):
@@ -139,31 +148,31 @@ class SquareDepmap(Task):
     hasher = sha1()
     for target in sorted([t.id for t in targets]):
       hasher.update(target)
-    gv_path = os.path.join(self.workdir, hasher.hexdigest(), 'output.gv')
-    if os.path.exists(os.path.dirname(gv_path)):
-      rmtree(os.path.dirname(gv_path))
-    os.makedirs(os.path.dirname(gv_path))
-
-    with self._work_block('Generating .gv data'):
-      with open(gv_path, 'w') as f:
+    output_format = self.get_options().output_format
+    output_path = os.path.join(self.workdir, hasher.hexdigest(), 'output.{}'.format(output_format))
+    if os.path.exists(os.path.dirname(output_path)):
+      rmtree(os.path.dirname(output_path))
+    os.makedirs(os.path.dirname(output_path))
+
+    generate = {
+      'gv': self.generate_gv,
+      'jsonl': self.generate_jsonl,
+      'csv': self.generate_csv,
+    }[output_format]
+    with self._work_block('Generating .{} data'.format(output_format)):
+      with open(output_path, 'w') as f:
         try:
-          f.write('\n'.join(self.generate_gv(targets)))
+          # Streamed out line by line, huge graphs produce far too much text to join in memory.
+          for line in generate(targets):
+            f.write(line)
+            f.write('\n')
         except Exception as e:
-          raise TaskError('Error generating graphviz data: {}.'.format(e))
-
-      if self.get_options().reduce_transitive:
-        with self._work_block('Reducing transitive dependencies with tred.'):
-          tred = Popen(['tred', gv_path], stdout=PIPE, stderr=PIPE)
-          out, err = tred.communicate()
-          if err:
-            self._work_log('tred errors:')
-            self._work_log(err)
-          with open(gv_path, 'w') as f:
-            f.write(out)
+          raise TaskError('Error generating {} data: {}.'.format(output_format, e))
 
-      print(' {}'.format(gv_path))
+      print(' {}'.format(output_path))
 
-    if self.get_options().run_dot:
+    if output_format == 'gv' and self.get_options().run_dot:
+      gv_path = output_path
       with self._work_block('Generating output svg with dot.'):
         dot = Popen(['dot', '-Tsvg', '-O', gv_path], stdout=PIPE, stderr=PIPE)
         out, err = dot.communicate()
@@ -177,7 +186,13 @@ class SquareDepmap(Task):
       return ''
     return '[{}]'.format(','.join('{}={}'.format(key,val) for key,val in args.items()))
 
-  def generate_gv(self, targets):
+  def _build_depmap(self, targets):
+    """Builds the dependency graph shared by all the output formats.
+
+    :returns: the graph, the sorted groups of vertices in each project, and the map of vertices to
+      their projects.
+    :rtype: tuple
+    """
     all_targets = set()
     skipped_targets = set()
     def target_filter(target):
@@ -203,11 +218,11 @@ class SquareDepmap(Task):
           if '3rdparty' in target.id:
             target_to_project[target.id] = target.id
 
-        new_graph = Graph()
+        new_graph = CompactGraph()
         for vertex in graph.vertices:
           new_graph.add_vertex(target_to_project[vertex])
-        for edge in graph.edges:
-          new_graph.add_edge(Graph.Edge(target_to_project[edge.src], target_to_project[edge.dst]))
+        for src, dst in graph.edges:
+          new_graph.add_edge(target_to_project[src], target_to_project[dst])
 
         graph = new_graph
         all_targets = { target_to_project.get(target.id) for target in all_targets }
@@ -218,8 +233,56 @@ class SquareDepmap(Task):
       with self._work_block('Calculating target project groups.'):
         target_to_project, project_to_targets = self._get_target_project_maps(targets)
 
+    if self.get_options().reduce_transitive:
+      # Done before any output is generated, so pruned edges are never formatted.
+      with self._work_block('Reducing transitive dependencies.'):
+        graph = graph.transitive_reduction()
+
     with self._work_block('Finding subgraphs.'):
       groups = sorted(map(sorted, project_to_targets.values()))
+    return graph, groups, target_to_project
+
+  def generate_jsonl(self, targets):
+    """Yields the graph as newline-delimited json: one object per vertex, then one per edge."""
+    graph, groups, target_to_project = self._build_depmap(targets)
+    with self._work_block('Generating .jsonl lines.'):
+      for index, group in enumerate(groups):
+        for vertex in group:
+          yield json.dumps({
+            'type': 'vertex',
+            'id': vertex,
+            'project': target_to_project.get(vertex, vertex),
+            'group': index,
+            'external': '3rdparty' in vertex,
+          }, sort_keys=True)
+      for src, dst in graph.edges:
+        yield json.dumps({
+          'type': 'edge',
+          'src': src,
+          'dst': dst,
+          'same_project': target_to_project.get(src) == target_to_project.get(dst),
+        }, sort_keys=True)
+
+  @classmethod
+  def _csv_field(cls, value):
+    if any(c in value for c in ',"\r\n'):
+      return '"{}"'.format(value.replace('"', '""'))
+    return value
+
+  def generate_csv(self, targets):
+    """Yields the graph as a csv adjacency list: each row is a vertex followed by its dependencies.
+    """
+    graph, groups, _ = self._build_depmap(targets)
+    with self._work_block('Generating .csv lines.'):
+      for group in groups:
+        for vertex in group:
+          row = [vertex]
+          if vertex in graph:
+            row.extend(sorted(graph.outgoing_vertices(vertex)))
+          yield ','.join(self._csv_field(field) for field in row)
+
+  def generate_gv(self, targets):
+    graph, groups, target_to_project = self._build_depmap(targets)
 
     target_to_color = {}
     if self.get_options().rainbow:
@@ -291,20 +354,20 @@ class SquareDepmap(Task):
           )
         yield '  }'
       self._work_log('Generating edges.')
-      for edge in graph.edges:
-        same_project = target_to_project[edge.src] == target_to_project[edge.dst]
+      for src, dst in graph.edges:
+        same_project = target_to_project[src] == target_to_project[dst]
         args = {
-          'color': target_to_color.get(edge.dst, 'black'),
+          'color': target_to_color.get(dst, 'black'),
         }
-        if '3rdparty' in edge.dst:
+        if '3rdparty' in dst:
           args['color'] = external_color
           args['arrowsize'] = 0.5
           args['style'] = 'dashed'
         elif same_project:
           args['weight'] = self.get_options().dot_project_weight
         yield '  {src} -> {dst}{args};'.format(
-          src=name(edge.src),
-          dst=name(edge.dst),
+          src=name(src),
+          dst=name(dst),
           args=self._dot_args(args)
         )
       yield '}'
@@ -3,6 +3,9 @@
 from __future__ import (absolute_import, division, generators, nested_scopes, print_function,
                         unicode_literals, with_statement)
 
+import filecmp
+import json
+import multiprocessing
 import os
 import pkgutil
 import re
@@ -12,14 +15,20 @@ import tempfile
 from hashlib import sha1
 from xml.dom import minidom
 
+import pystache
 from pants.backend.jvm.subsystems.jvm import JVM
+from pants.backend.jvm.subsystems.jvm_platform import JvmPlatform
 from pants.backend.project_info.tasks.export import ExportTask
-from pants.base.generator import Generator, TemplateData
+from pants.base.build_environment import get_buildroot
+from pants.base.generator import TemplateData
 from pants.binaries import binary_util
+from pants.java.distribution.distribution import DistributionLocator
 from pants.option.custom_types import dict_option
 from pants.util.dirutil import safe_mkdir, safe_walk
 from pants.util.memo import memoized_method, memoized_property
+from pants.version import VERSION as PANTS_VERSION
 from squarepants.plugins.square_idea.tasks.square_idea_project import IdeaProject
+from squarepants.pom_directory_index import PomDirectoryIndex
 
 _TEMPLATE_BASEDIR = 'templates/idea'
 
@@ -41,8 +50,54 @@ _SCALA_VERSIONS = {
 }
 
 
+class _CompiledTemplate(object):
+  """A mustache template which is parsed once, and can then be rendered any number of times.
+
+  Renders the same output as a pants Generator for the same template and data.
+  """
+
+  def __init__(self, template_text):
+    if isinstance(template_text, bytes):
+      template_text = template_text.decode('utf-8')
+    self._template = pystache.parse(template_text)
+
+  def render(self, **template_data):
+    return pystache.render(self._template, template_data)
+
+
+def _write_to_tempfile(contents):
+  """Writes contents to a new temp file and returns the path to that file.
+
+  We generate into a temp file so that we don't lose any manual customizations on error.
+  """
+  (output_fd, output_path) = tempfile.mkstemp()
+  with os.fdopen(output_fd, 'w') as output:
+    output.write(contents.encode('utf-8'))
+  return output_path
+
+
+# The module template compiled by each rendering worker process.
+_worker_module_template = None
+
+
+def _init_module_renderer(template_text):
+  global _worker_module_template
+  _worker_module_template = _CompiledTemplate(template_text)
+
+
+def _render_module_to_tempfile(module):
+  return _write_to_tempfile(_worker_module_template.render(module=module))
+
+
 class SquareIdea(ExportTask):
 
+  # Bump to invalidate the export blobs cached by older versions of this task.
+  _EXPORT_CACHE_VERSION = '1'
+  # Number of export blobs kept in the workdir, so switching between projects stays fast.
+  _EXPORT_CACHE_SIZE = 8
+  # Starting a worker process costs about as much as rendering this many modules in-process.
+  _MODULES_PER_RENDER_WORKER = 50
+
   @classmethod
   def register_options(cls, register):
     super(SquareIdea, cls).register_options(register)
@@ -131,6 +186,17 @@ class SquareIdea(ExportTask):
                   'may create modules with names that are extremely misleading in .pants.d, though '
                   'it has the benefit of reducing the incidence of requiring the user to restart '
                   'IntelliJ.')
+    register('--incremental', default=True, action='store_true',
+             help='Only re-render the .iml files of modules whose configuration changed since the '
+                  'last run, and only replace project files whose contents changed. IntelliJ '
+                  're-indexes every module whose .iml file is touched.')
+    register('--cache-export', default=True, action='store_true',
+             help='Reuse the export data of the previous run with the same target roots, targets '
+                  'and resolved jars, instead of computing it again.')
+    register('--render-workers', type=int, default=multiprocessing.cpu_count(), advanced=True,
+             help='Maximum number of processes to render module files with. Each process is only '
+                  'started if there are at least {} modules for it to render. 1 renders them '
+                  'in-process.'.format(cls._MODULES_PER_RENDER_WORKER))
     register('--provided-module_dependencies', type=dict_option,
              help='Mapping of { module_name_prefix p: module_name_prefix } where the scope of '
                   'the dependency in Module Settings should be marked as "Provided".  The names '
@@ -138,7 +204,7 @@ class SquareIdea(ExportTask):
 
   @classmethod
   def task_subsystems(cls):
-    return super(SquareIdea, cls).task_subsystems() + (JVM,)
+    return super(SquareIdea, cls).task_subsystems() + (JVM, JvmPlatform, DistributionLocator)
 
   def __init__(self, *args, **kwargs):
     super(SquareIdea, self).__init__(*args, **kwargs)
@@ -184,6 +250,11 @@ class SquareIdea(ExportTask):
       project_dir = os.path.join(project_dir, '_auto', hash)
     return os.path.abspath(os.path.join(project_dir, self.project_name))
 
+  @memoized_property
+  def pom_index(self):
+    """Index of the pom.xml files in the buildroot, scanned once per run of this task."""
+    return PomDirectoryIndex.scan(get_buildroot())
+
   @memoized_property
   def gen_project_name(self):
     """Computes the name for the generated project, and a sha1 digest of its loaded module names.
@@ -209,7 +280,8 @@ class SquareIdea(ExportTask):
     module_sha = hasher.hexdigest()[:8]
 
     independents = self.context.targets(is_independent)
-    modules = {IdeaProject.find_closest_maven_module(t.address.spec_path) for t in independents}
+    modules = {IdeaProject.find_closest_maven_module(t.address.spec_path, self.pom_index)
+               for t in independents}
     modules = sorted(filter(None, modules))
 
     project_name = modules[0].replace('/', '-')
@@ -252,9 +324,87 @@ class SquareIdea(ExportTask):
     return IdeaProject.ModulePool(steal_names=self.get_options().module_pool_steal_names,
                                   **module_types)
 
+  def _export_fingerprint(self, targets):
+    """Computes a sha1 of everything the export blob of these targets is generated from.
+
+    That is the target roots, the targets with their payloads and dependencies, the resolved jars,
+    the export options, the jvm platform and distribution settings the export reads, and the pants
+    version.
+    """
+    hasher = sha1()
+
+    def update(value):
+      hasher.update(value.encode('utf-8'))
+      hasher.update(b'\0')
+
+    update(self._EXPORT_CACHE_VERSION)
+    update(PANTS_VERSION)
+    options = self.get_options()
+    for name in ('libraries', 'libraries_sources', 'libraries_javadocs', 'sources'):
+      update('{}={!r}'.format(name, getattr(options, name, None)))
+    # The jvm platforms and the jdks located for them. Most of these options are not registered
+    # with fingerprint=True, so they are read by name instead.
+    settings = ((JvmPlatform, ('platforms', 'default_platform')),
+                (DistributionLocator, ('paths', 'minimum_version', 'maximum_version')))
+    for subsystem, names in settings:
+      subsystem_options = subsystem.global_instance().get_options()
+      for name in names:
+        update('{}.{}={}'.format(subsystem.options_scope, name,
+                                 json.dumps(subsystem_options.get(name), sort_keys=True)))
+    for name in ('JDK_HOME', 'JAVA_HOME', 'PATH'):
+      update('{}={}'.format(name, os.environ.get(name, '')))
+    for spec in sorted(target.address.spec for target in self.context.target_roots):
+      update(spec)
+
+    for target in sorted(targets, key=lambda t: t.address.spec):
+      update(target.address.spec)
+      update(type(target).__name__)
+      # Covers the payload (sources and their contents, jars, excludes, ...) of the target and of
+      # everything it depends on. The edges are hashed as well, because dependencies whose payload
+      # has nothing to fingerprint are left out of the transitive hash.
+      update(target.transitive_invalidation_hash() or '')
+      for dependency in sorted(dep.address.spec for dep in target.dependencies):
+        update(dependency)
+
+    classpath_products = self.context.products.get_data('compile_classpath')
+    if classpath_products:
+      for conf, path in sorted(classpath_products.get_for_targets(targets)):
+        update(conf)
+        update(path)
+    return hasher.hexdigest()
+
+  def _cached_targets_map(self, targets):
+    """Returns the export blob for the targets, from the workdir if it was already generated."""
+    if not self.get_options().cache_export:
+      return self.generate_targets_map(targets)
+    cache_dir = os.path.join(self.workdir, 'export')
+    path = os.path.join(cache_dir, '{}.json'.format(self._export_fingerprint(targets)))
+    if os.path.exists(path):
+      try:
+        with open(path, 'r') as f:
+          blob = json.load(f)
+        os.utime(path, None) # Marks it as recently used.
+        self.context.log.debug('Loaded export data from {}'.format(path))
+        return blob
+      except ValueError:
+        pass # Corrupted, just generate it again.
+
+    blob = self.generate_targets_map(targets)
+    safe_mkdir(cache_dir)
+    temp_path = '{}.tmp'.format(path)
+    with open(temp_path, 'w') as f:
+      json.dump(blob, f)
+    os.rename(temp_path, path)
+
+    cached = sorted((os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+                     if name.endswith('.json')), key=os.path.getmtime, reverse=True)
+    for stale in cached[self._EXPORT_CACHE_SIZE:]:
+      os.remove(stale)
+    return blob
+
   def _create_idea_project(self, outdir, module_pool):
     targets = self.context.targets()
-    blob = self.generate_targets_map(targets)
+    blob = self._cached_targets_map(targets)
     aop_sources_dir = os.path.join(self.get_options().annotation_generated_sources_dir)
     aop_tests_dir = os.path.join(self.get_options().annotation_generated_test_sources_dir)
 
@@ -283,6 +433,7 @@ class SquareIdea(ExportTask):
       module_pool=module_pool,
       debug_port=self.jvm.get_options().debug_port,
       provided_module_dependencies=self.get_options().provided_module_dependencies,
+      pom_index=self.pom_index,
     )
 
   def _generate_project_file(self, configured_project):
@@ -294,48 +445,181 @@ class SquareIdea(ExportTask):
     # Generate (without merging in any extra components).
     safe_mkdir(os.path.abspath(self.intellij_output_dir))
 
-    ipr = self._generate_to_tempfile(Generator(pkgutil.get_data(__name__, self.project_template),
-                                               project=configured_project))
+    template = _CompiledTemplate(pkgutil.get_data(__name__, self.project_template))
+    ipr_contents = template.render(project=configured_project)
 
     if not self.nomerge:
-      # Get the names of the components we generated, and then delete the
-      # generated files.  Clunky, but performance is not an issue, and this
-      # is an easy way to get those component names from the templates.
-      extra_project_components = self._get_components_to_merge(existing_project_components, ipr)
-      os.remove(ipr)
-
-      # Generate again, with the extra components.
-      ipr = self._generate_to_tempfile(
-        Generator(pkgutil.get_data(__name__, self.project_template),
-                  project=configured_project.extend(extra_components=extra_project_components))
-      )
+      # Get the names of the components we generated, to keep the existing components that the
+      # template doesn't generate.
+      extra_project_components = self._get_components_to_merge(existing_project_components,
+                                                               ipr_contents)
+      if extra_project_components:
+        # Render again with the extra components, reusing the compiled template.
+        ipr_contents = template.render(
+          project=configured_project.extend(extra_components=extra_project_components))
+    ipr = _write_to_tempfile(ipr_contents)
     self.context.log.info('Generated IntelliJ project in {directory}'
                           .format(directory=self.gen_project_workdir))
     return ipr
 
-  def _generate_module_files(self, configured_modules):
-    return [(name, self._generate_to_tempfile(Generator(pkgutil.get_data(__name__, self.module_template), module=module)))
-            for name, module in configured_modules.items()]
+  @property
+  def _module_fingerprints_file(self):
+    return os.path.join(os.path.dirname(self.project_filename), '.module-fingerprints.json')
 
-  def _copy_project_files(self, ipr, imls, existing_modules, module_pool):
-    project_directory = os.path.dirname(self.project_filename)
+  def _load_module_fingerprints(self):
+    """:return: dict of .iml filename -> {'inputs': sha1 of the template inputs, 'output': sha1 of the
+      generated file}, as recorded by the last run.
+    """
+    if not self.get_options().incremental or not os.path.exists(self._module_fingerprints_file):
+      return {}
     try:
-      os.remove(self.project_filename)
-      previous_project_existed = True
-    except OSError:
-      previous_project_existed = False
+      with open(self._module_fingerprints_file, 'r') as f:
+        return json.load(f)
+    except ValueError:
+      return {}
+
+  def _write_module_fingerprints(self, fingerprints):
+    with open(self._module_fingerprints_file, 'w') as f:
+      json.dump(fingerprints, f, indent=2, sort_keys=True)
+
+  @classmethod
+  def _template_fingerprint(cls, template, data):
+    """:return: a sha1 of the template and the data it is rendered with."""
+    hasher = sha1()
+    hasher.update(template)
+
+    def update(value):
+      if isinstance(value, dict):
+        hasher.update('{')
+        for key in sorted(value):
+          update(key)
+          update(value[key])
+        hasher.update('}')
+      elif isinstance(value, (list, tuple)):
+        hasher.update('[')
+        for item in value:
+          update(item)
+        hasher.update(']')
+      elif isinstance(value, (set, frozenset)):
+        hasher.update('(')
+        for item in sorted(value):
+          update(item)
+        hasher.update(')')
+      else:
+        hasher.update(repr(value))
+        hasher.update(',')
+
+    update(data)
+    return hasher.hexdigest()
+
+  @classmethod
+  def _file_fingerprint(cls, path):
+    if not os.path.exists(path):
+      return None
+    with open(path, 'rb') as f:
+      return sha1(f.read()).hexdigest()
 
+  def _generate_module_files(self, configured_modules, previous_fingerprints):
+    """Renders the .iml files of the modules to temp files.
+
+    :param dict configured_modules: .iml filename -> module template data.
+    :param dict previous_fingerprints: the fingerprints recorded by the last run. Modules whose
+      template inputs and generated .iml file are both unchanged since then are not rendered.
+    :return: a tuple of the list of (.iml filename, temp file or None if it was not rendered), and
+      the dict of .iml filename -> fingerprint of its template inputs.
+    """
+    template = pkgutil.get_data(__name__, self.module_template)
+    project_directory = os.path.dirname(self.project_filename)
+    input_fingerprints = {}
+    unchanged = set()
+    to_render = []
+    for name, module in configured_modules.items():
+      input_fingerprints[name] = self._template_fingerprint(template, module)
+      previous = previous_fingerprints.get(name)
+      if (previous and previous.get('inputs') == input_fingerprints[name]
+          and previous.get('output') == self._file_fingerprint(os.path.join(project_directory, name))):
+        unchanged.add(name)
+      else:
+        to_render.append((name, module))
+    self.context.log.debug('Rendering {rendered} of {total} modules.'
+                           .format(rendered=len(to_render), total=len(configured_modules)))
+    rendered = dict(zip((name for name, _ in to_render),
+                        self._render_modules(template, [module for _, module in to_render])))
+    imls = [(name, rendered.get(name)) for name in configured_modules]
+    return imls, input_fingerprints
+
+  def _render_worker_count(self, module_count):
+    """:return: the number of worker processes to render module_count modules with."""
+    return min(self.get_options().render_workers,
+               module_count // self._MODULES_PER_RENDER_WORKER)
+
+  def _render_modules(self, template, modules):
+    """Renders each module with the template, across a pool of worker processes.
+
+    :param string template: the text of the module template.
+    :param list modules: the module template data to render.
+    :return: the paths of the temp files the modules were rendered to, in order.
+    """
+    workers = self._render_worker_count(len(modules))
+    if workers <= 1:
+      compiled = _CompiledTemplate(template)
+      return [_write_to_tempfile(compiled.render(module=module)) for module in modules]
+    pool = multiprocessing.Pool(workers, initializer=_init_module_renderer, initargs=(template,))
+    try:
+      paths = list(pool.imap(_render_module_to_tempfile, modules))
+      pool.close()
+      return paths
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+
+  def _replace_file(self, source, destination):
+    """Moves source over destination, unless destination already has the same contents.
+
+    :return: True if destination was replaced.
+    """
+    if os.path.exists(destination) and filecmp.cmp(source, destination, shallow=False):
+      os.remove(source)
+      return False
+    shutil.move(source, destination)
+    return True
+
+  def _write_placeholder_module(self, path):
+    if os.path.exists(path):
+      with open(path, 'rb') as f:
+        if f.read() == self._empty_module_data:
+          return
+    with open(path, 'w+') as f:
+      f.write(self._empty_module_data)
+
+  def _copy_project_files(self, ipr, imls, existing_modules, module_pool, input_fingerprints):
+    project_directory = os.path.dirname(self.project_filename)
+    incremental = self.get_options().incremental
+    previous_project_existed = os.path.exists(self.project_filename)
     previous_modules = existing_modules
-    for existing_project_file in previous_modules:
-      os.remove(os.path.join(project_directory, existing_project_file))
+    if not incremental:
+      if previous_project_existed:
+        os.remove(self.project_filename)
+      for existing_project_file in previous_modules:
+        os.remove(os.path.join(project_directory, existing_project_file))
 
     current_modules = set()
-    for index, (name, iml) in enumerate(imls):
-      dirname, filename = os.path.split(self.module_filename)
-      shutil.move(iml, os.path.join(dirname, name))
+    replaced_modules = 0
+    fingerprints = {}
+    for name, iml in imls:
+      path = os.path.join(project_directory, name)
+      if iml and self._replace_file(iml, path):
+        replaced_modules += 1
       current_modules.add(name)
+      fingerprints[name] = {'inputs': input_fingerprints[name], 'output': self._file_fingerprint(path)}
 
-    shutil.move(ipr, self.project_filename)
+    self._replace_file(ipr, self.project_filename)
+    self._write_module_fingerprints(fingerprints)
+    if incremental:
+      self.context.log.info('Updated {replaced} of {total} module files.'
+                            .format(replaced=replaced_modules, total=len(imls)))
 
     added_modules = current_modules - previous_modules
     removed_modules = previous_modules - current_modules
@@ -353,10 +637,7 @@ class SquareIdea(ExportTask):
       # should help alleviate errors that occur if people switch between projects that use different
       # generated sources (since those are the modules that get stuck under .pants.d, and are hard
       # to pre-compute).
-      path = os.path.join(os.path.dirname(self.module_filename), name)
-      if not os.path.exists(path):
-        with open(path, 'w+') as f:
-          f.write(self._empty_module_data)
+      self._write_placeholder_module(os.path.join(project_directory, name))
 
     if added_modules and previous_project_existed:
       added_names = sorted(m.rsplit('.', 1)[0] for m in added_modules)
@@ -397,35 +678,29 @@ class SquareIdea(ExportTask):
         )
       )
     ipr = self._generate_project_file(configured_project=project.project_template)
-    imls = self._generate_module_files(configured_modules=project.module_templates_by_filename)
-    self._copy_project_files(ipr, imls, existing_modules, module_pool)
+    imls, input_fingerprints = self._generate_module_files(
+      configured_modules=project.module_templates_by_filename,
+      previous_fingerprints=self._load_module_fingerprints(),
+    )
+    self._copy_project_files(ipr, imls, existing_modules, module_pool, input_fingerprints)
     self._open_project()
 
-  def _generate_to_tempfile(self, generator):
-    """Applies the specified generator to a temp file and returns the path to that file.
-    We generate into a temp file so that we don't lose any manual customizations on error."""
-    (output_fd, output_path) = tempfile.mkstemp()
-    with os.fdopen(output_fd, 'w') as output:
-      generator.write(output)
-    return output_path
-
-  def _parse_xml_component_elements(self, path):
+  def _parse_xml_component_elements(self, path=None, contents=None):
     """Returns a list of pairs (component_name, xml_fragment) where xml_fragment is the xml text of
-    that <component> in the specified xml file."""
-    if not os.path.exists(path):
+    that <component> in the specified xml file, or in the xml contents."""
+    if contents is not None:
+      dom = minidom.parseString(contents.encode('utf-8'))
+    elif not os.path.exists(path):
       return []  # No existing components.
-    dom = minidom.parse(path)
+    else:
+      dom = minidom.parse(path)
     # .ipr and .iml files both consist of <component> elements directly under a root element.
     return [(x.getAttribute('name'), x.toxml()) for x in dom.getElementsByTagName('component')]
 
-  def _get_components_to_merge(self, mergable_components, path):
+  def _get_components_to_merge(self, mergable_components, generated_contents):
     """Returns a list of the <component> fragments in mergable_components that are not
-    superceded by a <component> in the specified xml file.
+    superceded by a <component> in the generated xml contents.
     mergable_components is a list of (name, xml_fragment) pairs."""
-
-    # As a convenience, we use _parse_xml_component_elements to get the
-    # superceding component names, ignoring the generated xml fragments.
-    # This is fine, since performance is not an issue.
     generated_component_names = set(
-      [name for (name, _) in self._parse_xml_component_elements(path)])
+      [name for (name, _) in self._parse_xml_component_elements(contents=generated_contents)])
     return [x[1] for x in mergable_components if x[0] not in generated_component_names]
@@ -20,7 +20,8 @@ from pants.util.dirutil import safe_mkdir
 from pants.util.memo import memoized_method, memoized_property
 from pants.util.osutil import get_os_name, known_os_names, normalize_os_name, OS_ALIASES
 
-from squarepants.graph_util import Graph
+from squarepants.graph_util import CompactGraph
+from squarepants.pom_directory_index import PomDirectoryIndex
 
 
 logger = logging.getLogger(__name__)
@@ -291,21 +292,18 @@ class IdeaProject(object):
     return prefix
 
   @classmethod
-  def find_closest_maven_module(cls, path):
+  def find_closest_maven_module(cls, path, pom_index):
     """Searches up through the parent directories looking for maven modules.
 
-    :return: The first directory it finds which contains a pom.xml, or None.
+    :param PomDirectoryIndex pom_index: index of the pom.xml files in the buildroot.
+    :return: The first directory it finds which contains a pom.xml, or None. The top-level pom.xml
+      only counts for the buildroot itself, which is returned as '.'.
     """
-    path = os.path.normpath(path)
-    path = os.path.relpath(path)
-    pom_file = os.path.join(path, 'pom.xml')
-    last_path = path
-    while os.path.exists(path) and not os.path.exists(pom_file):
-      path = os.path.dirname(path)
-      if path == last_path:
-        return None
-      pom_file = os.path.join(path, 'pom.xml')
-    return path
+    path = os.path.relpath(os.path.normpath(path))
+    closest = pom_index.closest_pom_dir(path)
+    if closest == '':
+      return '.' if path == '.' else None
+    return closest
 
   @classmethod
   def infer_processor_name(cls, index, processors):
@@ -353,28 +351,25 @@ class IdeaProject(object):
     """
     if not modules_by_name:
       modules_by_name = {module.name: module for module in modules}
-    edges = set()
+    # Module names are interned to integers, so the transitive closure of each module is a bitset
+    # rather than a set of names.
+    graph = CompactGraph(sorted(module.name for module in modules),
+                         ((module.name, dependency) for module in modules
+                          for dependency in module.dependencies))
     for module in modules:
-      edges.update(Graph.Edge(module.name, dependency) for dependency in module.dependencies)
-    graph = Graph(vertices={module.name for module in modules}, edges=edges)
-    dependency_closure = {}
-    # Process dependencies before dependees.
-    for module_name in reversed(graph.topological_ordering(stable=True)):
-      module = modules_by_name[module_name]
-      dependency_closure[module_name] = set()
-      direct_dependencies = sorted(module.dependencies) # Sort for stability.
+      module_name = module.name
       # Remove any direct dependencies which are already pulled in by our transitive dependencies.
-      for dependency in direct_dependencies:
-        if any(dependency in dependency_closure[other] for other in module.dependencies):
-          logger.debug('Removing redundant dependency {} -> {}.'.format(module_name, dependency))
-          module.dependencies.remove(dependency)
-        else:
-          dependency_closure[module_name].update(dependency_closure[dependency])
-          dependency_closure[module_name].add(dependency)
+      for dependency in sorted(graph.implied_successors(module_name)): # Sort for stability.
+        logger.debug('Removing redundant dependency {} -> {}.'.format(module_name, dependency))
+        module.dependencies.remove(dependency)
       if prune_libraries:
         # Remove any libraries which are already pulled in by our transitive dependencies.
         transitive_libraries = defaultdict(set)
-        for dep_name in dependency_closure[module_name]:
+        for dep_name in graph.reachable_vertices(module_name):
+          if graph.reaches(dep_name, module_name):
+            # On a cycle with this module (or this module itself), so it may be pruned against
+            # this module's libraries in turn.
+            continue
           dependency = modules_by_name[dep_name]
           for conf, jars in dependency.libraries.items():
             transitive_libraries[conf].update(jars)
@@ -385,7 +380,7 @@ class IdeaProject(object):
                exclude_folders=None, annotation_processing=None, bash=None, java_encoding=None,
                java_maximum_heap_size=None, pants_workdir=None, generate_root_module=None,
                prune_libraries=False, module_pool=None, debug_port=None, 
-               provided_module_dependencies=None):
+               provided_module_dependencies=None, pom_index=None):
     self.blob = export_json
     self.maven_style = maven_style
     self.global_excludes = map(os.path.abspath, exclude_folders or ())
@@ -403,6 +398,8 @@ class IdeaProject(object):
     self.annotation_processing_jars = set()
     self.debug_port = debug_port
     self.provided_module_dependencies = provided_module_dependencies or {}
+    # Scanned once per project, so pom.xml files added since the last run are picked up.
+    self.pom_index = pom_index or PomDirectoryIndex.scan(get_buildroot())
     self._setup_modules()
 
   def _setup_modules(self):
@@ -439,17 +436,28 @@ class IdeaProject(object):
     """
     excludes = set()
     if path and os.path.exists(path):
-      if os.path.isdir(path):
-        target = os.path.join(path, 'target')
-        if os.path.exists(os.path.join(path, 'pom.xml')):
-          excludes.add(os.path.abspath(target))
+      # The pom.xml's are looked up in an index built with a single walk of the buildroot, rather
+      # than walking each module's subtree (target/ directories and all) again.
+      buildroot = get_buildroot()
+      in_buildroot = not os.path.relpath(os.path.abspath(path), buildroot).startswith(os.pardir)
+      if not in_buildroot:
+        # The buildroot's index knows nothing about these, so look at the file system directly.
+        if recurse_down:
+          pom_dirs = [dirpath for dirpath, dirnames, filenames in os.walk(path)
+                      if 'pom.xml' in filenames]
+        else:
+          pom_dirs = [path] if os.path.exists(os.path.join(path, 'pom.xml')) else []
+      else:
+        pom_index = self.pom_index
+        if recurse_down:
+          pom_dirs = [os.path.join(pom_index.root, pom_dir)
+                      for pom_dir in pom_index.pom_dirs_under(path)]
+        else:
+          pom_dirs = [path] if pom_index.has_pom(path) else []
+      excludes.update(os.path.abspath(os.path.join(pom_dir, 'target')) for pom_dir in pom_dirs)
       parent = os.path.dirname(path)
       if recurse_up and parent != path:
         excludes.update(self._maven_excludes(parent, recurse_up=True, recurse_down=False))
-      if recurse_down:
-        for (dirpath, dirnames, filenames) in os.walk(path):
-          if 'pom.xml' in filenames:
-            excludes.add(os.path.abspath(os.path.join(dirpath, 'target')))
     return excludes
 
   def _check_for_direct_cycles(self):
@@ -481,6 +489,85 @@ class IdeaProject(object):
           # this system.
           libraries['default'].update(libraries[conf])
 
+  def _is_intermediate_target(self, target_spec):
+    """Whether the target is neither a jar_library nor a target that has sources.
+
+    In other words, it is simply a target() object or equivalent, and exists only as an intermediate
+    node in the dependency chain. We collapse these chains by recursing through their dependencies.
+    """
+    return (self.blob['targets'][target_spec].get('pants_target_type') != 'jar_library'
+            and target_spec not in self.module_names_by_target)
+
+  def _warn_about_cycle(self, component, graph):
+    """Logs the path around a cycle of intermediate targets, which are collapsed together."""
+    spec = min(component)
+    members = set(component)
+    # Breadth-first search for the shortest path from spec back to itself.
+    parents = {}
+    frontier = [spec]
+    while frontier and spec not in parents:
+      next_frontier = []
+      for vertex in frontier:
+        for dep in sorted(graph.outgoing_vertices(vertex)):
+          if dep in members and dep not in parents:
+            parents[dep] = vertex
+            next_frontier.append(dep)
+      frontier = next_frontier
+    path = [parents[spec]]
+    while path[-1] != spec:
+      path.append(parents[path[-1]])
+    logger.warn('Skipping cycle involving {spec}.{trace}\n  {spec}'.format(
+      spec=spec,
+      trace=''.join('\n  {} ->'.format(n) for n in reversed(path))
+    ))
+
+  @memoized_property
+  def _collapsed_target_dependencies(self):
+    """Computes the modules and libraries each target spec contributes to its dependees.
+
+    A jar_library contributes its libraries, and a target with sources contributes its module. An
+    intermediate target contributes everything its dependencies do, so it is resolved from their
+    (already resolved) results: the targets are visited once, bottom-up, in topological order of the
+    strongly connected components of the graph of intermediate targets and their dependencies.
+
+    :return: a dict of target spec -> (set of module names, dict of conf -> OrderedSet of libraries).
+    """
+    graph = CompactGraph()
+    for target_spec, target in self.blob['targets'].items():
+      graph.add_vertex(target_spec)
+      if self._is_intermediate_target(target_spec):
+        for dependency in target['targets']:
+          graph.add_edge(target_spec, dependency)
+
+    collapsed = {}
+    for component in graph.strongly_connected_components():
+      collected_modules = set()
+      collected_libraries = defaultdict(OrderedSet)
+      members = set(component)
+      for target_spec in component:
+        target = self.blob['targets'][target_spec]
+        if target.get('pants_target_type') == 'jar_library':
+          for library_name in target['libraries']:
+            for conf, path in self.blob['libraries'][library_name].items():
+              collected_libraries[conf].add(path)
+        elif target_spec in self.module_names_by_target:
+          # This is a "normal" dependency, so we make the dependee depend on the module which
+          # contains it.
+          collected_modules.add(self.module_names_by_target[target_spec])
+        else:
+          for dependency in target['targets']:
+            if dependency in members:
+              continue
+            modules, libraries = collapsed[dependency]
+            collected_modules.update(modules)
+            for conf, paths in libraries.items():
+              collected_libraries[conf].update(paths)
+      if len(component) > 1 or component[0] in graph.outgoing_vertices(component[0]):
+        self._warn_about_cycle(component, graph)
+      for target_spec in component:
+        collapsed[target_spec] = (collected_modules, collected_libraries)
+    return collapsed
+
   def _compute_module_and_library_dependencies(self, target):
     """Given the target spec, compute its module dependencies and libraries.
 
@@ -489,69 +576,12 @@ class IdeaProject(object):
     """
     collected_libraries = defaultdict(OrderedSet)
     collected_modules = set()
-
-    def collect_libraries(target_spec):
-      """Adds any libraries this target has to the collected_libraries dictionary.
-
-      Skips targets that aren't jar_libraries.
-      :param str target_spec: The target's spec.
-      :return: True if the target is a jar_library, False otherwise.
-      """
-      if self.blob['targets'][target_spec].get('pants_target_type') != 'jar_library':
-        return False
-      for library_name in self.blob['targets'][target_spec]['libraries']:
-        for conf, path in self.blob['libraries'][library_name].items():
-          collected_libraries[conf].add(path)
-      return True
-
-    def collect_dependencies(target_spec):
-      """Adds this targets libraries and its module to the collected libraries and modules.
-
-      May return a list of more target specs that should be collected.
-      :param target_spec: The target's spec.
-      :return: An iterable of dependencies whose transitive dependencies should be collected, in the
-        event that this target has dependencies but cannot be associated with its own module.
-      """
-      if collect_libraries(target_spec):
-        return ()
-      if target_spec not in self.module_names_by_target:
-        # This represents a target that is neither a jar_library nor a target that has sources.
-        # In other words, it is simply a target() object or equivalent, and exists only as an
-        # intermediate node in the dependency chain. We collapse this chain by recursing through
-        # its dependencies.
-        return self.blob['targets'][target_spec]['targets']
-      # This is a "normal" dependency, so we make this module dependent on the module which contians
-      # the target_dependency.
-      dependency = self.module_names_by_target[target_spec]
-      collected_modules.add(dependency)
-      return ()
-
-    visited = set()
-
-    def should_skip(path, vertex):
-      if vertex in visited:
-        # This represents either a cycle or a diamond dependency.
-        if vertex in path:
-          logger.warn('Skipping cycle involving {spec}.{trace}\n  {spec}'.format(
-            spec=vertex,
-            trace=''.join('\n  {} ->'.format(n) for n in path)
-          ))
-        return True
-      return False
-
+    collapsed = self._collapsed_target_dependencies
     for target_dependency in target.get('targets', ()):
-      # Performs a graph search to include the (possibly transitive) dependencies of targets which
-      # don't specify libraries or sources.
-      frontier = {((), target_dependency)} # (path, vertex) tuples. The paths are for logging.
-      while frontier:
-        path, next = frontier.pop()
-        if should_skip(path, next):
-          continue
-        visited.add(next)
-        next_path = path + (next,)
-        for dep in collect_dependencies(next):
-          if not should_skip(next_path, dep):
-            frontier.add((next_path, dep))
+      modules, libraries = collapsed[target_dependency]
+      collected_modules.update(modules)
+      for conf, paths in libraries.items():
+        collected_libraries[conf].update(paths)
 
     self._handle_system_specific_libraries(collected_libraries)
     return collected_modules, collected_libraries
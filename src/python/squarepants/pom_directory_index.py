@@ -0,0 +1,111 @@
+# Maps directories in the repo to their closest maven module.
+
+import logging
+import os
+from bisect import bisect_left
+
+
+logger = logging.getLogger(__name__)
+
+
+class PomDirectoryIndex(object):
+  """Knows which directories under a build root contain a pom.xml.
+
+  The directories are found with a single walk of the build root, after which resolving a path to
+  its closest maven module takes no file system calls. Resolved directories are remembered, so
+  every directory is only ever looked up once no matter how many targets live under it.
+
+  Paths are relative to the build root, which is itself ''. Hidden directories and the maven
+  'target/' output directories next to a pom.xml are not searched.
+
+  An index is a snapshot of the file system, so it is built for a single run (eg by a task's
+  execute()) and handed to whatever needs it, rather than shared between runs.
+  """
+
+  @classmethod
+  def scan(cls, root):
+    """Walks the file system under root to find its pom.xml files.
+
+    :param string root: path to the build root.
+    :rtype: PomDirectoryIndex
+    """
+    root = os.path.abspath(root)
+    pom_dirs = set()
+    for dirpath, dirnames, filenames in os.walk(root):
+      has_pom = 'pom.xml' in filenames
+      if has_pom:
+        relpath = os.path.relpath(dirpath, root)
+        pom_dirs.add('' if relpath == '.' else relpath)
+      dirnames[:] = [name for name in dirnames
+                     if not name.startswith('.') and not (has_pom and name == 'target')]
+    logger.debug('Found {count} pom.xml files under {root}'.format(count=len(pom_dirs), root=root))
+    return cls(root, pom_dirs)
+
+  def __init__(self, root, pom_dirs):
+    """
+    :param string root: absolute path to the build root.
+    :param pom_dirs: the directories containing a pom.xml, relative to root.
+    """
+    self.root = root
+    self._pom_dirs = frozenset(pom_dirs)
+    self._sorted_pom_dirs = sorted(self._pom_dirs)
+    self._closest = {}
+
+  def _relpath(self, path):
+    """:returns: path relative to the root, or None if it is outside of the root."""
+    relpath = os.path.relpath(os.path.join(self.root, path), self.root)
+    if relpath == '.':
+      return ''
+    if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+      return None
+    return relpath
+
+  def has_pom(self, path):
+    """:returns: True if the directory at path contains a pom.xml."""
+    return self._relpath(path) in self._pom_dirs
+
+  def pom_dirs_under(self, path):
+    """Lists the directories at or below path which contain a pom.xml.
+
+    :param string path: a directory, either absolute or relative to the root.
+    :returns: the directories, relative to the root, in sorted order.
+    :rtype: list of string
+    """
+    relpath = self._relpath(path)
+    if relpath is None:
+      return []
+    if not relpath:
+      return list(self._sorted_pom_dirs)
+    pom_dirs = [relpath] if relpath in self._pom_dirs else []
+    # Everything below relpath shares the prefix, so it is one contiguous run of the sorted list.
+    prefix = relpath + os.sep
+    for index in range(bisect_left(self._sorted_pom_dirs, prefix), len(self._sorted_pom_dirs)):
+      if not self._sorted_pom_dirs[index].startswith(prefix):
+        break
+      pom_dirs.append(self._sorted_pom_dirs[index])
+    return pom_dirs
+
+  def closest_pom_dir(self, path):
+    """Finds the maven module a directory belongs to.
+
+    :param string path: a directory, either absolute or relative to the root.
+    :returns: the closest directory at or above path which contains a pom.xml, relative to the
+      root, or None if there isn't one.
+    """
+    relpath = self._relpath(path)
+    if relpath is None:
+      return None
+    unresolved = []
+    while relpath not in self._closest:
+      if relpath in self._pom_dirs:
+        self._closest[relpath] = relpath
+        break
+      unresolved.append(relpath)
+      if not relpath:
+        self._closest[relpath] = None
+        break
+      relpath = os.path.dirname(relpath)
+    closest = self._closest[relpath]
+    for directory in unresolved:
+      self._closest[directory] = closest
+    return closest
@@ -9,6 +9,7 @@ from generation_context import GenerationContext
 from pom_handlers import (DepsFromPom, JavaOptionsInfo, WireInfo, SignedJarInfo,
                           SpecialPropertiesInfo, CachedDependencyInfos, ShadingInfo, JooqInfo)
 from pom_utils import PomUtils
+from profiling import Profiler
 
 
 class PomFile(object):
@@ -37,13 +38,8 @@ class PomFile(object):
     self._initialize_dependency_lists()
     # Names of targets generated for project-level BUILD file.
     self.project_target_names = set()
-    # Update our properties dict with any 'special' properties (things that are conditional on
-    # sys.platform, etc).
-    self._properties = {}
-    self._update_properties()
-    self._java_options = None
+    self._settings = None
     self._parents = None
-    self._shading_rules = None
     self._config_tree = None
 
   @classmethod
@@ -67,7 +63,8 @@ class PomFile(object):
   def _get_parsed_pom_data(self, generation_context):
     self.deps_from_pom = DepsFromPom(PomUtils.pom_provides_target(rootdir=self.root_directory),
       rootdir=self.root_directory,
-      exclude_project_targets=generation_context.exclude_project_targets
+      exclude_project_targets=generation_context.exclude_project_targets,
+      generated_file_names=generation_context.generated_file_names
     )
     self.wire_info = WireInfo.from_pom(self.path, self.root_directory)
     self.signed_jar_info = SignedJarInfo.from_pom(self.path, self.root_directory)
@@ -75,19 +72,6 @@ class PomFile(object):
     self.shading_info = ShadingInfo.from_pom(self.path, self.root_directory)
     self.jooq_info = JooqInfo.from_pom(self.path, self.root_directory)
 
-  def _update_properties(self):
-    self._properties.update(self.deps_from_pom.properties)
-    self._properties.update(SpecialPropertiesInfo.from_pom(self.path,
-                                                           self.root_directory).properties)
-    # Magic maven symbols.
-    basedir = os.path.abspath(self.directory)
-    self._properties['basedir'] = "' + symbols.module_directory + '"
-    self._properties['project.basedir'] = "' + symbols.module_directory + '"
-    self._properties['project.baseUri'] = "' + symbols.module_uri + '"
-    self._properties['project.build.directory'] = "' + symbols.module_target_directory + '"
-    self._properties['maven.build.timestamp'] = "' + symbols.build_timestamp + '"
-    self._properties['user.name'] = "' + symbols.user_name + '"
-
   def _initialize_dependency_lists(self):
     aggregate_lib_deps, aggregate_test_deps = self.deps_from_pom.get(self.path)
     lib_deps, test_deps, lib_jar_deps, test_jar_deps = [], [], [], []
@@ -119,19 +103,22 @@ class PomFile(object):
 
   @property
   def parent(self):
-    if self.deps_from_pom.parent:
-      parent_root = self.deps_from_pom.parent.root_directory
-      parent_path = self.deps_from_pom.parent.source_file_name
-      check_path = os.path.join(parent_root, parent_path) if parent_root else parent_path
-      if not os.path.exists(check_path):
-        raise self.ParsingError('Error parsing {pom}: parent pom does not exist at: {parent}.'
-                                .format(pom=self.path, parent=check_path))
-      return PomFile.find(parent_path, parent_root, generation_context=self.context)
+    parent = self.settings.parent
+    if parent:
+      return PomFile.find(parent.path, parent.root_directory, generation_context=self.context)
     return None
 
+  @property
+  def settings(self):
+    """:returns: the settings this pom inherits from its parents, merged with its own.
+    :rtype: InheritedPomSettings
+    """
+    if self._settings is None:
+      self._settings = InheritedPomSettings.for_pom(self.path, self.root_directory)
+    return self._settings
+
   def _signed_jar_infos(self):
-    for pom in self.walk_pom_parents():
-      yield pom.signed_jar_info
+    return self.settings.signed_jar_infos
 
   def _update_manifest_entry(self, entries, key, value):
     if key == 'Class-Path':
@@ -149,7 +136,8 @@ class PomFile(object):
     elif key not in entries or not entries[key]:
       entries[key] = value
 
-  def _dedup_compile_args(self, args):
+  @classmethod
+  def _dedup_compile_args(cls, args):
     # We try to de-dup compile arguments that don't make sense to duplicate.
 
     def strategy_replace(old_arg, new_arg):
@@ -195,7 +183,8 @@ class PomFile(object):
         new_args.append(arg)
     return new_args
 
-  def _correct_prefixes(self, args):
+  @classmethod
+  def _correct_prefixes(cls, args):
     correct = []
     for arg in args:
       if arg.startswith('-C'):
@@ -206,26 +195,11 @@ class PomFile(object):
 
   @property
   def java_options(self):
-    if not self._java_options:
-      total = JavaOptionsInfo()
-      total.source_level = self.java_options_info.source_level
-      total.target_level = self.java_options_info.target_level
-      total.compile_args = self.java_options_info.compile_args
-      total.test_env_vars = dict(self.java_options_info.test_env_vars)
-      total.test_jvm_args = list(self.java_options_info.test_jvm_args)
-
-      pom = self.parent
-      if pom:
-        total.source_level = total.source_level or pom.java_options.source_level
-        total.target_level = total.target_level or pom.java_options.target_level
-        total.compile_args = pom.java_options.compile_args + total.compile_args
-        total.test_env_vars.update(pom.java_options.test_env_vars)
-        total.test_jvm_args.extend(pom.java_options.test_jvm_args)
-
-      total.compile_args = self._dedup_compile_args(total.compile_args)
-      total.compile_args = self._correct_prefixes(total.compile_args)
-      self._java_options = total
-    return self._java_options
+    """The JavaOptionsInfo merged along the parent chain, shared with every pom of the same path.
+
+    Do not modify it.
+    """
+    return self.settings.java_options
 
   @classmethod
   def _merge_jooq_config(cls, one, two):
@@ -267,14 +241,8 @@ class PomFile(object):
   @property
   def jooq_config_tree(self):
     if self._config_tree is None:
-      tree = None
-      for pom in reversed(self.walk_pom_parents()):
-        if tree is None:
-          tree = pom.jooq_info.config_tree
-          continue
-        if pom.jooq_info.config_tree is None:
-          continue
-        tree = self._merge_jooq_config(tree, pom.jooq_info.config_tree)
+      # The merged tree is shared with the poms inheriting from this one, so inject into a copy.
+      tree = copy.deepcopy(self.settings.jooq_config_tree)
       self._inject_jooq_schema_exclusion(tree)
       self._config_tree = tree
     return self._config_tree
@@ -293,11 +261,8 @@ class PomFile(object):
 
   @property
   def shading_rules(self):
-    if self._shading_rules is None:
-      self._shading_rules = []
-      for pom in reversed(self.walk_pom_parents()):
-        self._shading_rules.extend(pom.shading_info.rules)
-    return self._shading_rules
+    """The shading rules of the parent chain, outermost parent first. Do not modify the list."""
+    return self.settings.shading_rules
 
   @property
   def signed_jars_deploy_excludes(self):
@@ -345,10 +310,11 @@ class PomFile(object):
 
   @property
   def properties(self):
-    props = {}
-    for pom in reversed(self.walk_pom_parents()):
-      props.update(pom._properties)
-    return props
+    """The properties of the parent chain and this pom, shared with every pom of the same path.
+
+    Do not modify the dict, copy it instead.
+    """
+    return self.settings.properties
 
   @property
   def mainclass(self):
@@ -357,3 +323,119 @@ class PomFile(object):
   @property
   def artifact_id(self):
     return self.deps_from_pom.artifact_id
+
+
+class InheritedPomSettings(object):
+  """The settings a pom.xml inherits from its chain of parent poms, merged with its own.
+
+  All the modules of a repo inherit from the same few parent poms, so the settings of each pom are
+  only resolved once and shared with its children, which just apply their own on top. The merged
+  values are shared by everything asking for the same pom, and must not be modified.
+
+  The <dependencies> are not repeated here, the CachedDependencyInfos already resolve them once per
+  pom in the same way.
+  """
+
+  # Magic maven symbols, which only make sense relative to the module being generated.
+  MAGIC_PROPERTIES = {
+    'basedir': "' + symbols.module_directory + '",
+    'project.basedir': "' + symbols.module_directory + '",
+    'project.baseUri': "' + symbols.module_uri + '",
+    'project.build.directory': "' + symbols.module_target_directory + '",
+    'maven.build.timestamp': "' + symbols.build_timestamp + '",
+    'user.name': "' + symbols.user_name + '",
+  }
+
+  _cache = {}
+
+  @classmethod
+  def reset(cls):
+    """Forgets all the settings resolved so far. Useful for testing."""
+    cls._cache = {}
+
+  @classmethod
+  def for_pom(cls, pom_file_path, root_directory=None):
+    """:returns: the settings of the pom, resolving them and those of its parents as needed.
+    :rtype: InheritedPomSettings
+    """
+    key = (pom_file_path, root_directory)
+    dependency_info = CachedDependencyInfos.get(pom_file_path, rootdir=root_directory)
+    settings = cls._cache.get(key)
+    # The settings are stale once the caches of the parsed poms have been reset.
+    if settings is None or settings.dependency_info is not dependency_info:
+      Profiler.increment('inherited_pom_settings.misses')
+      settings = cls(pom_file_path, root_directory, dependency_info)
+      cls._cache[key] = settings
+    else:
+      Profiler.increment('inherited_pom_settings.hits')
+    return settings
+
+  def __init__(self, pom_file_path, root_directory, dependency_info):
+    """
+    :param string pom_file_path: path to the pom.xml, relative to the root_directory.
+    :param string root_directory: root directory of the repo, or None for the current directory.
+    :param DependencyInfo dependency_info: the parsed dependency information of the pom.
+    """
+    self.path = pom_file_path
+    self.root_directory = root_directory
+    self.dependency_info = dependency_info
+    self.parent = self._find_parent()
+
+    java_options_info = JavaOptionsInfo.from_pom(pom_file_path, root_directory)
+    jooq_info = JooqInfo.from_pom(pom_file_path, root_directory)
+    shading_info = ShadingInfo.from_pom(pom_file_path, root_directory)
+    signed_jar_info = SignedJarInfo.from_pom(pom_file_path, root_directory)
+    special_properties_info = SpecialPropertiesInfo.from_pom(pom_file_path, root_directory)
+
+    parent = self.parent
+    self.properties = dict(parent.properties) if parent else {}
+    self.properties.update(dependency_info.properties)
+    # Properties that are conditional on sys.platform, etc.
+    self.properties.update(special_properties_info.properties)
+    self.properties.update(self.MAGIC_PROPERTIES)
+
+    self.java_options = self._merge_java_options(java_options_info,
+                                                 parent.java_options if parent else None)
+
+    own_tree = jooq_info.config_tree
+    parent_tree = parent.jooq_config_tree if parent else None
+    if own_tree is None:
+      self.jooq_config_tree = parent_tree
+    elif parent_tree is None:
+      self.jooq_config_tree = own_tree
+    else:
+      self.jooq_config_tree = PomFile._merge_jooq_config(parent_tree, own_tree)
+
+    self.shading_rules = (parent.shading_rules if parent else []) + list(shading_info.rules)
+    # Unlike the rest, the signed jar infos are listed starting with this pom.
+    self.signed_jar_infos = (signed_jar_info,) + (parent.signed_jar_infos if parent else ())
+
+  def _find_parent(self):
+    parent_info = self.dependency_info.parent
+    if parent_info is None:
+      return None
+    parent_root = parent_info.root_directory
+    parent_path = parent_info.source_file_name
+    check_path = os.path.join(parent_root, parent_path) if parent_root else parent_path
+    if not os.path.exists(check_path):
+      raise PomFile.ParsingError('Error parsing {pom}: parent pom does not exist at: {parent}.'
+                                 .format(pom=self.path, parent=check_path))
+    return self.for_pom(parent_path, parent_root)
+
+  @classmethod
+  def _merge_java_options(cls, info, parent_options):
+    total = JavaOptionsInfo()
+    total.source_level = info.source_level
+    total.target_level = info.target_level
+    total.compile_args = info.compile_args
+    total.test_env_vars = dict(info.test_env_vars)
+    total.test_jvm_args = list(info.test_jvm_args)
+    if parent_options:
+      total.source_level = total.source_level or parent_options.source_level
+      total.target_level = total.target_level or parent_options.target_level
+      total.compile_args = parent_options.compile_args + total.compile_args
+      total.test_env_vars.update(parent_options.test_env_vars)
+      total.test_jvm_args.extend(parent_options.test_jvm_args)
+    total.compile_args = PomFile._dedup_compile_args(total.compile_args)
+    total.compile_args = PomFile._correct_prefixes(total.compile_args)
+    return total
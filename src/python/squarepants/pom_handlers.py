@@ -7,6 +7,8 @@
 
 from abc import ABCMeta, abstractmethod
 from collections import defaultdict
+from hashlib import sha1
+from StringIO import StringIO
 
 import logging
 import os
@@ -14,8 +16,16 @@ import re
 import sys
 import xml.sax
 from xml.etree import ElementTree
+from xml.parsers import expat
+from xml.sax.xmlreader import AttributesImpl, Locator
+
+try:
+  from lxml import etree as lxml_etree
+except ImportError:
+  lxml_etree = None
 
 from generation_utils import GenerationUtils
+from profiling import Profiler
 from target_template import Target
 
 logger = logging.getLogger(__name__)
@@ -25,7 +35,7 @@ def reset_caches():
   CachedDependencyInfos.reset()
   DependencyManagementFinder.reset()
   PomProvidesTarget.reset()
-  GenericPomInfo.reset()
+  PomHandlerManager.reset()
 
 
 class MalformattedPOMException(Exception):
@@ -68,12 +78,17 @@ class PomContentHandler(xml.sax.ContentHandler):
 
   invocations = 0
 
+  # Paths of the elements (along with all the elements below them) whose text endElement() reads.
+  text_path_prefixes = (['project', 'groupId'], ['project', 'artifactId'],
+                        ['project', 'properties'], ['project', 'parent'])
+
   def __init__(self):
     xml.sax.ContentHandler.__init__(self)
     # path of tags leading up to this element
     self.path = []
-    # text content of the current node being parsed (can be retrieved in endElement)
-    self.content = ""
+    # text chunks of the current node being parsed, joined into self.content on demand
+    self._chunks = []
+    self._content = None
     self.contentStack=[]
 
     self.properties = {}
@@ -89,13 +104,24 @@ class PomContentHandler(xml.sax.ContentHandler):
     :param string name: name of the current element.
     :param list<string> attrs: xml attributes of the current element.
     """
-    self.contentStack.append(self.content)
-    self.content = ""
+    self.contentStack.append(self._chunks)
+    self._chunks = []
+    self._content = None
     self.path.append(name)
 
   def characters(self, content):
     """invoked with the element content as a string"""
-    self.content += content.encode('ascii','ignore')
+    self._chunks.append(content)
+    self._content = None
+
+  @property
+  def content(self):
+    """text content of the current node being parsed (can be retrieved in endElement)"""
+    if self._content is None:
+      # The parser hands over text in arbitrarily small pieces, so they are only joined together
+      # once, when some handler actually asks for them.
+      self._content = ''.join(self._chunks).encode('ascii', 'ignore')
+    return self._content
 
   def endElement(self, name):
     """invoke this at the end of subclass call to endElement()
@@ -103,18 +129,22 @@ class PomContentHandler(xml.sax.ContentHandler):
     :param string name: name of the current element that is being closed.
     """
 
-    if self.path == ["project", "groupId"]:
-      self.groupId = self.content.strip()
-    elif self.path == ["project", "artifactId"]:
-      self.artifactId = self.content.strip()
-
-    # Parse properties of the form: <project><properties><foo>fooValue</foo></properties></project>
-    elif self.pathStartsWith(["project", "properties"]):
-      self.properties[name] = self.content.strip()
-    if self.pathStartsWith(["project", "parent"]):
-      self.parent[name] = self.content.strip()
-    self.path.pop(len(self.path) - 1)
-    self.content = self.contentStack.pop()
+    path = self.path
+    if len(path) >= 2 and path[0] == "project":
+      section = path[1]
+      if len(path) == 2 and section == "groupId":
+        self.groupId = self.content.strip()
+      elif len(path) == 2 and section == "artifactId":
+        self.artifactId = self.content.strip()
+
+      # Parse properties of the form: <project><properties><foo>fooValue</foo></properties></project>
+      elif section == "properties":
+        self.properties[name] = self.content.strip()
+      if section == "parent":
+        self.parent[name] = self.content.strip()
+    path.pop()
+    self._chunks = self.contentStack.pop()
+    self._content = None
 
   def endDocument(self):
     """invoked at the end of the XML document. """
@@ -149,117 +179,263 @@ class PomContentHandler(xml.sax.ContentHandler):
     return PomContentHandler.invocations
 
 
-class TopPomContentHandler(PomContentHandler):
-  """SAX parser to read top level Maven pom.xml file.
+class _PathDispatchTrie(object):
+  """Trie of element paths, holding the GenericPomHandlers interested in each of them.
 
-      Just parses out the 'module' definitions.  Don't instantiate this yourself, use the
-      cached factory method PomUtil.top_pom_content_handler().
+  Each handler is registered for the path prefixes in its path_prefixes, and each node holds the
+  (indexes of the) handlers registered for its path or any prefix of it. A parser tracks the node
+  of the current element as it enters elements, so dispatching an endElement is a single lookup,
+  and elements nobody registered for (eg most plugin configuration) reach no handlers at all.
+  The text of those elements isn't needed either, so the parser doesn't bother collecting it.
   """
+
+  _compiled = {}
+
+  def __init__(self, handlers=(), collects_text=False):
+    # Sorted indexes of the handlers which receive the endElement() calls for this path.
+    self.handlers = handlers
+    # Whether anything may read the text content of elements at this path.
+    self.collects_text = collects_text
+    self._children = {}
+    self._beyond = None
+
+  def child(self, name):
+    """:returns: the node for the child element called name."""
+    node = self._children.get(name)
+    if node is not None:
+      return node
+    if self._beyond is None:
+      # Elements below this path that nobody registered for go to the same handlers as this one.
+      self._beyond = _PathDispatchTrie(self.handlers, self.collects_text)
+      self._beyond._beyond = self._beyond
+    return self._beyond
+
+  @classmethod
+  def compile(cls, handlers, text_path_prefixes=()):
+    """Returns the (cached) root of the trie dispatching to the handlers, by index.
+
+    :param list handlers: the GenericPomHandlers to dispatch to.
+    :param text_path_prefixes: paths whose text is read by the parser itself, on top of the text
+      of the paths the handlers registered for.
+    """
+    text_prefixes = frozenset(tuple(prefix) for prefix in text_path_prefixes)
+    key = (tuple(type(handler) for handler in handlers), text_prefixes)
+    if key not in cls._compiled:
+      registered = defaultdict(set)
+      for index, handler in enumerate(handlers):
+        for prefix in handler.path_prefixes:
+          registered[tuple(prefix)].add(index)
+      for prefix in text_prefixes:
+        registered.setdefault(prefix, set())
+      root = cls()
+      for prefix in sorted(registered, key=len):
+        node = root
+        for name in prefix:
+          if name not in node._children:
+            node._children[name] = cls(node.handlers, node.collects_text)
+          node = node._children[name]
+        node.handlers = tuple(sorted(set(node.handlers) | registered[prefix]))
+        node.collects_text = True
+      cls._compiled[key] = root
+    return cls._compiled[key]
+
+
+class _DispatchingContentHandler(PomContentHandler):
+  """SAX parser which passes the endElement() calls on to GenericPomHandlers.
+
+  Each handler only sees the elements under the path prefixes it registered for.
+  """
+
   def __init__(self):
     PomContentHandler.__init__(self)
-    self.modules = []
+    self.handlers = []
+    self._nodes = []
 
-  def endElement(self, name):
-    if self.path == ["project", "modules", "module"]:
-      self.modules.append(self.content.strip())
+  def _set_handlers(self, handlers):
+    self.handlers = handlers
+    self._nodes = [_PathDispatchTrie.compile(handlers, self.text_path_prefixes)]
 
+  def startElement(self, name, attrs):
+    PomContentHandler.startElement(self, name, attrs)
+    self._nodes.append(self._nodes[-1].child(name))
+
+  def characters(self, content):
+    if self._nodes[-1].collects_text:
+      PomContentHandler.characters(self, content)
+
+  def endElement(self, name):
+    handlers = self.handlers
+    for index in self._nodes.pop().handlers:
+      handlers[index].endElement(name)
     PomContentHandler.endElement(self, name)
 
-  def modules(self):
-    return self.modules;
+  def endDocument(self):
+    for handler in self.handlers:
+      handler.endDocument()
+    PomContentHandler.endDocument(self)
 
 
-class _DMFPomContentHandler(PomContentHandler):
-  """Dependency Management Finder Content Handler
+class _SingleInfoContentHandler(_DispatchingContentHandler):
+  """Standalone SAX parser which populates a single GenericPomInfo.
 
-  Used to parse <dependencyManagement> tags.
+  Most code should use PomHandlerManager.parse() instead, which fills in every info type from a
+  single pass over the pom.xml.
+  """
+
+  def __init__(self, info):
+    _DispatchingContentHandler.__init__(self)
+    self._info = info
+    self._set_handlers([info.create_content_handler(self)])
+
+
+class TopPomContentHandler(_SingleInfoContentHandler):
+  """SAX parser to read top level Maven pom.xml file.
+
+      Just parses out the 'module' definitions.  Don't instantiate this yourself, use the
+      cached factory method PomUtil.top_pom_content_handler().
   """
   def __init__(self):
-    PomContentHandler.__init__(self)
-    # Array containing hash of { groupId => "", artifactId => "", version => "" exclusions => [exclusions]}
-    self.dependency_management = []
+    _SingleInfoContentHandler.__init__(self, ModulesInfo())
 
-    # Temporary storage for data parsed from sub-elements
-    self._dependency = {}
-    self._dependency_excludes = []
-    self._dependency_exclude = {}
+  @property
+  def modules(self):
+    return self._info.modules
 
-  def endElement(self, name):
-    if self.pathStartsWith(["project", "dependencyManagement", "dependencies", "dependency", "exclusions", "exclusion"]):
-      if len(self.path) == 7:
-        self._dependency_exclude[self.path[-1]] = self.content.strip()
-      elif (len(self.path) == 6):
-        self._dependency_excludes.append(self._dependency_exclude)
-        self._dependency_exclude = {}
-    elif self.pathStartsWith(["project", "dependencyManagement", "dependencies", "dependency"]):
-      # Parse 'dependencies' under the 'dependencyManagement' tag
-      if len(self.path) == 5:
-        self._dependency[self.path[-1]] = self.content.strip()
-      elif len(self.path) == 4:
-        # end of <dependency> definition. Save it.
 
-        # override the 'exclusions' field with the array we built up
-        self._dependency['exclusions'] = self._dependency_excludes
-        self._dependency_excludes = []
-        self.dependency_management.append(self._dependency)
-        self._dependency = {}
+class _DMFPomContentHandler(_SingleInfoContentHandler):
+  """Dependency Management Finder Content Handler
 
-    PomContentHandler.endElement(self, name)
+  Used to parse <dependencyManagement> tags.
+  """
+  def __init__(self):
+    _SingleInfoContentHandler.__init__(self, DependencyManagementInfo())
+
+  @property
+  def dependency_management(self):
+    return self._info.dependency_management
 
   def dependencyManagement(self):
     return self.dependency_management
 
 
-class _DFPomContentHandler(PomContentHandler):
+class _DFPomContentHandler(_SingleInfoContentHandler):
   """Dependency Finder Content Handler
 
   Used to parse <dependency> tags.
   """
 
   def __init__(self):
-    PomContentHandler.__init__(self)
-    # Array containing hash of { groupId => "", artifactId => "", version => "" }
-    self.dependencies = []
-    self.dependency = {}
-    self.dependency_excludes = []
-    self.dependency_exclude = {}
+    _SingleInfoContentHandler.__init__(self, DependencyListInfo())
 
+  @property
+  def dependencies(self):
+    return self._info.dependencies
 
-  def endElement(self, name):
-    # Add the parent pom as one of the dependencies
-    if self.pathStartsWith(["project", "parent"]):
-      if len(self.path) == 3:
-        self.dependency[self.path[-1]] = self.content.strip()
-      if len(self.path) == 2:
-        self.dependencies.append(self.dependency)
-        self.dependency = {}
 
-    if self.pathStartsWith(["project", "dependencies", "dependency", "exclusions", "exclusion"]):
-      if len(self.path) == 6:
-        self.dependency_exclude[self.path[-1]] = self.content.strip()
-      elif (len(self.path) == 5):
-        self.dependency_excludes.append(self.dependency_exclude)
-        self.dependency_exclude = {}
-    elif self.pathStartsWith(["project",  "dependencies", "dependency"]):
-      if len(self.path) == 4:
-        # Parse members of '<dependency>'
-        self.dependency[self.path[-1]] = self.content.strip()
-      elif len(self.path) == 3:
-        # end of <dependency> definition. Save it.
+class _ErrorLocator(Locator):
+  """Points a SAXParseException raised by one of the non-sax backends at the offending input."""
 
-        # override the 'exclusions' field with the array we built up
-        self.dependency['exclusions'] = self.dependency_excludes
-        self.dependency_excludes = []
-        self.dependencies.append(self.dependency)
-        self.dependency = {}
+  def __init__(self, system_id, line_number, column_number):
+    self._system_id = system_id
+    self._line_number = line_number
+    self._column_number = column_number
 
-    PomContentHandler.endElement(self, name)
+  def getSystemId(self):
+    return self._system_id
+
+  def getLineNumber(self):
+    return self._line_number
+
+  def getColumnNumber(self):
+    return self._column_number
 
 
-class PomHandlerManager(PomContentHandler):
+def _sax_parse(data, system_id, handler):
+  """Parses data with xml.sax, which is always available."""
+  input_source = xml.sax.xmlreader.InputSource(system_id)
+  input_source.setByteStream(StringIO(data))
+  xml.sax.parse(input_source, handler)
+
+
+def _expat_parse(data, system_id, handler):
+  """Parses data with pyexpat directly.
+
+  This is the parser xml.sax uses underneath, minus the python layers in between, and with
+  buffer_text on so that the handler sees each run of text as a single chunk.
+  """
+  parser = expat.ParserCreate()
+  parser.buffer_text = True
+  parser.buffer_size = max(parser.buffer_size, len(data))
+  parser.StartElementHandler = lambda name, attrs: handler.startElement(name, AttributesImpl(attrs))
+  parser.EndElementHandler = handler.endElement
+  parser.CharacterDataHandler = handler.characters
+  handler.startDocument()
+  try:
+    parser.Parse(data, True)
+  except expat.ExpatError as e:
+    # The same error xml.sax would have raised.
+    raise xml.sax.SAXParseException(expat.ErrorString(e.code), e,
+                                    _ErrorLocator(system_id, e.lineno, e.offset))
+  handler.endDocument()
+
+
+def _lxml_qname(element):
+  """:returns: the name of the element as it is written in the xml, like xml.sax reports it."""
+  tag = element.tag
+  if tag.startswith('{'):
+    tag = tag[tag.index('}') + 1:]
+  return '{}:{}'.format(element.prefix, tag) if element.prefix else tag
+
+
+def _lxml_parse(data, system_id, handler):
+  """Parses data with lxml, when it is installed.
+
+  lxml only hands over the text of an element once the element has been read, so all of it is
+  passed on to the handler just before the endElement() call, where handlers read it.
+  """
+  handler.startDocument()
+  try:
+    for event, element in lxml_etree.iterparse(StringIO(data), events=('start', 'end')):
+      if event == 'start':
+        handler.startElement(_lxml_qname(element), AttributesImpl(dict(element.attrib)))
+      else:
+        if element.text:
+          handler.characters(element.text)
+        for child in element:
+          if child.tail:
+            handler.characters(child.tail)
+        handler.endElement(_lxml_qname(element))
+  except lxml_etree.XMLSyntaxError as e:
+    line_number, column_number = e.position
+    raise xml.sax.SAXParseException(e.msg, e, _ErrorLocator(system_id, line_number, column_number))
+  handler.endDocument()
+
+
+# The ways of feeding the contents of a pom.xml to a PomContentHandler, all with the same results.
+PARSE_BACKENDS = {
+  'sax': _sax_parse,
+  'expat': _expat_parse,
+}
+if lxml_etree is not None:
+  PARSE_BACKENDS['lxml'] = _lxml_parse
+
+
+class PomHandlerManager(_DispatchingContentHandler):
+  """Runs every GenericPomHandler over a single SAX pass of a pom.xml.
+
+  Use the cached factory method PomHandlerManager.parse() so that each pom.xml is only read once,
+  no matter how many of its infos are requested.
+  """
+
+  _cache = {}
+  # Optional PomParseCache used to skip parsing pom.xml files which were parsed by a previous run.
+  persistent_cache = None
+  # Name of the PARSE_BACKENDS entry used to parse pom.xml files. None picks lxml if it is
+  # installed, and xml.sax otherwise.
+  parse_backend = None
 
   def __init__(self, source_file_name):
-    PomContentHandler.__init__(self)
+    _DispatchingContentHandler.__init__(self)
     info_types = [
       WireInfo,
       SpecialPropertiesInfo,
@@ -268,19 +444,126 @@ class PomHandlerManager(PomContentHandler):
       JavaHomesInfo,
       ShadingInfo,
       JooqInfo,
+      DependencyListInfo,
+      DependencyManagementInfo,
+      ModulesInfo,
     ]
     self.source_file_name = source_file_name
     self.infos = { info_type: info_type() for info_type in info_types }
-    self.handlers = [info.create_content_handler(self) for info in self.infos.values()]
+    self._set_handlers([info.create_content_handler(self) for info in self.infos.values()])
 
-  def endElement(self, name):
-    for handler in self.handlers:
-      handler.endElement(name)
+  @classmethod
+  def reset(cls):
+    cls._cache = {}
 
-    PomContentHandler.endElement(self, name)
+  @classmethod
+  def parse(cls, source_file_name, rootdir=None, ignore_missing=True):
+    """Returns the cached PomHandlerManager for the pom.xml, parsing it if necessary.
+
+    :param string source_file_name: path to the pom.xml, relative to rootdir if it is specified.
+    :param string rootdir: root directory of the repo.
+    :param bool ignore_missing: if True, return None for a pom.xml that can't be read instead of
+      raising an IOError.
+    :rtype: PomHandlerManager
+    """
+    full_source_path = source_file_name
+    if rootdir:
+      full_source_path = os.path.join(rootdir, full_source_path)
+    key = os.path.normpath(full_source_path)
+    if key not in cls._cache:
+      Profiler.increment('pom_handler_manager.misses')
+      try:
+        with open(full_source_path) as source:
+          data = source.read()
+      except IOError:
+        cls._cache[key] = None
+      else:
+        Profiler.increment('fs.files_read')
+        Profiler.increment('fs.bytes_read', len(data))
+        cls._cache[key] = cls._parse_data(source_file_name, full_source_path, data)
+    else:
+      Profiler.increment('pom_handler_manager.hits')
+    if cls._cache[key] is None and not ignore_missing:
+      raise IOError('Unable to read pom file {}'.format(full_source_path))
+    return cls._cache[key]
+
+  @classmethod
+  def _parse_function(cls):
+    if cls.parse_backend is None:
+      return PARSE_BACKENDS.get('lxml', _sax_parse)
+    try:
+      return PARSE_BACKENDS[cls.parse_backend]
+    except KeyError:
+      raise ValueError('Unknown pom parse backend {name}, expected one of {names}.'
+                       .format(name=cls.parse_backend, names=', '.join(sorted(PARSE_BACKENDS))))
+
+  @classmethod
+  def _parse_data(cls, source_file_name, full_source_path, data):
+    """Parses the contents of a pom.xml, or loads the results from the persistent cache."""
+    pom_handler = cls(source_file_name)
+    persistent_cache = cls.persistent_cache
+    if persistent_cache:
+      # Profiles activated by <os><name> depend on the platform the pom.xml is parsed on.
+      cache_key = sha1(b'{}\0{}'.format(sys.platform, data)).hexdigest()
+      state = persistent_cache.get(cache_key)
+      if state is not None:
+        Profiler.increment('pom_parse_cache.hits')
+        pom_handler._restore_state(state)
+        return pom_handler
+      Profiler.increment('pom_parse_cache.misses')
+
+    Profiler.increment('xml.parses')
+    Profiler.increment('xml.bytes_parsed', len(data))
+    try:
+      cls._parse_function()(data, full_source_path, pom_handler)
+    except xml.sax.SAXParseException as e:
+      raise MalformattedPOMException(source_file_name, e)
+
+    if persistent_cache:
+      persistent_cache.put(cache_key, pom_handler._cacheable_state())
+    return pom_handler
+
+  def _cacheable_state(self):
+    """:returns: the results of the parse, in a form that can be pickled."""
+    return {
+      'artifactId': self.artifactId,
+      'groupId': self.groupId,
+      'parent': self.parent,
+      'properties': self.properties,
+      'infos': self.infos,
+    }
+
+  def _restore_state(self, state):
+    """Restores the results of a previous parse from the output of _cacheable_state()."""
+    self.artifactId = state['artifactId']
+    self.groupId = state['groupId']
+    self.parent = state['parent']
+    self.properties = state['properties']
+    self.infos = state['infos']
+    self.handlers = []
+
+  @property
+  def dependencies(self):
+    """Raw <project><dependencies> entries, preceded by the <parent> coordinates."""
+    return self.infos[DependencyListInfo].dependencies
+
+  @property
+  def dependency_management(self):
+    """Raw <project><dependencyManagement><dependencies> entries."""
+    return self.infos[DependencyManagementInfo].dependency_management
+
+  @property
+  def modules(self):
+    """Contents of the <project><modules> tag."""
+    return self.infos[ModulesInfo].modules
 
 
 class GenericPomHandler(object):
+  # Paths of the elements whose endElement() this handler needs, along with all the elements below
+  # them. The default, the empty path, gets every element and makes the parser collect the text of
+  # the whole pom, so the handlers run by PomHandlerManager all narrow it down.
+  path_prefixes = ([],)
+
   def __init__(self, parent):
     self.parent = parent
 
@@ -298,12 +581,12 @@ class GenericPomHandler(object):
   def content(self):
     return self.parent.content
 
+  def endDocument(self):
+    """Invoked once the whole pom.xml has been read."""
+
 
 class GenericPomInfo(object):
   __metaclass__ = ABCMeta
-  # Dict which maps class names to dicts which map pom files to infos.
-  # I.e., { type -> { pom_file -> pom_info } }.
-  _ALL_CACHES = defaultdict(dict)
 
   class MissingInfoError(Exception):
     """Raised when a GenericPomInfo subclass instance is requested, but never created.
@@ -316,36 +599,276 @@ class GenericPomInfo(object):
   def create_content_handler(self, parent):
     """Creates a generic pom handler instance for this info."""
 
-  @classmethod
-  def get_cache(cls):
-    return cls._ALL_CACHES[cls]
-
   @classmethod
   def reset(cls):
-    cls._ALL_CACHES.clear()
+    PomHandlerManager.reset()
 
   @classmethod
   def from_pom(cls, source_file_name, rootdir=None):
-    key = (source_file_name, rootdir)
-    if key in cls.get_cache():
-      return cls.get_cache()[key]
-    pom_handler = PomHandlerManager(source_file_name)
-    full_source_path = source_file_name
-    if rootdir:
-      full_source_path = os.path.join(rootdir, full_source_path)
-    try:
-      with open(full_source_path) as source:
-        xml.sax.parse(source, pom_handler)
-    except IOError:
+    pom_handler = PomHandlerManager.parse(source_file_name, rootdir)
+    if pom_handler is None:
       return None
-    except xml.sax.SAXParseException as e:
-      raise MalformattedPOMException(source_file_name, e)
-
-    for info_type, info in pom_handler.infos.items():
-      cls._ALL_CACHES[info_type][key] = info
-    if key not in cls.get_cache():
+    if cls not in pom_handler.infos:
       raise cls.MissingInfoError('PomHandler has no {}!'.format(cls.__name__))
-    return cls.get_cache()[key]
+    return pom_handler.infos[cls]
+
+
+def _intern(value):
+  return intern(value) if type(value) is str else value
+
+
+class Dependency(object):
+  """An immutable <dependency> entry of a pom.xml (or an <exclusion> in one, or the <parent>).
+
+  Reads like the dict of its child elements' text, eg dep['artifactId'] or dep.get('scope'), with
+  the <exclusion> entries in a tuple under 'exclusions'. The same coordinates show up in hundreds
+  of poms, so the groupId, artifactId and version strings are interned, which also makes comparing
+  dependency keys cheap. Being immutable, entries inherited from a parent pom are shared with it
+  instead of copied.
+  """
+
+  __slots__ = ('groupId', 'artifactId', 'version', 'exclusions', '_others')
+
+  # Children with a slot of their own, which are None when the element is absent.
+  _FIELDS = ('groupId', 'artifactId', 'version', 'exclusions')
+
+  def __init__(self, groupId=None, artifactId=None, version=None, exclusions=None, others=()):
+    """
+    :param exclusions: the <exclusion> entries, or None for entries without an <exclusions> list,
+      like the <parent>.
+    :param others: (name, text) pairs for the remaining child elements, eg ('scope', 'test').
+    """
+    setattr_ = super(Dependency, self).__setattr__
+    setattr_('groupId', _intern(groupId))
+    setattr_('artifactId', _intern(artifactId))
+    setattr_('version', _intern(version))
+    setattr_('exclusions', None if exclusions is None else tuple(exclusions))
+    setattr_('_others', tuple(sorted(others)))
+
+  @classmethod
+  def from_dict(cls, entry):
+    """:param dict entry: the text of the child elements of a <dependency>, by element name."""
+    exclusions = entry.get('exclusions')
+    if exclusions is not None:
+      exclusions = [exclusion if isinstance(exclusion, Dependency) else cls.from_dict(exclusion)
+                    for exclusion in exclusions]
+    return cls(entry.get('groupId'), entry.get('artifactId'), entry.get('version'), exclusions,
+               [(name, value) for name, value in entry.items() if name not in cls._FIELDS])
+
+  @property
+  def key(self):
+    """The (groupId, artifactId) pair a pom declares a dependency on."""
+    return self.groupId, self.artifactId
+
+  def substituted(self, symbols):
+    """:returns: this entry with the ${...} references in its text replaced from symbols.
+
+    That is the entry itself when it doesn't have any references left, as is usually the case for
+    the entries inherited from a parent pom, which were already resolved against its properties.
+    """
+    def has_reference(value):
+      return isinstance(value, basestring) and '${' in value
+
+    def substitute(value):
+      return GenerationUtils.symbol_substitution(symbols, value) if has_reference(value) else value
+
+    if not (has_reference(self.groupId) or has_reference(self.artifactId)
+            or has_reference(self.version)
+            or any(has_reference(value) for name, value in self._others)):
+      return self
+    return Dependency(substitute(self.groupId), substitute(self.artifactId),
+                      substitute(self.version), self.exclusions,
+                      [(name, substitute(value)) for name, value in self._others])
+
+  def __setattr__(self, name, value):
+    raise AttributeError('Dependency entries are immutable.')
+
+  def __getitem__(self, name):
+    if name in self._FIELDS:
+      value = getattr(self, name)
+      if value is not None:
+        return value
+    else:
+      for other_name, value in self._others:
+        if other_name == name:
+          return value
+    raise KeyError(name)
+
+  def get(self, name, default=None):
+    try:
+      return self[name]
+    except KeyError:
+      return default
+
+  def __contains__(self, name):
+    try:
+      self[name]
+    except KeyError:
+      return False
+    return True
+
+  has_key = __contains__
+
+  def keys(self):
+    return ([name for name in self._FIELDS if getattr(self, name) is not None] +
+            [name for name, value in self._others])
+
+  def items(self):
+    return [(name, self[name]) for name in self.keys()]
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __len__(self):
+    return len(self.keys())
+
+  def _astuple(self):
+    return self.groupId, self.artifactId, self.version, self.exclusions, self._others
+
+  def __hash__(self):
+    return hash(self._astuple())
+
+  def __eq__(self, other):
+    if isinstance(other, Dependency):
+      return self._astuple() == other._astuple()
+    if isinstance(other, dict):
+      # Normalized the same way, so exclusions given as a list of dicts still compare equal.
+      return (set(self.keys()) == set(other.keys())
+              and self._astuple() == Dependency.from_dict(other)._astuple())
+    return NotImplemented
+
+  def __ne__(self, other):
+    equal = self.__eq__(other)
+    return equal if equal is NotImplemented else not equal
+
+  def __repr__(self):
+    return 'Dependency({!r})'.format(dict(self.items()))
+
+  def __reduce__(self):
+    return Dependency, self._astuple()
+
+
+class DependencyListInfo(GenericPomInfo):
+  """Holds the raw <dependency> entries of a pom, before any property substitution."""
+
+  def __init__(self):
+    # List of Dependency entries, starting with the <parent> pom if there is one.
+    self.dependencies = []
+
+  def create_content_handler(self, parent):
+    return DependencyListHandler(parent, self)
+
+
+class DependencyListHandler(GenericPomHandler):
+  """Finds <project><dependencies> entries, and the <parent> pom as an implicit dependency."""
+
+  path_prefixes = (['project', 'parent'], ['project', 'dependencies', 'dependency'])
+
+  def __init__(self, parent, info):
+    """:param DependencyListInfo info: info object to populate."""
+    super(DependencyListHandler, self).__init__(parent)
+    self.info = info
+    self.dependency = {}
+    self.dependency_excludes = []
+    self.dependency_exclude = {}
+
+  def endElement(self, name):
+    # Add the parent pom as one of the dependencies
+    if self.pathStartsWith(["project", "parent"]):
+      if len(self.path) == 3:
+        self.dependency[self.path[-1]] = self.content.strip()
+      if len(self.path) == 2:
+        self.info.dependencies.append(Dependency.from_dict(self.dependency))
+        self.dependency = {}
+
+    if self.pathStartsWith(["project", "dependencies", "dependency", "exclusions", "exclusion"]):
+      if len(self.path) == 6:
+        self.dependency_exclude[self.path[-1]] = self.content.strip()
+      elif (len(self.path) == 5):
+        self.dependency_excludes.append(self.dependency_exclude)
+        self.dependency_exclude = {}
+    elif self.pathStartsWith(["project",  "dependencies", "dependency"]):
+      if len(self.path) == 4:
+        # Parse members of '<dependency>'
+        self.dependency[self.path[-1]] = self.content.strip()
+      elif len(self.path) == 3:
+        # end of <dependency> definition. Save it.
+
+        # override the 'exclusions' field with the array we built up
+        self.dependency['exclusions'] = self.dependency_excludes
+        self.dependency_excludes = []
+        self.info.dependencies.append(Dependency.from_dict(self.dependency))
+        self.dependency = {}
+
+
+class DependencyManagementInfo(GenericPomInfo):
+  """Holds the raw <dependencyManagement> entries of a pom, before any property substitution."""
+
+  def __init__(self):
+    # List of Dependency entries.
+    self.dependency_management = []
+
+  def create_content_handler(self, parent):
+    return DependencyManagementHandler(parent, self)
+
+
+class DependencyManagementHandler(GenericPomHandler):
+  """Finds <project><dependencyManagement><dependencies> entries."""
+
+  path_prefixes = (['project', 'dependencyManagement', 'dependencies', 'dependency'],)
+
+  def __init__(self, parent, info):
+    """:param DependencyManagementInfo info: info object to populate."""
+    super(DependencyManagementHandler, self).__init__(parent)
+    self.info = info
+    # Temporary storage for data parsed from sub-elements
+    self._dependency = {}
+    self._dependency_excludes = []
+    self._dependency_exclude = {}
+
+  def endElement(self, name):
+    if self.pathStartsWith(["project", "dependencyManagement", "dependencies", "dependency", "exclusions", "exclusion"]):
+      if len(self.path) == 7:
+        self._dependency_exclude[self.path[-1]] = self.content.strip()
+      elif (len(self.path) == 6):
+        self._dependency_excludes.append(self._dependency_exclude)
+        self._dependency_exclude = {}
+    elif self.pathStartsWith(["project", "dependencyManagement", "dependencies", "dependency"]):
+      # Parse 'dependencies' under the 'dependencyManagement' tag
+      if len(self.path) == 5:
+        self._dependency[self.path[-1]] = self.content.strip()
+      elif len(self.path) == 4:
+        # end of <dependency> definition. Save it.
+
+        # override the 'exclusions' field with the array we built up
+        self._dependency['exclusions'] = self._dependency_excludes
+        self._dependency_excludes = []
+        self.info.dependency_management.append(Dependency.from_dict(self._dependency))
+        self._dependency = {}
+
+
+class ModulesInfo(GenericPomInfo):
+  """Holds the <module> definitions of an aggregator pom (e.g. the top level pom.xml)."""
+
+  def __init__(self):
+    self.modules = []
+
+  def create_content_handler(self, parent):
+    return ModulesHandler(parent, self)
+
+
+class ModulesHandler(GenericPomHandler):
+
+  path_prefixes = (['project', 'modules', 'module'],)
+
+  def __init__(self, parent, info):
+    """:param ModulesInfo info: info object to populate."""
+    super(ModulesHandler, self).__init__(parent)
+    self.info = info
+
+  def endElement(self, name):
+    if self.path == ["project", "modules", "module"]:
+      self.info.modules.append(self.content.strip())
 
 
 class WireInfo(GenericPomInfo):
@@ -369,6 +892,9 @@ class WireInfo(GenericPomInfo):
 class WirePomHandler(GenericPomHandler):
   """Finds relevant data for wire generation."""
 
+  _PLUGIN_PREFIX = ['project', 'build', 'plugins', 'plugin']
+  path_prefixes = (_PLUGIN_PREFIX,)
+
   def __init__(self, parent, info):
     """:param WireInfo info: info object to populate."""
     super(WirePomHandler, self).__init__(parent)
@@ -378,6 +904,8 @@ class WirePomHandler(GenericPomHandler):
     self.unpack_artifactId = None
 
   def endElement(self, name):
+    if not self.pathStartsWith(self._PLUGIN_PREFIX):
+      return
     if self.pathStartsWith(['project', 'build', 'plugins', 'plugin', 'executions', 'execution',
                             'configuration', 'artifactItems', 'artifactItem']):
       if self.pathEndsWith(['groupId']):
@@ -429,6 +957,8 @@ class SpecialPropertiesInfo(GenericPomInfo):
 
 class SpecialPropertiesHandler(GenericPomHandler):
 
+  path_prefixes = (['project', 'profiles', 'profile'],)
+
   def __init__(self, parent, info):
     """:param SpecialPropertiesInfo info: info object to populate."""
     super(SpecialPropertiesHandler, self).__init__(parent)
@@ -479,6 +1009,9 @@ class SignedJarInfo(GenericPomInfo):
 
 class SignedJarHandler(GenericPomHandler):
 
+  path_prefixes = (['project', 'build', 'plugins', 'plugin', 'executions'],
+                   ['project', 'profiles', 'profile', 'build', 'plugins', 'plugin', 'executions'])
+
   def __init__(self, parent, info):
     """:param SignedJarInfo info: info object to populate."""
     super(SignedJarHandler, self).__init__(parent)
@@ -541,6 +1074,7 @@ class JavaOptionsHandler(GenericPomHandler):
   _SUREFIRE_PLUGIN = ('org.apache.maven.plugins', 'maven-surefire-plugin')
   _TEST_ENV_VARS = _PLUGIN_PREFIX + ['configuration', 'environmentVariables']
   _TEST_JVM_ARG = _PLUGIN_PREFIX + ['configuration', 'argLine']
+  path_prefixes = (_PLUGIN_PREFIX,)
 
   def __init__(self, parent, info):
     """:param JavaOptionsInfo info: info object to populate."""
@@ -597,6 +1131,7 @@ class JavaHomesHandler(GenericPomHandler):
   prefix = ['project', 'profiles', 'profile']
   path_os = prefix + ['activation', 'os', 'name']
   java_home_pattern = re.compile(r'^java[0-9]+[.]home$')
+  path_prefixes = (prefix,)
 
   def __init__(self, parent, info):
     """:param JavaHomesInfo info: info object to populate."""
@@ -665,6 +1200,10 @@ class ShadingInfo(GenericPomInfo):
     def __ne__(self, other):
       return not self.__eq__(other)
 
+    def __reduce__(self):
+      # Nested classes can't be pickled by name in python 2.
+      return _shading_rule, tuple(self)
+
   def __init__(self):
     self.rules = []
 
@@ -672,6 +1211,10 @@ class ShadingInfo(GenericPomInfo):
     return ShadingHandler(parent, self)
 
 
+def _shading_rule(from_pattern, to_pattern):
+  return ShadingInfo.Rule(from_pattern, to_pattern)
+
+
 class ShadingHandler(GenericPomHandler):
 
   path_prefix = ['project', 'build', 'plugins', 'plugin']
@@ -683,6 +1226,7 @@ class ShadingHandler(GenericPomHandler):
   path_relocate_from = path_relocate_prefix + ['pattern']
   path_relocate_to = path_relocate_prefix + ['shadedPattern']
   plugin_id = ('com.squareup.maven.plugins', 'shade-plugin')
+  path_prefixes = (path_prefix,)
 
   class Plugin(object):
     def __init__(self):
@@ -743,6 +1287,13 @@ class JooqInfo(GenericPomInfo):
     self.config_tree = None
     self.skip_setup = False
 
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    # JooqPomHandler registers the pom's namespace while parsing, so that the config tree is
+    # written back out without namespace prefixes. Do the same when loading a cached parse.
+    if self.config_tree is not None and self.config_tree.tag.startswith('{'):
+      ElementTree.register_namespace('', self.config_tree.tag[1:self.config_tree.tag.index('}')])
+
   def create_content_handler(self, parent):
     return JooqPomHandler(parent, self)
 
@@ -757,6 +1308,7 @@ class JooqPomHandler(GenericPomHandler):
   _path_configuration_skip = _path_configuration + ['skip']
   _plugin_id = ('org.jooq', 'jooq-codegen-maven')
   _sql_plugin_id = ('org.codehaus.mojo', 'sql-maven-plugin')
+  path_prefixes = (prefix,)
 
   def __init__(self, parent, info):
     """:param JooqInfo info: info object to populate."""
@@ -819,51 +1371,34 @@ class DependencyInfo(object):
     self._parse(source_file_name, rootdir)
 
   def _parse(self, source_file_name, rootdir):
-    pomHandler = _DFPomContentHandler()
-    if rootdir:
-      full_source_path = os.path.join(rootdir, source_file_name)
-    else:
-      full_source_path = source_file_name
-
-    if os.path.basename(full_source_path) != 'pom.xml':
-      full_source_path = os.path.join(full_source_path, 'pom.xml')
+    if os.path.basename(source_file_name) != 'pom.xml':
+      source_file_name = os.path.join(source_file_name, 'pom.xml')
 
-    try:
-      with open(full_source_path) as source:
-        xml.sax.parse(source, pomHandler)
-    except IOError:
+    pomHandler = PomHandlerManager.parse(source_file_name, rootdir)
+    if pomHandler is None:
       # assume this file has been removed for a good reason and just continue normally
       return
-    except xml.sax.SAXParseException as e:
-      raise MalformattedPOMException(source_file_name, e)
 
     self._artifactId = pomHandler.artifactId
     self._groupId = pomHandler.groupId
     self._parent = pomHandler.parent
 
-    # Since dependencies are just dicts, we keep track of keys separately.  Maybe in the future
-    # it would be good to create a Dependency data structure and return a set or ordered dictionary
-    # of those instances instead.
     dep_keys = set()
     for dep in pomHandler.dependencies:
-      if 'groupId' in dep and 'artifactId' in dep:
-        dep_keys.add('{0} {1}'.format(dep['groupId'], dep['artifactId']))
+      if dep.groupId is not None and dep.artifactId is not None:
+        dep_keys.add(dep.key)
         self._dependencies.append(dep)
 
     parent_df = self.parent
     if parent_df:
-      for dep in parent_df.dependencies:
-        key = '{0} {1}'.format(dep['groupId'], dep['artifactId'])
-        # dependencies declared in parent poms can be overridden
-        if key not in dep_keys:
-          self._dependencies.append(dep)
+      # dependencies declared in parent poms can be overridden. The rest are shared with the parent.
+      self._dependencies.extend(dep for dep in parent_df.dependencies if dep.key not in dep_keys)
       self._properties.update(parent_df.properties)
 
     self._properties.update(pomHandler.properties)
     for key, value in self._properties.items():
       self._properties[key] = GenerationUtils.symbol_substitution(self._properties, value)
-    self._dependencies = GenerationUtils.symbol_substitution_on_dicts(self._properties,
-                                                                      self._dependencies)
+    self._dependencies = [dep.substituted(self._properties) for dep in self._dependencies]
 
   @property
   def source_file_name(self):
@@ -910,7 +1445,7 @@ class DependencyInfo(object):
 
   @property
   def dependencies(self):
-    """An array of dictionaries with contents of <project><dependencies><dependency> tags."""
+    """A list of the Dependency entries from <project><dependencies><dependency> tags."""
     return self._dependencies
 
 
@@ -932,7 +1467,10 @@ class CachedDependencyInfos(object):
       key = source_file_name
 
     if key not in cls.cached_dfs:
+      Profiler.increment('cached_dependency_infos.misses')
       cls.cached_dfs[key] = DependencyInfo(source_file_name, rootdir=rootdir)
+    else:
+      Profiler.increment('cached_dependency_infos.hits')
     return cls.cached_dfs[key]
 
 
@@ -953,19 +1491,16 @@ class DependencyManagementFinder():
 
   def find_dependencies(self, source_file_name):
     """Process a pom.xml file containing the <dependencyManagement> tag.
-       Returns an array of dictionaries containing the children of the <dependency> tag.
+       Returns a list of the Dependency entries for the children of the <dependency> tag.
     """
-    if source_file_name in DependencyManagementFinder._cache:
-      return DependencyManagementFinder._cache[source_file_name]
-    if self._rootdir:
-      source_file_name = os.path.join(self._rootdir, source_file_name)
-    pomHandler = _DMFPomContentHandler()
-    with open(source_file_name) as source:
-      xml.sax.parse(source, pomHandler)
-    source.close()
-    return GenerationUtils.symbol_substitution_on_dicts(pomHandler.properties,
-                                                        pomHandler.dependency_management)
-
+    key = (source_file_name, self._rootdir)
+    if key in DependencyManagementFinder._cache:
+      return DependencyManagementFinder._cache[key]
+    pomHandler = PomHandlerManager.parse(source_file_name, self._rootdir, ignore_missing=False)
+    dependencies = [dep.substituted(pomHandler.properties)
+                    for dep in pomHandler.dependency_management]
+    DependencyManagementFinder._cache[key] = dependencies
+    return dependencies
 
 
 class PomProvidesTarget():
@@ -1032,9 +1567,14 @@ class PomProvidesTarget():
 class DepsFromPom():
   """ Given a module's pom.xml file, pull out the list of dependencies formatted for using a pants BUILD file"""
 
-  def __init__(self, pom_provides_target, rootdir=None, exclude_project_targets=None):
-    """:param string rootdir: root directory of the repo to analyze"""
+  def __init__(self, pom_provides_target, rootdir=None, exclude_project_targets=None,
+               generated_file_names=None):
+    """:param string rootdir: root directory of the repo to analyze
+    :param generated_file_names: names of generated files, which don't count as sources when looking
+      for local targets.
+    """
     self.exclude_project_targets = exclude_project_targets or []
+    self.generated_file_names = generated_file_names or ()
     self.target = ""
     self.artifact_id = ""
     self.group_id = ""
@@ -1081,7 +1621,7 @@ class DepsFromPom():
     """
     # When targets is empty, we assume we could not build the list and thus just don't do anything.
     target_prefix = os.path.join(project_root, target_prefix)
-    targets = LocalTargets.get(project_root)
+    targets = LocalTargets.get(project_root, ignored_names=self.generated_file_names)
 
     # order is important in the list below. if java:lib exists, it will depend on the others.
     # proto:proto will depend on resources if they exist.
@@ -1095,16 +1635,15 @@ class DepsFromPom():
     # HACK This is horrible but works around a circular dependency.
     from pom_utils import PomUtils
     pants_refs = []
+    classified_deps = []
     for dep in deps:
       dep_target = "{groupId}.{artifactId}".format(groupId=dep['groupId'],
                                                    artifactId=dep['artifactId'])
-      if PomUtils.is_local_dep(dep_target):
-        # find the POM that contains this artifact
-        poms = self._pom_provides_target.find_target(dep_target)
-        if len(poms) > 0:
-          project_root = os.path.dirname(poms[0])
-        else:
-          project_root = dep['artifactId']
+      classification, pom = PomUtils.classify_dep(dep_target, rootdir=self._rootdir)
+      classified_deps.append((dep, dep_target, classification))
+      if classification == PomUtils.LOCAL_DEP:
+        # the POM that contains this artifact
+        project_root = os.path.dirname(pom)
         if project_root in self.exclude_project_targets:
           continue
         if dep.has_key('type') and dep['type'] == 'test-jar':
@@ -1116,19 +1655,18 @@ class DepsFromPom():
           pants_refs.append("'{0}'".format(target_name))
 
     # Print 3rdparty dependencies after the local deps
-    for dep in deps:
-      dep_target = "{groupId}.{artifactId}".format(groupId=dep['groupId'],
-                                                   artifactId=dep['artifactId'])
-      if PomUtils.is_local_dep(dep_target):
+    for dep, dep_target, classification in classified_deps:
+      if classification == PomUtils.LOCAL_DEP:
         continue
-      is_in_thirdparty = PomUtils.is_third_party_dep(dep_target, rootdir=self._rootdir)
+      is_in_thirdparty = classification == PomUtils.THIRD_PARTY_DEP
       if is_in_thirdparty and not dep.get('exclusions'):
         logger.debug("dep_target {target} is not local".format(target=dep_target))
         pants_refs.append("'3rdparty:{target}'".format(target=dep_target))
         continue
-      if not dep.has_key('version'):
+      version = dep.get('version')
+      if version is None:
         if is_in_thirdparty:
-          dep['version'] = PomUtils.third_party_dep_targets(rootdir=self._rootdir)[dep_target]
+          version = PomUtils.third_party_dep_targets(rootdir=self._rootdir)[dep_target]
         else:
           raise Exception(
             "Expected artifact {artifactId} group {groupId} in pom {pom_file} to have a version."
@@ -1156,7 +1694,7 @@ class DepsFromPom():
       pants_refs.append(Target.jar.format(
         org=dep['groupId'],
         name=dep['artifactId'],
-        rev=dep['version'],
+        rev=version,
         classifier=classifier,
         type_=type_,
         url=dep_url,
@@ -1189,17 +1727,22 @@ class LocalTargets:
     cls._cache = {}
 
   @classmethod
-  def get(cls, project_root):
+  def get(cls, project_root, ignored_names=()):
     """:param project_root: path to the root of the project where the pom.xml is located
+    :param ignored_names: file names which don't make a directory a candidate, eg BUILD files left
+      by the previous run.
     :return: a set of all targets based on the presence of directories."""
 
     if cls._cache.has_key(project_root):
+      Profiler.increment('local_targets.hits')
       return cls._cache[project_root]
+    Profiler.increment('local_targets.misses')
 
     def is_candidate_dir(source_dir):
       if not os.path.isdir(source_dir):
         return False
-      files = os.listdir(source_dir)
+      Profiler.increment('fs.listdir')
+      files = [name for name in os.listdir(source_dir) if name not in ignored_names]
       if files:
         return True
       return False
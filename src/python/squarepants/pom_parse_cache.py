@@ -0,0 +1,145 @@
+# Persistent cache of parsed pom.xml files.
+#
+# Parsing every pom.xml in the repo is a large part of the time spent by checkpoms and
+# regenerate_all. The results of a parse only depend on the contents of the pom.xml and the code
+# parsing it, so they are stored on disk keyed by the sha1 of those and reused by later runs.
+
+import cPickle as pickle
+import inspect
+import logging
+import os
+import shutil
+import tempfile
+from hashlib import sha1
+
+import pom_handlers
+
+
+logger = logging.getLogger(__name__)
+
+
+class PomParseCache(object):
+  """Stores pickled parse results in a directory, one file per pom.xml sha1.
+
+  Entries are written atomically, so several processes (eg, regenerate_all --jobs) can share the
+  same cache directory. Call prune() once in a while to keep the directory under its size limit.
+  """
+
+  # Bump this whenever the format of cached parse results changes. Changes to the SOURCE_MODULES
+  # invalidate the cache by themselves.
+  VERSION = 2
+  DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+  # Modules whose code produces the cached parse results.
+  SOURCE_MODULES = (pom_handlers,)
+
+  _source_digests = {}
+
+  @classmethod
+  def source_digest(cls):
+    """:returns: the sha1 of the source of the SOURCE_MODULES, computed once per process."""
+    if cls.SOURCE_MODULES not in cls._source_digests:
+      digest = sha1()
+      for module in cls.SOURCE_MODULES:
+        try:
+          source = inspect.getsource(module)
+        except (IOError, TypeError):
+          # No source shipped, so go by the compiled module instead.
+          with open(module.__file__, 'rb') as f:
+            source = f.read()
+        digest.update(source)
+      cls._source_digests[cls.SOURCE_MODULES] = digest.hexdigest()
+    return cls._source_digests[cls.SOURCE_MODULES]
+
+  def __init__(self, cache_dir, max_bytes=None):
+    """
+    :param string cache_dir: directory to store cache entries under (eg .pants.d/pom-gen/parse-cache).
+    :param int max_bytes: size limit enforced by prune().
+    """
+    self._cache_dir = cache_dir
+    self._entries_dir = os.path.join(cache_dir,
+                                     'v{}-{}'.format(self.VERSION, self.source_digest()[:12]))
+    self._max_bytes = self.DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+    self.hits = 0
+    self.misses = 0
+
+  @property
+  def entries_dir(self):
+    return self._entries_dir
+
+  def _entry_path(self, key):
+    return os.path.join(self._entries_dir, key)
+
+  def get(self, key):
+    """:returns: the value stored for key, or None if there isn't a usable one."""
+    path = self._entry_path(key)
+    try:
+      with open(path, 'rb') as f:
+        value = pickle.load(f)
+    except IOError:
+      self.misses += 1
+      return None
+    except Exception as e:
+      # Corrupt or incompatible entry; it will be overwritten by put().
+      logger.debug('Ignoring unreadable pom parse cache entry {}: {}'.format(path, e))
+      self.misses += 1
+      return None
+    try:
+      # Mark the entry as recently used, so prune() evicts it last.
+      os.utime(path, None)
+    except OSError:
+      pass
+    self.hits += 1
+    return value
+
+  def put(self, key, value):
+    """Stores the value for key. Failures are logged and otherwise ignored."""
+    try:
+      if not os.path.exists(self._entries_dir):
+        os.makedirs(self._entries_dir)
+      fd, temp_path = tempfile.mkstemp(dir=self._entries_dir, prefix='.tmp-')
+      try:
+        with os.fdopen(fd, 'wb') as f:
+          pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, self._entry_path(key))
+      except:
+        os.remove(temp_path)
+        raise
+    except Exception as e:
+      logger.debug('Unable to write pom parse cache entry {}: {}'.format(key, e))
+
+  def prune(self):
+    """Removes entries written by other cache versions or other versions of the SOURCE_MODULES, and
+    evicts the least recently used entries until the cache fits in its size limit.
+    """
+    if not os.path.isdir(self._cache_dir):
+      return
+    for name in os.listdir(self._cache_dir):
+      path = os.path.join(self._cache_dir, name)
+      if path != self._entries_dir and os.path.isdir(path):
+        logger.debug('Removing outdated pom parse cache {}'.format(path))
+        shutil.rmtree(path, ignore_errors=True)
+    if not os.path.isdir(self._entries_dir):
+      return
+
+    entries = []
+    total_bytes = 0
+    for name in os.listdir(self._entries_dir):
+      path = os.path.join(self._entries_dir, name)
+      try:
+        stat = os.stat(path)
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, path))
+      total_bytes += stat.st_size
+    if total_bytes <= self._max_bytes:
+      return
+    entries.sort()
+    for _, size, path in entries:
+      if total_bytes <= self._max_bytes:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      total_bytes -= size
+    logger.debug('Pruned pom parse cache {} to {} bytes'.format(self._entries_dir, total_bytes))
@@ -1,7 +1,5 @@
 
 import logging
-import os
-import xml.sax
 
 from pom_handlers import *
 
@@ -19,8 +17,14 @@ class PomUtils(object):
      Keeps singletons for many of the handlers defined in pom_content_handlers.py.  Prefer
      using these factory methods for best performance.
   """
+  # Classifications returned by classify_dep().
+  LOCAL_DEP = 'local'
+  THIRD_PARTY_DEP = '3rdparty'
+  EXTERNAL_DEP = 'external'
+
   _DEPENDENCY_MANAGMENT_FINDER = None
   _LOCAL_DEP_TARGETS = None
+  _LOCAL_DEP_POMS = None
   _THIRD_PARTY_DEP_TARGETS = {}
   _TOP_POM_CONTENT_HANDLER = None
   _EXTERNAL_PROTOS_POM_CONTENT_HANDLER = None
@@ -31,6 +35,7 @@ class PomUtils(object):
     """Reset all the singleton instances. Useful for testing."""
     cls._DEPENDENCY_MANAGMENT_FINDER = None
     cls._LOCAL_DEP_TARGETS = None
+    cls._LOCAL_DEP_POMS = None
     cls._THIRD_PARTY_DEP_TARGETS = {}
     cls._TOP_POM_CONTENT_HANDLER = None
     cls._EXTERNAL_PROTOS_POM_CONTENT_HANDLER = None
@@ -66,6 +71,18 @@ class PomUtils(object):
         sorted(cls.pom_provides_target(rootdir=rootdir).targets())
     return cls._LOCAL_DEP_TARGETS
 
+  @classmethod
+  def local_dep_poms(cls, rootdir=None):
+    """:returns: a dict mapping the target names provided by poms defined in this repo to the path of
+      the pom.xml providing them.
+    :rtype: dict of string to string
+    """
+    if cls._LOCAL_DEP_POMS is None:
+      pom_provides_target = cls.pom_provides_target(rootdir=rootdir)
+      cls._LOCAL_DEP_POMS = dict((target, pom_provides_target.find_target(target)[0])
+                                 for target in pom_provides_target.targets())
+    return cls._LOCAL_DEP_POMS
+
   @classmethod
   def third_party_dep_targets(cls, rootdir=None):
     """:returns: the list of targets that will be defined in 3rdparty/BUILD.gen.
@@ -85,25 +102,25 @@ class PomUtils(object):
   @classmethod
   def top_pom_content_handler(cls, rootdir=None):
     """:returns: the singleton for the top level pom.xml parser so we only have to compute it once.
-    :rtype: TopPomContentHandler
+    :rtype: PomHandlerManager
     """
     if not cls._TOP_POM_CONTENT_HANDLER:
-      cls._TOP_POM_CONTENT_HANDLER = TopPomContentHandler()
-      if rootdir:
-        pathname = os.path.join(rootdir, "pom.xml")
-      else:
-        pathname = "pom.xml"
-      xml.sax.parse(pathname, cls._TOP_POM_CONTENT_HANDLER)
+      # If the pom.xml can't be read, the parse raises and later calls get this empty handler.
+      cls._TOP_POM_CONTENT_HANDLER = PomHandlerManager('pom.xml')
+      # Shares the parse with everything else reading the top pom.xml.
+      cls._TOP_POM_CONTENT_HANDLER = PomHandlerManager.parse('pom.xml', rootdir=rootdir,
+                                                             ignore_missing=False)
     return cls._TOP_POM_CONTENT_HANDLER
 
   @classmethod
   def external_protos_content_handler(cls):
     """:returns: the singleton PomContentHandler for parents/external-protos/pom.xml
-    :rtype: TopPomContentHandler
+    :rtype: PomHandlerManager
     """
     if not cls._EXTERNAL_PROTOS_POM_CONTENT_HANDLER:
-      cls._EXTERNAL_PROTOS_POM_CONTENT_HANDLER = TopPomContentHandler()
-      xml.sax.parse("parents/external-protos/pom.xml", cls._EXTERNAL_PROTOS_POM_CONTENT_HANDLER)
+      cls._EXTERNAL_PROTOS_POM_CONTENT_HANDLER = PomHandlerManager('parents/external-protos/pom.xml')
+      cls._EXTERNAL_PROTOS_POM_CONTENT_HANDLER = PomHandlerManager.parse(
+        'parents/external-protos/pom.xml', ignore_missing=False)
     return cls._EXTERNAL_PROTOS_POM_CONTENT_HANDLER
 
   @classmethod
@@ -116,6 +133,10 @@ class PomUtils(object):
   def common_usage(cls):
     """Print help for arguments parsed by parse_common_args()."""
     print "-l<level>  Turn on log level where <level> is one of DEBUG, INFO, WARNING, ERROR, CRITICAL"
+    print "--pom-parser=<name>"
+    print "           parse pom.xml files with <name>, one of: {names}".format(
+      names=', '.join(sorted(PARSE_BACKENDS)))
+    print "           (default lxml if it is installed, sax otherwise)"
 
   @classmethod
   def parse_common_args(cls, args):
@@ -135,6 +156,12 @@ class PomUtils(object):
           raise ArgParseError(
             "There is no logging level named '{level}'. Try DEBUG, INFO, WARNING, ERROR, CRITICAL"
             .format(level=level))
+      elif arg.startswith('--pom-parser='):
+        name = arg[len('--pom-parser='):]
+        if name not in PARSE_BACKENDS:
+          raise ArgParseError("There is no pom parser named '{name}'. Try {names}"
+                              .format(name=name, names=', '.join(sorted(PARSE_BACKENDS))))
+        PomHandlerManager.parse_backend = name
       else:
         unprocessed_args.append(arg)
     return unprocessed_args
@@ -144,7 +171,7 @@ class PomUtils(object):
     """:return: True for targets that exist in the local repo.
     :rtype: bool
     """
-    return target in cls.local_dep_targets()
+    return target in cls.local_dep_poms()
 
   @classmethod
   def is_third_party_dep(cls, target, rootdir=None):
@@ -158,4 +185,20 @@ class PomUtils(object):
     """:return: True if this is an external dep that should be declared in a local jar_library target.
     :rtype: bool
     """
-    return not (cls.is_local_dep(target) or cls.is_third_party_dep(target, rootdir))
+    return cls.classify_dep(target, rootdir=rootdir)[0] == cls.EXTERNAL_DEP
+
+  @classmethod
+  def classify_dep(cls, target, rootdir=None):
+    """Classifies a dependency in constant time.
+
+    :param string target: the dependency, as 'groupId.artifactId'.
+    :returns: a tuple of LOCAL_DEP, THIRD_PARTY_DEP or EXTERNAL_DEP, and the path of the pom.xml
+      providing the target (None unless it is a local dependency).
+    :rtype: tuple
+    """
+    pom = cls.local_dep_poms().get(target)
+    if pom is not None:
+      return cls.LOCAL_DEP, pom
+    if cls.is_third_party_dep(target, rootdir=rootdir):
+      return cls.THIRD_PARTY_DEP, None
+    return cls.EXTERNAL_DEP, None
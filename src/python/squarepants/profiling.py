@@ -0,0 +1,134 @@
+# Structured profiling for regenerate_all and checkpoms.
+#
+# Run either tool with --profile-json=<file> to record nested phase timings, per-module conversion
+# times and counters (xml parses, cache hits and misses, file system calls) to a JSON file.
+
+from contextlib import contextmanager
+from collections import defaultdict
+import json
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler(object):
+  """Collects timings and counters for the current process.
+
+  Profiling is off by default, in which case every method is a cheap no-op. Counters are named
+  '<area>.<what>'; pairs named '<cache>.hits' and '<cache>.misses' are also reported as a hit ratio.
+  """
+
+  enabled = False
+  counters = defaultdict(int)
+  module_durations = defaultdict(float)
+  _root = None
+  _stack = []
+
+  @classmethod
+  def reset(cls):
+    cls.counters = defaultdict(int)
+    cls.module_durations = defaultdict(float)
+    cls._root = cls._new_phase('total')
+    cls._stack = [cls._root]
+
+  @classmethod
+  def enable(cls):
+    cls.reset()
+    cls.enabled = True
+
+  @classmethod
+  def disable(cls):
+    cls.enabled = False
+
+  @staticmethod
+  def _new_phase(name):
+    return {'name': name, 'seconds': 0.0, 'calls': 0, 'children': []}
+
+  @classmethod
+  def increment(cls, name, amount=1):
+    if cls.enabled:
+      cls.counters[name] += amount
+
+  @classmethod
+  def merge_counters(cls, counters):
+    """Adds counters collected elsewhere (eg by a worker process) to this process's counters."""
+    if cls.enabled:
+      for name, value in counters.items():
+        cls.counters[name] += value
+
+  @classmethod
+  def record_module(cls, module, seconds):
+    if cls.enabled:
+      cls.module_durations[module] += seconds
+
+  @classmethod
+  @contextmanager
+  def phase(cls, name):
+    """Times the enclosed block as a child of the currently running phase.
+
+    Phases with the same name under the same parent are added together.
+    """
+    if not cls.enabled:
+      yield
+      return
+    parent = cls._stack[-1]
+    for node in parent['children']:
+      if node['name'] == name:
+        break
+    else:
+      node = cls._new_phase(name)
+      parent['children'].append(node)
+    cls._stack.append(node)
+    start = time.time()
+    try:
+      yield
+    finally:
+      node['seconds'] += time.time() - start
+      node['calls'] += 1
+      cls._stack.pop()
+
+  @classmethod
+  @contextmanager
+  def module(cls, module):
+    """Times the enclosed block as the conversion of module."""
+    if not cls.enabled:
+      yield
+      return
+    start = time.time()
+    try:
+      yield
+    finally:
+      cls.record_module(module, time.time() - start)
+
+  @classmethod
+  def cache_ratios(cls):
+    ratios = {}
+    for name, hits in cls.counters.items():
+      if not name.endswith('.hits'):
+        continue
+      cache = name[:-len('.hits')]
+      total = hits + cls.counters.get('{}.misses'.format(cache), 0)
+      if total:
+        ratios[cache] = float(hits) / total
+    return ratios
+
+  @classmethod
+  def to_dict(cls):
+    root = cls._root or cls._new_phase('total')
+    root['seconds'] = sum(child['seconds'] for child in root['children'])
+    root['calls'] = 1
+    modules = sorted(cls.module_durations.items(), key=lambda item: item[1], reverse=True)
+    return {
+      'phases': root,
+      'modules': [{'module': module, 'seconds': seconds} for module, seconds in modules],
+      'counters': dict(cls.counters),
+      'cache_hit_ratios': cls.cache_ratios(),
+    }
+
+  @classmethod
+  def write_json(cls, path):
+    with open(path, 'w') as f:
+      json.dump(cls.to_dict(), f, indent=2, sort_keys=True)
+    logger.info('Wrote profile to {path}'.format(path=path))
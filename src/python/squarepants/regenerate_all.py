@@ -4,20 +4,28 @@
 #
 
 import logging
+import multiprocessing
 import os
 import sys
 import time
 
-from pom_handlers import JavaHomesInfo
+from file_utils import find_files
+from pom_handlers import JavaHomesInfo, PomHandlerManager
+from pom_parse_cache import PomParseCache
 from pom_utils import PomUtils
 from pom_to_build import PomToBuild
 from generate_3rdparty import ThirdPartyBuildGenerator
 from generate_external_protos import ExternalProtosBuildGenerator
-from generation_context import GenerationContext
+from generation_context import DeferredGenerationContext, GenerationContext
+from profiling import Profiler
 
 logger = logging.getLogger(__name__)
 
 _MODULES_TO_SKIP = set(['parents/external-protos'])
+# Shares the checkpoms cache directory. Git branch names can't start with '.', so this can't collide
+# with the per-branch index directories stored there.
+_PARSE_CACHE_DIRECTORY = '.pants.d/pom-gen/.pom-parse-cache'
+_GENERATED_EXCLUDE_CONTAINS = ('/target/', '/.pants.d/', '/.git/')
 
 class Task(object):
   """Basically a souped-up lambda function which times itself running."""
@@ -42,7 +50,8 @@ class Task(object):
   def __call__(self):
     logger.debug('Starting {0}.'.format(self.name))
     start = time.time()
-    value = self.run()
+    with Profiler.phase(self.name):
+      value = self.run()
     end = time.time()
     self._time_taken = end - start
     logger.debug('Done with {name} (took {duration:0.03f} seconds).'.format(name=self.name,
@@ -50,18 +59,50 @@ class Task(object):
     return value
 
 
+def _convert_pom_deferred(args):
+  """Converts one pom in a worker process.
+
+  :param tuple args: the pom file name and the repo root.
+  :returns: the jvm platforms, BUILD file contents and other written files recorded by a
+    DeferredGenerationContext, the time taken and the profiling counters collected while converting
+    the pom.
+  :rtype: tuple
+  """
+  pom_file_name, rootdir = args
+  # Workers are forked with a copy of the parent's counters; only report what this pom adds.
+  Profiler.counters.clear()
+  context = DeferredGenerationContext()
+  start = time.time()
+  PomToBuild().convert_pom(pom_file_name, rootdir=rootdir, generation_context=context)
+  duration = time.time() - start
+  return (context.deferred_platforms, context.deferred_build_files, context.written_files, duration,
+          dict(Profiler.counters))
+
+
 class RegenerateAll(object):
-  def __init__(self, path, flags):
+  def __init__(self, path, flags, jobs=1):
     self.baseroot = path
     self.flags = flags
+    self.jobs = jobs
+    self.context = GenerationContext()
 
-  def _clean_generated_builds(self):
-    """Removes all generated BUILD files from the source diretory"""
-    logger.debug('Removing old generated BUILD.gen and BUILD.aux files')
-    os.system(
-      "find {root} \( -path '*/.pants.d/*' -prune -path '*/target/*' -prune \) "
-      " -o \( -name BUILD.gen -o -name BUILD.aux -o -name jooq_config.gen.xml \) | xargs rm -f"
-      .format(root=self.baseroot))
+  def _find_generated_files(self):
+    """Finds the BUILD.gen, BUILD.aux and jooq config files left by the previous run."""
+    return find_files([self.baseroot], self.context.generated_file_names,
+                      exclude_contains=_GENERATED_EXCLUDE_CONTAINS)
+
+  def _remove_stale_files(self, old_files):
+    """Removes generated files which this run didn't write, eg for modules which were removed."""
+    # old_files are found under the real path of the repo root.
+    written_files = set(os.path.realpath(path) for path in self.context.written_files)
+    stale_files = old_files - written_files
+    logger.debug('Removing {count} stale generated files'.format(count=len(stale_files)))
+    for path in stale_files:
+      try:
+        os.remove(path)
+      except OSError:
+        pass # Already gone.
+      Profiler.increment('fs.files_removed')
 
   def _generate_module_list_file(self):
     modules = PomUtils.get_modules()
@@ -77,17 +118,21 @@ class RegenerateAll(object):
     modules = PomUtils.get_modules()
     logger.debug('Re-generating {count} modules'.format(count=len(modules)))
     # Convert pom files to BUILD files
-    context = GenerationContext()
-    for module_name in modules:
-      if not module_name in _MODULES_TO_SKIP:
-        pom_file_name = os.path.join(module_name, 'pom.xml')
-        PomToBuild().convert_pom(pom_file_name, rootdir=self.baseroot, generation_context=context)
+    context = self.context
+    pom_file_names = [os.path.join(module_name, 'pom.xml') for module_name in modules
+                      if not module_name in _MODULES_TO_SKIP]
+    if self.jobs > 1:
+      self._convert_poms_in_parallel(pom_file_names, context)
+    else:
+      for pom_file_name in pom_file_names:
+        with Profiler.module(pom_file_name):
+          PomToBuild().convert_pom(pom_file_name, rootdir=self.baseroot, generation_context=context)
     context.os_to_java_homes = JavaHomesInfo.from_pom('parents/base/pom.xml',
                                                       self.baseroot).home_map
     # Write jvm platforms and distributions.
-    with open(context.generated_ini_file, 'w+') as f:
-      f.write('# Generated by regenerate_all.py. Do not hand-edit.\n\n')
-      f.write('\n'.join(context.get_pants_ini_gen()))
+    context.write_generated_file(context.generated_ini_file,
+                                 '# Generated by regenerate_all.py. Do not hand-edit.\n\n'
+                                 + '\n'.join(context.get_pants_ini_gen()))
 
     local_ini = 'pants-local.ini'
     if not os.path.exists(local_ini):
@@ -108,28 +153,63 @@ class RegenerateAll(object):
           '',
         ]))
 
+  def _convert_poms_in_parallel(self, pom_file_names, context):
+    """Converts poms across a pool of worker processes.
+
+    Results are merged back in module order, so the generated jvm platform names are the same as
+    for a serial run.
+    """
+    logger.debug('Converting poms with {jobs} jobs'.format(jobs=self.jobs))
+    pool = multiprocessing.Pool(self.jobs)
+    try:
+      work = [(pom_file_name, self.baseroot) for pom_file_name in pom_file_names]
+      results = pool.imap(_convert_pom_deferred, work)
+      for pom_file_name, result in zip(pom_file_names, results):
+        deferred_platforms, deferred_build_files, written_files, duration, counters = result
+        Profiler.record_module(pom_file_name, duration)
+        Profiler.merge_counters(counters)
+        context.merge_deferred(deferred_platforms, deferred_build_files, written_files)
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+
   def _regenerate_external_protos(self):
     logger.debug('Re-generating parents/external-protos/BUILD.gen')
-    with open('parents/external-protos/BUILD.gen', 'w') as build_file:
-      build_file.write(ExternalProtosBuildGenerator().generate())
+    self.context.write_generated_file('parents/external-protos/BUILD.gen',
+                                      ExternalProtosBuildGenerator().generate())
 
   def _regenerate_3rdparty(self):
     logger.debug('Re-generating 3rdparty/BUILD.gen')
-    with open('3rdparty/BUILD.gen', 'w') as build_file:
-      build_file.write(ThirdPartyBuildGenerator().generate())
+    self.context.write_generated_file('3rdparty/BUILD.gen', ThirdPartyBuildGenerator().generate())
+
+  def _enable_parse_cache(self):
+    PomHandlerManager.persistent_cache = PomParseCache(
+      os.path.join(self.baseroot, _PARSE_CACHE_DIRECTORY))
+
+  def _prune_parse_cache(self):
+    PomHandlerManager.persistent_cache.prune()
 
   def execute(self):
-    Task('clean_build_gen', self._clean_generated_builds)()
+    self._enable_parse_cache()
+    old_files = Task('find_generated_files', self._find_generated_files)()
     Task('generate_module_list_file', self._generate_module_list_file)()
     Task('convert_poms', self._convert_poms)()
     Task('regenerate_external_protos', self._regenerate_external_protos)()
     Task('regenerate_3rdparty', self._regenerate_3rdparty)()
+    Task('remove_stale_files', lambda: self._remove_stale_files(old_files))()
+    Task('prune_parse_cache', self._prune_parse_cache)()
 
 def usage():
   print "usage: {0} [args] ".format(sys.argv[0])
   print "Regenerates the BUILD.* files for the repo"
   print ""
   print "-?,-h         Show this message"
+  print "--jobs=<n>    convert poms using <n> worker processes (default 1)"
+  print "--profile-json=<file>"
+  print "              write phase timings, per-module times and counters to <file>"
   PomUtils.common_usage()
 
 def main():
@@ -143,18 +223,35 @@ def main():
 
   path = os.path.realpath(paths[0])
 
+  jobs = 1
+  profile_json = None
   for f in flags:
     if f == '-h' or f == '-?':
       usage()
       return
+    elif f.startswith('--jobs='):
+      try:
+        jobs = int(f[len('--jobs='):])
+      except ValueError:
+        jobs = 0
+      if jobs < 1:
+        print ("Invalid number of jobs in {0}".format(f))
+        usage()
+        return
+    elif f.startswith('--profile-json='):
+      profile_json = f[len('--profile-json='):]
     else:
       print ("Unknown flag {0}".format(f))
       usage()
       return
-  main_run = Task('main', lambda: RegenerateAll(path, flags).execute())
+  if profile_json:
+    Profiler.enable()
+  main_run = Task('main', lambda: RegenerateAll(path, flags, jobs=jobs).execute())
   main_run()
   logger.info('Regenerated BUILD files in {duration:0.3f} seconds.'
               .format(duration=main_run.duration))
+  if profile_json:
+    Profiler.write_json(profile_json)
 
 
 if __name__ == '__main__':
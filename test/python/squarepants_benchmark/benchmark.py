@@ -0,0 +1,233 @@
+#!/usr/bin/env python2.7
+#
+# Times the BUILD generation pipeline against a synthetic repo and writes the results as JSON.
+#
+# Run with:
+# ./pants run squarepants/src/test/python/squarepants_benchmark:benchmark -- --modules=200 \
+#   --output=benchmark.json
+#
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import signal
+import sys
+import time
+from timeit import default_timer
+
+from squarepants.checkpoms import CheckPoms
+from squarepants.file_utils import temporary_dir
+from squarepants.generate_3rdparty import ThirdPartyBuildGenerator
+from squarepants.generation_context import GenerationContext
+from squarepants.pom_file import PomFile
+from squarepants.pom_handlers import PomHandlerManager
+from squarepants.pom_utils import PomUtils
+from squarepants.regenerate_all import RegenerateAll
+
+from squarepants_benchmark.synthetic_repo import SyntheticRepo, SyntheticRepoConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+class Benchmark(object):
+  """Runs each phase of the pipeline against a synthetic repo and collects timings.
+
+  Every run starts from the in-memory state of a freshly started process, since that is how
+  checkpoms and regenerate_all are invoked. On-disk caches are cleared only by the "cold" runs.
+  """
+
+  BENCHMARKS = [
+    'regenerate_all_cold',
+    'regenerate_all_warm',
+    'checkpoms_cold',
+    'checkpoms_noop',
+    'checkpoms_edit',
+    'pom_parse',
+    'pom_file',
+    'generate_3rdparty',
+  ]
+
+  def __init__(self, repo, repeat=3, jobs=1):
+    """
+    :param SyntheticRepo repo: the repo to run against. It must already have been created.
+    :param int repeat: number of timed runs of each benchmark.
+    :param int jobs: passed through to regenerate_all --jobs.
+    """
+    self.repo = repo
+    self.repeat = repeat
+    self.jobs = jobs
+
+  @property
+  def root(self):
+    return self.repo.root
+
+  def _reset_process_state(self):
+    PomUtils.reset_caches()
+    PomHandlerManager.persistent_cache = None
+
+  def _clear_disk_caches(self):
+    shutil.rmtree(os.path.join(self.root, '.pants.d'), ignore_errors=True)
+
+  def _edited_module(self):
+    # Edit a module in the middle of the dependency order, so it has both dependencies and dependees.
+    modules = self.repo.module_names
+    return modules[len(modules) // 2]
+
+  def setup_regenerate_all_cold(self):
+    self._clear_disk_caches()
+
+  def run_regenerate_all_cold(self):
+    RegenerateAll(self.root, set(), jobs=self.jobs).execute()
+
+  def run_regenerate_all_warm(self):
+    RegenerateAll(self.root, set(), jobs=self.jobs).execute()
+
+  def setup_checkpoms_cold(self):
+    self._clear_disk_caches()
+
+  def run_checkpoms_cold(self):
+    CheckPoms(self.root, set()).execute()
+
+  def run_checkpoms_noop(self):
+    CheckPoms(self.root, set()).execute()
+
+  def setup_checkpoms_edit(self):
+    self.repo.touch_module_pom(self._edited_module())
+
+  def run_checkpoms_edit(self):
+    CheckPoms(self.root, set()).execute()
+
+  def run_pom_parse(self):
+    # Parses with the full set of handlers that PomHandlerManager dispatches to, but without the
+    # inheritance and BUILD generation that PomFile adds on top.
+    for module in self.repo.module_names:
+      PomHandlerManager.parse(self.repo.module_pom(module), rootdir=self.root)
+
+  def run_pom_file(self):
+    for module in self.repo.module_names:
+      PomFile(self.repo.module_pom(module), self.root, GenerationContext())
+
+  def run_generate_3rdparty(self):
+    ThirdPartyBuildGenerator().generate()
+
+  def _time(self, name):
+    setup = getattr(self, 'setup_{}'.format(name), lambda: None)
+    run = getattr(self, 'run_{}'.format(name))
+    timings = []
+    for _ in range(self.repeat):
+      setup()
+      self._reset_process_state()
+      start = default_timer()
+      run()
+      timings.append(default_timer() - start)
+    logger.info('{name}: min {min:0.3f}s over {repeat} runs'.format(name=name, min=min(timings),
+                                                                  repeat=self.repeat))
+    return {
+      'name': name,
+      'runs': timings,
+      'min': min(timings),
+      'max': max(timings),
+      'mean': sum(timings) / len(timings),
+    }
+
+  def run(self, names=None):
+    """Runs the benchmarks in order.
+
+    :param list names: names of the benchmarks to run, defaults to all of BENCHMARKS.
+    :returns: one dict of timings (in seconds) per benchmark.
+    :rtype: list of dict
+    """
+    names = names or self.BENCHMARKS
+    cwd = os.getcwd()
+    # CheckPoms installs its own Ctrl-C handler, which cleans up the synthetic repo's index.
+    sigint_handler = signal.getsignal(signal.SIGINT)
+    # All the tools expect to be run from the root of the repo.
+    os.chdir(self.root)
+    try:
+      return [self._time(name) for name in names]
+    finally:
+      os.chdir(cwd)
+      signal.signal(signal.SIGINT, sigint_handler)
+      self._reset_process_state()
+
+
+def run_benchmarks(config, repeat=3, jobs=1, names=None, workdir=None):
+  """Creates a synthetic repo for config and benchmarks it.
+
+  :param SyntheticRepoConfig config: the shape of the repo to generate.
+  :param string workdir: directory to create the repo in. Defaults to a temporary directory which
+    is removed afterwards.
+  :returns: the results, in the format written by main().
+  :rtype: dict
+  """
+  def benchmark(root):
+    repo = SyntheticRepo(os.path.realpath(root), config)
+    repo.create()
+    return Benchmark(repo, repeat=repeat, jobs=jobs).run(names)
+
+  if workdir:
+    results = benchmark(workdir)
+  else:
+    with temporary_dir() as root:
+      results = benchmark(root)
+  return {
+    'timestamp': time.time(),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'config': config.to_dict(),
+    'repeat': repeat,
+    'jobs': jobs,
+    'results': results,
+  }
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser('Benchmark BUILD file generation against a synthetic repo.')
+  defaults = SyntheticRepoConfig()
+  parser.add_argument('--modules', type=int, default=defaults.modules,
+                      help='Number of modules in the synthetic repo.')
+  parser.add_argument('--fanout', type=int, default=defaults.fanout,
+                      help='Number of local and of 3rdparty dependencies per module.')
+  parser.add_argument('--parent-depth', type=int, default=defaults.parent_depth,
+                      help='Number of parent poms between each module and parents/base.')
+  parser.add_argument('--profiles', type=int, default=defaults.profiles,
+                      help='Number of <profile> blocks per module pom.')
+  parser.add_argument('--plugins', type=int, default=defaults.plugins,
+                      help='Number of <plugin> blocks per module pom.')
+  parser.add_argument('--third-party', type=int, default=defaults.third_party,
+                      help='Number of managed 3rdparty artifacts.')
+  parser.add_argument('--seed', type=int, default=defaults.seed,
+                      help='Seed used to pick dependencies.')
+  parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs per benchmark.')
+  parser.add_argument('--jobs', type=int, default=1, help='Jobs to run regenerate_all with.')
+  parser.add_argument('--benchmark', action='append', choices=Benchmark.BENCHMARKS,
+                      dest='benchmarks', help='Benchmark to run (may be repeated). Default: all.')
+  parser.add_argument('--workdir',
+                      help='Create the synthetic repo here and keep it, instead of in a temp dir.')
+  parser.add_argument('--output', help='File to write the JSON results to. Default: stdout.')
+  args = parser.parse_args(args)
+
+  logging.basicConfig(format='%(asctime)s: %(message)s')
+  # The tools log at INFO on every run; only the benchmark's own progress is interesting here.
+  logging.getLogger().setLevel(logging.WARNING)
+  logger.setLevel(logging.INFO)
+
+  config = SyntheticRepoConfig(modules=args.modules, fanout=args.fanout,
+                               parent_depth=args.parent_depth, profiles=args.profiles,
+                               plugins=args.plugins, third_party=args.third_party, seed=args.seed)
+  results = run_benchmarks(config, repeat=args.repeat, jobs=args.jobs, names=args.benchmarks,
+                           workdir=args.workdir)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+  else:
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+  main()
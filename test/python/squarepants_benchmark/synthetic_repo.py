@@ -0,0 +1,262 @@
+# Generates synthetic maven repos for benchmarking the BUILD generation pipeline.
+
+import os
+import random
+from textwrap import dedent
+
+
+class SyntheticRepoConfig(object):
+  """Describes the shape of a synthetic repo."""
+
+  def __init__(self, modules=50, fanout=5, parent_depth=2, profiles=2, plugins=3,
+               third_party=100, seed=0):
+    """
+    :param int modules: number of leaf modules listed in the top level pom.xml.
+    :param int fanout: number of local modules each module depends on (where possible).
+    :param int parent_depth: number of parent poms between each module and parents/base/pom.xml.
+    :param int profiles: number of os-activated <profile> blocks in each module pom.
+    :param int plugins: number of <plugin> blocks in each module pom.
+    :param int third_party: number of artifacts in the dependencyManagement section of
+      parents/base/pom.xml. Each module depends on up to fanout of them.
+    :param int seed: seed for choosing dependencies, so the same config yields the same repo.
+    """
+    self.modules = modules
+    self.fanout = fanout
+    self.parent_depth = parent_depth
+    self.profiles = profiles
+    self.plugins = plugins
+    self.third_party = third_party
+    self.seed = seed
+
+  def to_dict(self):
+    return dict(self.__dict__)
+
+
+class SyntheticRepo(object):
+  """Writes a synthetic repo to disk.
+
+  The layout mirrors what squarepants expects: a top level pom.xml listing the modules,
+  parents/base/pom.xml holding the dependencyManagement section used for 3rdparty/BUILD.gen,
+  parents/external-protos, and squarepants/bin/pants.pex for checkpoms.
+  """
+
+  GROUP_ID = 'com.example.synthetic'
+
+  def __init__(self, root, config):
+    """
+    :param string root: directory to write the repo into.
+    :param SyntheticRepoConfig config: the shape of the repo.
+    """
+    self.root = root
+    self.config = config
+    self._random = random.Random(config.seed)
+
+  @property
+  def module_names(self):
+    return ['module-{:04d}'.format(i) for i in range(self.config.modules)]
+
+  def module_pom(self, module):
+    """:returns: the path to the pom.xml of the module, relative to the root."""
+    return os.path.join(module, 'pom.xml')
+
+  @property
+  def _leaf_parent(self):
+    if self.config.parent_depth:
+      return 'parents/level-{}'.format(self.config.parent_depth)
+    return 'parents/base'
+
+  def _write(self, path, contents):
+    path = os.path.join(self.root, path)
+    if not os.path.exists(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(contents)
+
+  def _parent_block(self, parent_dir, child_dir):
+    return dedent('''
+      <parent>
+        <groupId>{group}</groupId>
+        <artifactId>{artifact}</artifactId>
+        <version>HEAD-SNAPSHOT</version>
+        <relativePath>{path}</relativePath>
+      </parent>
+    ''').format(group=self.GROUP_ID,
+                artifact=os.path.basename(parent_dir),
+                path=os.path.join(os.path.relpath(parent_dir, child_dir), 'pom.xml'))
+
+  def _dependency(self, group, artifact, version=None, scope=None):
+    lines = ['<dependency>',
+             '  <groupId>{}</groupId>'.format(group),
+             '  <artifactId>{}</artifactId>'.format(artifact)]
+    if version:
+      lines.append('  <version>{}</version>'.format(version))
+    if scope:
+      lines.append('  <scope>{}</scope>'.format(scope))
+    lines.append('</dependency>')
+    return '\n'.join(lines)
+
+  def _project(self, artifact, body):
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<project xmlns="http://maven.apache.org/POM/4.0.0">\n'
+            '<modelVersion>4.0.0</modelVersion>\n'
+            '{body}\n'
+            '<groupId>{group}</groupId>\n'
+            '<artifactId>{artifact}</artifactId>\n'
+            '<version>HEAD-SNAPSHOT</version>\n'
+            '</project>\n').format(body=body, group=self.GROUP_ID, artifact=artifact)
+
+  def _write_top_pom(self):
+    modules = '\n'.join('  <module>{}</module>'.format(m) for m in self.module_names)
+    self._write('pom.xml', self._project('all', '<packaging>pom</packaging>\n<modules>\n{}\n</modules>'
+                                         .format(modules)))
+
+  def _write_base_pom(self):
+    managed = '\n'.join(self._dependency('com.example.thirdparty', 'lib-{}'.format(i),
+                                         version='1.{}'.format(i))
+                        for i in range(self.config.third_party))
+    body = dedent('''
+      <packaging>pom</packaging>
+      <properties>
+        <project.build.sourceEncoding>UTF-8</project.build.sourceEncoding>
+        <synthetic.version>1.0</synthetic.version>
+      </properties>
+      <dependencyManagement>
+        <dependencies>
+      {managed}
+        </dependencies>
+      </dependencyManagement>
+      <build>
+        <plugins>
+          <plugin>
+            <groupId>org.apache.maven.plugins</groupId>
+            <artifactId>maven-compiler-plugin</artifactId>
+            <configuration>
+              <source>1.8</source>
+              <target>1.8</target>
+            </configuration>
+          </plugin>
+        </plugins>
+      </build>
+      <profiles>
+        <profile>
+          <activation><os><name>linux</name></os></activation>
+          <properties><java8.home>/usr/lib/jvm/java-8</java8.home></properties>
+        </profile>
+        <profile>
+          <activation><os><name>mac os x</name></os></activation>
+          <properties><java8.home>/Library/Java/java-8</java8.home></properties>
+        </profile>
+      </profiles>
+    ''').format(managed=managed)
+    self._write('parents/base/pom.xml', self._project('base', body))
+
+  def _write_parent_chain(self):
+    parent = 'parents/base'
+    for level in range(1, self.config.parent_depth + 1):
+      directory = 'parents/level-{}'.format(level)
+      body = dedent('''
+        {parent}
+        <packaging>pom</packaging>
+        <properties>
+          <level-{level}.property>value-{level}</level-{level}.property>
+        </properties>
+      ''').format(parent=self._parent_block(parent, directory), level=level)
+      self._write(os.path.join(directory, 'pom.xml'), self._project('level-{}'.format(level), body))
+      parent = directory
+
+  def _write_external_protos(self):
+    body = dedent('''
+      {parent}
+      <packaging>pom</packaging>
+      <properties>
+        <external-protos.all-protos-latest>1.0</external-protos.all-protos-latest>
+      </properties>
+    ''').format(parent=self._parent_block('parents/base', 'parents/external-protos'))
+    self._write('parents/external-protos/pom.xml', self._project('external-protos', body))
+
+  def _profiles(self):
+    profiles = []
+    for i in range(self.config.profiles):
+      profiles.append(dedent('''
+        <profile>
+          <id>profile-{i}</id>
+          <activation><os><name>{os}</name></os></activation>
+          <properties><profile-{i}.property>value-{i}</profile-{i}.property></properties>
+        </profile>
+      ''').format(i=i, os=('linux', 'mac os x', 'windows')[i % 3]))
+    return '<profiles>\n{}\n</profiles>'.format(''.join(profiles)) if profiles else ''
+
+  def _plugins(self):
+    plugins = []
+    for i in range(self.config.plugins):
+      if i == 0:
+        plugins.append(dedent('''
+          <plugin>
+            <groupId>org.apache.maven.plugins</groupId>
+            <artifactId>maven-surefire-plugin</artifactId>
+            <configuration>
+              <argLine>-Xmx1g -Dsynthetic=true</argLine>
+              <environmentVariables><SYNTHETIC>true</SYNTHETIC></environmentVariables>
+            </configuration>
+          </plugin>
+        '''))
+      else:
+        plugins.append(dedent('''
+          <plugin>
+            <groupId>com.example.plugins</groupId>
+            <artifactId>plugin-{i}</artifactId>
+            <executions>
+              <execution>
+                <id>execution-{i}</id>
+                <phase>generate-sources</phase>
+                <goals><goal>generate</goal></goals>
+                <configuration><value>{i}</value></configuration>
+              </execution>
+            </executions>
+          </plugin>
+        ''').format(i=i))
+    return '<build>\n<plugins>\n{}\n</plugins>\n</build>'.format(''.join(plugins)) if plugins else ''
+
+  def _write_module(self, index, module):
+    local_deps = self._random.sample(range(index), min(index, self.config.fanout))
+    third_party_deps = self._random.sample(range(self.config.third_party),
+                                           min(self.config.third_party, self.config.fanout))
+    dependencies = [self._dependency(self.GROUP_ID, self.module_names[i], version='HEAD-SNAPSHOT')
+                    for i in sorted(local_deps)]
+    dependencies.extend(self._dependency('com.example.thirdparty', 'lib-{}'.format(i))
+                        for i in sorted(third_party_deps))
+    dependencies.append(self._dependency('com.example.thirdparty', 'lib-test',
+                                         version='2.0', scope='test'))
+    body = '\n'.join([
+      self._parent_block(self._leaf_parent, module),
+      '<dependencies>\n{}\n</dependencies>'.format('\n'.join(dependencies)),
+      self._plugins(),
+      self._profiles(),
+    ])
+    self._write(self.module_pom(module), self._project(module, body))
+    package = module.replace('-', '_')
+    self._write(os.path.join(module, 'src', 'main', 'java', 'com', 'example', package, 'Main.java'),
+                'package com.example.{};\nclass Main {{}}\n'.format(package))
+    self._write(os.path.join(module, 'src', 'test', 'java', 'com', 'example', package,
+                             'MainTest.java'),
+                'package com.example.{};\nclass MainTest {{}}\n'.format(package))
+    self._write(os.path.join(module, 'src', 'main', 'resources', 'config.yaml'), 'key: value\n')
+
+  def create(self):
+    """Writes out the whole repo."""
+    self._write_top_pom()
+    self._write_base_pom()
+    self._write_parent_chain()
+    self._write_external_protos()
+    for index, module in enumerate(self.module_names):
+      self._write_module(index, module)
+    for directory in ('3rdparty', 'squarepants/bin'):
+      if not os.path.exists(os.path.join(self.root, directory)):
+        os.makedirs(os.path.join(self.root, directory))
+    # checkpoms refuses to run without a pants.pex, but only ever hashes it.
+    self._write('squarepants/bin/pants.pex', '# Placeholder for the benchmark.\n')
+
+  def touch_module_pom(self, module):
+    """Makes a content change to the module's pom.xml, as a developer editing it would."""
+    with open(os.path.join(self.root, self.module_pom(module)), 'a') as f:
+      f.write('<!-- edited -->\n')
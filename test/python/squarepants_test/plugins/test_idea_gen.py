@@ -10,6 +10,7 @@ import unittest
 
 # from squarepants.plugins.square_idea.tasks.square_idea import SquareIdea
 from squarepants.plugins.square_idea.tasks.square_idea_project import IdeaProject
+from squarepants.pom_directory_index import PomDirectoryIndex
 
 
 # NB(gmalmquist): This should ideally be a subclass of TaskTestBase to test SquareIdea.
@@ -143,6 +144,17 @@ class SquareIdeaTest(unittest.TestCase):
     self.assertEqual(set(), module_dependencies('foo/cycle:cycle'))
     self.assertEqual({'foo'}, module_dependencies('bar:bar'))
 
+  def test_find_closest_maven_module(self):
+    find_closest_maven_module = IdeaProject.find_closest_maven_module
+    pom_index = PomDirectoryIndex('/repo', ['', 'foo', 'foo/bar'])
+    self.assertEqual('foo', find_closest_maven_module('foo', pom_index))
+    self.assertEqual('foo', find_closest_maven_module('foo/src/main/java', pom_index))
+    self.assertEqual('foo/bar', find_closest_maven_module('foo/bar/src', pom_index))
+    self.assertEqual('.', find_closest_maven_module('.', pom_index))
+    # The top-level pom.xml doesn't make a module of everything else.
+    self.assertIsNone(find_closest_maven_module('baz', pom_index))
+    self.assertIsNone(find_closest_maven_module('baz/src', pom_index))
+
   def test_infer_processor_name(self):
     infer_name = IdeaProject.infer_processor_name
     self.assertEqual('1-Potato', infer_name(1, ['com.foo.bar.Potato']))
@@ -213,6 +225,22 @@ class SquareIdeaTest(unittest.TestCase):
       ],
     )
 
+    # Modules on a cycle keep the libraries they share, so at least one of them still has them.
+    assert_simplifies_to(
+      expected=[
+        create_module('one', {'two', 'four'}, {'default': {'foo.jar'}}),
+        create_module('two', {'three'}, {'default': {'foo.jar'}}),
+        create_module('three', {'one'}, {'default': {'foo.jar'}}),
+        create_module('four', set(), {'default': {'orange.jar'}}),
+      ],
+      modules=[
+        create_module('one', {'two', 'four'}, {'default': {'foo.jar', 'orange.jar'}}),
+        create_module('two', {'three'}, {'default': {'foo.jar'}}),
+        create_module('three', {'one'}, {'default': {'foo.jar', 'orange.jar'}}),
+        create_module('four', set(), {'default': {'orange.jar'}}),
+      ],
+    )
+
   def test_module_pool_no_stealing(self):
     pool = IdeaProject.ModulePool(generic_modules=('2', '1', '3'),
                                   specific_modules=('b', 'c', 'a'),
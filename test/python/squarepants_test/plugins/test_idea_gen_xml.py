@@ -75,6 +75,15 @@ class IdeaGenXml(TaskTestBase):
                             two=ElementTree.tostring(root_two),
                             div='='*20))
 
+  def _make_java_library(self, spec, sources, dependencies=None):
+    # The export fingerprints the targets, which reads their sources, so they have to exist.
+    for source in sources:
+      path = os.path.join(spec.split(':')[0], source)
+      if not os.path.exists(os.path.join(get_buildroot(), path)):
+        self.create_file(path, contents='class {} {{}}'.format(os.path.splitext(source)[0]))
+    return self.make_target(spec, dependencies=dependencies or [], target_type=JavaLibrary,
+                            sources=sources)
+
   def test_meta_equal(self):
     self.assertTrue(self._check_tree_contains(
       ElementTree.fromstring('<a><b/></a>'),
@@ -125,6 +134,71 @@ class IdeaGenXml(TaskTestBase):
       ))
       self._assert_tree_contains(ipr, 'project_default_junit.xml')
 
+  def _project_template_data(self, task):
+    return TemplateData(
+      root_dir=get_buildroot(),
+      outdir=task.intellij_output_dir,
+      resource_extensions=[],
+      scala=None,
+      checkstyle_classpath=';'.join([]),
+      debug_port=None,
+      extra_components=[],
+      global_junit_vm_parameters='-one -two -three',
+    )
+
+  def test_merge_existing_components(self):
+    with temporary_dir() as outdir:
+      self.set_options(project_dir=outdir, project_name='merged', merge=False)
+      task = self.create_task(self.context())
+      generated = task._parse_xml_component_elements(
+        task._generate_project_file(self._project_template_data(task)))
+      generated_names = [name for name, _ in generated]
+      self.assertTrue(generated_names)
+
+      # An existing project with a component of its own, and a stale copy of a generated one.
+      if not os.path.exists(os.path.dirname(task.project_filename)):
+        os.makedirs(os.path.dirname(task.project_filename))
+      with open(task.project_filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<project version="4">\n'
+                '  <component name="{}" stale="true" />\n'
+                '  <component name="ForeignComponent">\n'
+                '    <option name="kept" value="true" />\n'
+                '  </component>\n'
+                '</project>\n'.format(generated_names[0]))
+
+      self.set_options(project_dir=outdir, project_name='merged', merge=True)
+      task = self.create_task(self.context())
+      merged = task._parse_xml_component_elements(
+        task._generate_project_file(self._project_template_data(task)))
+      self.assertEqual(sorted(generated_names + ['ForeignComponent']),
+                       sorted(name for name, _ in merged))
+      self.assertIn('<option name="kept" value="true"/>', dict(merged)['ForeignComponent'])
+      self.assertEqual(dict(generated)[generated_names[0]], dict(merged)[generated_names[0]])
+
+  def test_render_modules(self):
+    template = '<module name="{{module.name}}" />'
+    modules = [{'name': 'module{}'.format(index)}
+               for index in range(2 * SquareIdea._MODULES_PER_RENDER_WORKER)]
+    rendered = {}
+    with temporary_dir() as outdir:
+      for render_workers in (1, 4):
+        self.set_options(project_dir=outdir, project_name='render', render_workers=render_workers)
+        task = self.create_task(self.context())
+        paths = task._render_modules(template, modules)
+        try:
+          rendered[render_workers] = [open(path).read() for path in paths]
+        finally:
+          for path in paths:
+            os.remove(path)
+
+    # A worker is only started for each batch of modules, so this rendered through a pool of 2.
+    self.assertEqual(2, task._render_worker_count(len(modules)))
+    self.assertEqual(1, task._render_worker_count(len(modules) - 1))
+    self.assertEqual(['<module name="{}" />'.format(module['name']) for module in modules],
+                     rendered[1])
+    self.assertEqual(rendered[1], rendered[4])
+
   def test_loose_files(self):
     with temporary_dir() as outdir:
       project_name = 'foobar'
@@ -158,12 +232,10 @@ class IdeaGenXml(TaskTestBase):
                 '    <module>module3</module>\n'
                 '  </modules>\n'
                 '</project>\n')
-        module3 = self.make_target('module3:module3', dependencies=[],
-                                   target_type=JavaLibrary, sources=['Module3.java'])
-        module2 = self.make_target('module2:module2', dependencies=[],
-                                   target_type=JavaLibrary, sources=['Module3.java'])
-        module1 = self.make_target('module1:module1', dependencies=[module2, module3],
-                                   target_type=JavaLibrary, sources=['Module1.java'])
+        module3 = self._make_java_library('module3:module3', ['Module3.java'])
+        module2 = self._make_java_library('module2:module2', ['Module3.java'])
+        module1 = self._make_java_library('module1:module1', ['Module1.java'],
+                                          dependencies=[module2, module3])
 
       task = self.create_task(self.context(target_roots=[module1]))
       task.execute()
@@ -184,18 +256,49 @@ class IdeaGenXml(TaskTestBase):
                 '    <module>module3-cc</module>\n'
                 '  </modules>\n'
                 '</project>\n')
-        module3 = self.make_target('module3-cc:module3-cc', dependencies=[],
-                                   target_type=JavaLibrary, sources=['Module3.java'])
-        module2 = self.make_target('module2-bb:module2-bb', dependencies=[],
-                                   target_type=JavaLibrary, sources=['Module3.java'])
-        module1 = self.make_target('module1-aa:module1-aa', dependencies=[module2, module3],
-                                   target_type=JavaLibrary, sources=['Module1.java'])
+        module3 = self._make_java_library('module3-cc:module3-cc', ['Module3.java'])
+        module2 = self._make_java_library('module2-bb:module2-bb', ['Module3.java'])
+        module1 = self._make_java_library('module1-aa:module1-aa', ['Module1.java'],
+                                          dependencies=[module2, module3])
 
       task = self.create_task(self.context(target_roots=[module1]))
       task.execute()
       iml = os.path.join(outdir, project_name, 'module1-aa.iml')
       self._assert_tree_contains(iml, 'project_dep_scope_prefix.iml.xml')
 
+  def test_incremental_module_files(self):
+    with temporary_dir() as outdir:
+      project_name = 'incremental'
+      self.set_options(project_dir=outdir, project_name=project_name, loose_files=True, merge=False,
+                       libraries=False, open=False)
+      with open(os.path.join(get_buildroot(), 'pom.xml'), 'w+') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<project>\n'
+                '  <modules>\n'
+                '    <module>module1</module>\n'
+                '    <module>module2</module>\n'
+                '  </modules>\n'
+                '</project>\n')
+      module2 = self._make_java_library('module2:module2', ['Module2.java'])
+      module1 = self._make_java_library('module1:module1', ['Module1.java'], dependencies=[module2])
+
+      self.create_task(self.context(target_roots=[module1])).execute()
+      project_dir = os.path.join(outdir, project_name)
+      iml = os.path.join(project_dir, 'module1.iml')
+      self.assertTrue(os.path.exists(os.path.join(project_dir, '.module-fingerprints.json')))
+      first_inode = os.stat(iml).st_ino
+
+      # Nothing changed, so the .iml file is left alone.
+      self.create_task(self.context(target_roots=[module1])).execute()
+      self.assertEqual(first_inode, os.stat(iml).st_ino)
+
+      # Edits to the generated file are still overwritten.
+      with open(iml, 'w') as f:
+        f.write('<module/>')
+      self.create_task(self.context(target_roots=[module1])).execute()
+      with open(iml, 'r') as f:
+        self.assertIn('module2', f.read())
+
   def test_find_target_directories(self):
     with temporary_dir() as outdir:
       project_name = 'foobar'
@@ -258,6 +361,150 @@ class IdeaGenXml(TaskTestBase):
 
         self.assertEqual(expected, set(excludes))
 
+  def test_pom_index_per_run(self):
+    with temporary_dir() as outdir:
+      self.set_options(project_dir=outdir, project_name='pom-index-project', merge=False,
+                       libraries=False, open=False)
+      with open(os.path.join(get_buildroot(), 'pom.xml'), 'w+') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>'
+                '<project><modules/></project>')
+      first = self.create_task(self.context())._create_idea_project(outdir, None)
+      self.assertFalse(first.pom_index.has_pom('added'))
+
+      touch(os.path.join(get_buildroot(), 'added', 'pom.xml'), makedirs=True)
+      second = self.create_task(self.context())._create_idea_project(outdir, None)
+      self.assertTrue(second.pom_index.has_pom('added'))
+      self.assertFalse(first.pom_index.has_pom('added'))
+
+  def _export_task(self, target_roots):
+    """Creates a task which counts how many times it generates the export blob."""
+    task = self.create_task(self.context(target_roots=target_roots))
+    task.generated = 0
+    generate_targets_map = task.generate_targets_map
+
+    def counting_generate_targets_map(targets):
+      task.generated += 1
+      return generate_targets_map(targets)
+
+    task.generate_targets_map = counting_generate_targets_map
+    return task
+
+  def _cached_exports(self, task):
+    cache_dir = os.path.join(task.workdir, 'export')
+    if not os.path.isdir(cache_dir):
+      return set()
+    return {name for name in os.listdir(cache_dir) if name.endswith('.json')}
+
+  def _make_export_target(self, name='module1', dependencies=None):
+    return self._make_java_library('{0}:{0}'.format(name), ['{}.java'.format(name.capitalize())],
+                                   dependencies=dependencies)
+
+  def _set_export_options(self, outdir, **kwargs):
+    self.set_options(project_dir=outdir, project_name='export', libraries=False, **kwargs)
+
+  def test_export_cache_hit(self):
+    with temporary_dir() as outdir:
+      self._set_export_options(outdir, cache_export=True)
+      module1 = self._make_export_target()
+      first = self._export_task([module1])
+      blob = first._cached_targets_map(first.context.targets())
+      self.assertEqual(1, first.generated)
+      self.assertEqual(1, len(self._cached_exports(first)))
+
+      second = self._export_task([module1])
+      self.assertEqual(blob, second._cached_targets_map(second.context.targets()))
+      self.assertEqual(0, second.generated)
+      self.assertEqual(self._cached_exports(first), self._cached_exports(second))
+
+  def test_export_cache_miss(self):
+    with temporary_dir() as outdir:
+      self._set_export_options(outdir, cache_export=True)
+      module1 = self._make_export_target()
+      first = self._export_task([module1])
+      first._cached_targets_map(first.context.targets())
+      cached = self._cached_exports(first)
+
+      # The export reads the jvm distribution settings, so changing them invalidates the blob.
+      self.set_options_for_scope('jvm-distributions', paths={'linux': ['/opt/jdk8']})
+      second = self._export_task([module1])
+      second._cached_targets_map(second.context.targets())
+      self.assertEqual(1, second.generated)
+      self.assertEqual(2, len(self._cached_exports(second)))
+
+      # So does changing the export options.
+      self._set_export_options(outdir, cache_export=True, sources=True)
+      third = self._export_task([module1])
+      third._cached_targets_map(third.context.targets())
+      self.assertEqual(1, third.generated)
+      self.assertEqual(3, len(self._cached_exports(third)))
+      self.assertTrue(cached < self._cached_exports(third))
+
+  def test_export_cache_miss_dependencies(self):
+    with temporary_dir() as outdir:
+      self._set_export_options(outdir, cache_export=True)
+      module2 = self._make_export_target('module2')
+      module1 = self._make_export_target('module1')
+      first = self._export_task([module1, module2])
+      first._cached_targets_map(first.context.targets())
+      self.assertEqual(1, first.generated)
+
+      # Same targets, but module1 now depends on module2.
+      self.reset_build_graph()
+      module2 = self._make_export_target('module2')
+      module1 = self._make_export_target('module1', dependencies=[module2])
+      second = self._export_task([module1, module2])
+      second._cached_targets_map(second.context.targets())
+      self.assertEqual(1, second.generated)
+      self.assertEqual(2, len(self._cached_exports(second)))
+
+  def test_export_cache_miss_source_content(self):
+    with temporary_dir() as outdir:
+      self._set_export_options(outdir, cache_export=True)
+      module2 = self._make_export_target('module2')
+      module1 = self._make_export_target('module1', dependencies=[module2])
+      first = self._export_task([module1])
+      first._cached_targets_map(first.context.targets())
+      self.assertEqual(1, first.generated)
+
+      # An edit to a source of a dependency changes the fingerprint too.
+      self.create_file('module2/Module2.java', contents='class Module2 { int x; }')
+      self.reset_build_graph()
+      module2 = self._make_export_target('module2')
+      module1 = self._make_export_target('module1', dependencies=[module2])
+      second = self._export_task([module1])
+      second._cached_targets_map(second.context.targets())
+      self.assertEqual(1, second.generated)
+      self.assertEqual(2, len(self._cached_exports(second)))
+
+  def test_no_cache_export(self):
+    with temporary_dir() as outdir:
+      self._set_export_options(outdir, cache_export=False)
+      module1 = self._make_export_target()
+      for _ in range(2):
+        task = self._export_task([module1])
+        task._cached_targets_map(task.context.targets())
+        self.assertEqual(1, task.generated)
+        self.assertEqual(set(), self._cached_exports(task))
+
+  def test_export_cache_pruned(self):
+    with temporary_dir() as outdir:
+      self._set_export_options(outdir, cache_export=True)
+      module1 = self._make_export_target()
+      task = self._export_task([module1])
+      cache_dir = os.path.join(task.workdir, 'export')
+      stale = ['stale-{}.json'.format(i) for i in range(SquareIdea._EXPORT_CACHE_SIZE)]
+      for i, name in enumerate(stale):
+        path = os.path.join(cache_dir, name)
+        touch(path, makedirs=True)
+        # The lowest numbers were used least recently.
+        os.utime(path, (1000 + i, 1000 + i))
+
+      task._cached_targets_map(task.context.targets())
+      cached = self._cached_exports(task)
+      self.assertEqual(SquareIdea._EXPORT_CACHE_SIZE, len(cached))
+      self.assertNotIn(stale[0], cached)
+      self.assertEqual(set(stale[1:]), {name for name in cached if name.startswith('stale-')})
+
   def test_debug_port_set(self):
     with temporary_dir() as outdir:
       project_name = 'debug-port-project'
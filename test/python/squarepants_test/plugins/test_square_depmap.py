@@ -3,9 +3,17 @@
 # Run with:
 # ./pants test squarepants/src/test/python/squarepants_test/plugins:square_depmap
 
+import json
 import unittest2 as unittest
 
+from pants.build_graph.build_file_aliases import BuildFileAliases
+from pants.build_graph.target import Target
+from pants_test.tasks.task_test_base import TaskTestBase
+
 from squarepants.plugins.square_depmap.tasks.graph_util import Graph
+from squarepants.plugins.square_depmap.tasks.square_depmap import SquareDepmap
+from squarepants.pom_directory_index import PomDirectoryIndex
+
 
 class SquareDepmapTest(unittest.TestCase):
 
@@ -53,3 +61,136 @@ Edges:
 
     self.assertEquals({Graph.Edge('a', 'b'), Graph.Edge('a', 'c')},
                 {Graph.Edge('a', 'b'), Graph.Edge('a', 'b'), Graph.Edge('a', 'c')})
+
+
+class SquareDepmapTaskTest(TaskTestBase):
+
+  @classmethod
+  def task_type(cls):
+    return SquareDepmap
+
+  @property
+  def alias_groups(self):
+    return BuildFileAliases(
+        targets={
+          'target': Target,
+        },
+    )
+
+  def _add_targets(self, dependencies_by_spec):
+    """Adds a target for each spec, depending on the specs it maps to.
+
+    :returns: the targets which nothing else depends on.
+    """
+    for spec, dependencies in sorted(dependencies_by_spec.items()):
+      path, name = spec.split(':')
+      self.add_to_build_file(path, 'target(name={name!r}, dependencies={deps!r})\n'
+                             .format(name=name, deps=dependencies))
+    depended_on = {dep for deps in dependencies_by_spec.values() for dep in deps}
+    return [self.target(spec) for spec in sorted(dependencies_by_spec) if spec not in depended_on]
+
+  def _generate(self, generate, roots):
+    task = self.create_task(self.context(target_roots=roots))
+    return list(getattr(task, generate)(task.context.targets()))
+
+  def _project_targets(self):
+    return self._add_targets({
+      '3rdparty:shaded,guava': [],
+      'foo/src/main/java:lib': ['3rdparty:shaded,guava'],
+      'foo/src/test/java:test': ['foo/src/main/java:lib'],
+      'bar/src/main/java:lib': ['foo/src/main/java:lib'],
+    })
+
+  def test_generate_jsonl(self):
+    self.set_options(compress_projects=False, reduce_transitive=False)
+    records = [json.loads(line) for line in self._generate('generate_jsonl',
+                                                           self._project_targets())]
+    vertices = [record for record in records if record['type'] == 'vertex']
+    edges = [record for record in records if record['type'] == 'edge']
+    self.assertEquals(records, vertices + edges)
+    self.assertEquals([
+      {'type': 'vertex', 'id': '3rdparty.shaded,guava', 'project': '', 'group': 0,
+       'external': True},
+      {'type': 'vertex', 'id': 'bar.src.main.java.lib', 'project': 'bar', 'group': 1,
+       'external': False},
+      {'type': 'vertex', 'id': 'foo.src.main.java.lib', 'project': 'foo', 'group': 2,
+       'external': False},
+      {'type': 'vertex', 'id': 'foo.src.test.java.test', 'project': 'foo', 'group': 2,
+       'external': False},
+    ], vertices)
+    self.assertEquals([
+      {'type': 'edge', 'src': 'bar.src.main.java.lib', 'dst': 'foo.src.main.java.lib',
+       'same_project': False},
+      {'type': 'edge', 'src': 'foo.src.main.java.lib', 'dst': '3rdparty.shaded,guava',
+       'same_project': False},
+      {'type': 'edge', 'src': 'foo.src.test.java.test', 'dst': 'foo.src.main.java.lib',
+       'same_project': True},
+    ], sorted(edges, key=lambda edge: (edge['src'], edge['dst'])))
+
+  def test_generate_csv(self):
+    self.set_options(compress_projects=False, reduce_transitive=False)
+    self.assertEquals([
+      '"3rdparty.shaded,guava"',
+      'bar.src.main.java.lib,foo.src.main.java.lib',
+      'foo.src.main.java.lib,"3rdparty.shaded,guava"',
+      'foo.src.test.java.test,foo.src.main.java.lib',
+    ], self._generate('generate_csv', self._project_targets()))
+
+  def test_csv_field(self):
+    csv_field = SquareDepmap._csv_field
+    self.assertEquals('foo.src.main.java.lib', csv_field('foo.src.main.java.lib'))
+    self.assertEquals('"a,b"', csv_field('a,b'))
+    self.assertEquals('"say ""hi"""', csv_field('say "hi"'))
+    self.assertEquals('"two\nlines"', csv_field('two\nlines'))
+
+  def test_compress_and_reduce(self):
+    self.set_options(compress_projects=True, reduce_transitive=True)
+    roots = self._add_targets({
+      '3rdparty:guava': [],
+      'qux/src/main/java:lib': [],
+      'baz/src/main/java:lib': ['qux/src/main/java:lib'],
+      'bar/src/main/java:lib': ['baz/src/main/java:lib', 'qux/src/main/java:lib'],
+      # bar's tests depend on foo, which depends on bar: a cycle between the two projects.
+      'bar/src/test/java:test': ['bar/src/main/java:lib', 'foo/src/main/java:lib'],
+      'foo/src/main/java:lib': ['3rdparty:guava', 'bar/src/main/java:lib'],
+      'foo/src/test/java:test': ['foo/src/main/java:lib'],
+    })
+    # Edges between targets of the same project become self-edges of the project, and both edges
+    # of the foo <-> bar cycle are kept. Only bar -> qux is implied, by bar -> baz -> qux.
+    self.assertEquals([
+      '3rdparty.guava',
+      'bar,bar,baz,foo',
+      'baz,qux',
+      'foo,3rdparty.guava,bar,foo',
+      'qux',
+    ], self._generate('generate_csv', roots))
+
+    self.set_options(compress_projects=True, reduce_transitive=False)
+    self.assertIn('bar,bar,baz,foo,qux', self._generate('generate_csv', roots))
+
+  def test_pom_index_scanned_when_needed(self):
+    self.create_file('tools/pom.xml')
+    roots = self._add_targets({
+      'foo/src/main/java:lib': [],
+      'tools/scripts:scripts': ['foo/src/main/java:lib'],
+    })
+    scan = PomDirectoryIndex.scan
+    scanned = []
+
+    def counting_scan(root):
+      scanned.append(root)
+      return scan(root)
+
+    PomDirectoryIndex.scan = staticmethod(counting_scan)
+    try:
+      # Projects are just the top level directories, so no pom.xml is looked up.
+      self.set_options(compress_projects=True, reduce_transitive=False, ignore_subprojects=True)
+      self.assertEquals(['foo', 'tools,foo'], self._generate('generate_csv', roots))
+      self.assertEquals([], scanned)
+
+      # tools/scripts isn't under a src/ directory, so it belongs to the module of tools/pom.xml.
+      self.set_options(compress_projects=True, reduce_transitive=False, ignore_subprojects=False)
+      self.assertEquals(['foo', 'tools,foo'], self._generate('generate_csv', roots))
+      self.assertEquals(1, len(scanned))
+    finally:
+      PomDirectoryIndex.scan = scan
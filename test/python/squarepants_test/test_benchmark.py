@@ -0,0 +1,56 @@
+# Tests for code in squarepants/src/test/python/squarepants_benchmark
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:benchmark
+
+import os
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir
+from squarepants.pom_to_build import PomToBuild
+from squarepants.pom_utils import PomUtils
+
+from squarepants_benchmark.benchmark import Benchmark, run_benchmarks
+from squarepants_benchmark.synthetic_repo import SyntheticRepo, SyntheticRepoConfig
+
+
+class BenchmarkTest(unittest.TestCase):
+
+  def setUp(self):
+    self._wd = os.getcwd()
+    PomUtils.reset_caches()
+
+  def tearDown(self):
+    os.chdir(self._wd)
+    PomUtils.reset_caches()
+
+  def test_synthetic_repo(self):
+    with temporary_dir() as tmpdir:
+      repo = SyntheticRepo(tmpdir, SyntheticRepoConfig(modules=4, fanout=2, parent_depth=3))
+      repo.create()
+      os.chdir(tmpdir)
+      self.assertEquals(repo.module_names, PomUtils.get_modules())
+      self.assertTrue(os.path.exists('parents/level-3/pom.xml'))
+
+      PomToBuild().convert_pom(repo.module_pom('module-0003'), rootdir=tmpdir)
+      with open('module-0003/src/main/java/BUILD.gen') as f:
+        build = f.read()
+      self.assertIn("'module-0001/src/main/java:lib'", build)
+      self.assertIn("'3rdparty:com.example.thirdparty.lib-", build)
+
+  def test_synthetic_repo_is_deterministic(self):
+    with temporary_dir() as first, temporary_dir() as second:
+      SyntheticRepo(first, SyntheticRepoConfig(modules=5, seed=7)).create()
+      SyntheticRepo(second, SyntheticRepoConfig(modules=5, seed=7)).create()
+      with open(os.path.join(first, 'module-0004/pom.xml')) as a:
+        with open(os.path.join(second, 'module-0004/pom.xml')) as b:
+          self.assertEquals(a.read(), b.read())
+
+  def test_run_benchmarks(self):
+    results = run_benchmarks(SyntheticRepoConfig(modules=3, third_party=5), repeat=1)
+    self.assertEquals(Benchmark.BENCHMARKS, [result['name'] for result in results['results']])
+    for result in results['results']:
+      self.assertEquals(1, len(result['runs']))
+      self.assertGreaterEqual(result['min'], 0)
+    self.assertEquals(3, results['config']['modules'])
+    self.assertEquals(self._wd, os.getcwd())
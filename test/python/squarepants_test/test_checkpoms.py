@@ -0,0 +1,188 @@
+# Tests for code in squarepants/src/main/python/squarepants/checkpoms.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:checkpoms
+
+import os
+from textwrap import dedent
+import unittest2 as unittest
+
+from squarepants.checkpoms import (CheckPoms, compute_affected_modules, compute_hashes,
+                                   compute_module_dependees, find_and_hash_deps, find_files,
+                                   generated_files_of_modules, load_stat_cache,
+                                   read_dependees_index, read_index, stat_key,
+                                   write_dependees_index, write_index)
+from squarepants.file_utils import temporary_dir, touch
+from squarepants.pom_utils import PomUtils
+
+
+class CheckPomsTest(unittest.TestCase):
+
+  def setUp(self):
+    self._wd = os.getcwd()
+    PomUtils.reset_caches()
+
+  def tearDown(self):
+    os.chdir(self._wd)
+    PomUtils.reset_caches()
+
+  def _write(self, path, contents):
+    if not os.path.exists(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(dedent(contents))
+
+  def _write_module_pom(self, root, module, dependencies=(), artifact_id=None):
+    deps = ''.join('''
+      <dependency>
+        <groupId>com.example</groupId>
+        <artifactId>{}</artifactId>
+      </dependency>'''.format(dep) for dep in dependencies)
+    self._write(os.path.join(root, module, 'pom.xml'), '''<?xml version="1.0" encoding="UTF-8"?>
+      <project>
+        <parent>
+          <groupId>com.example</groupId>
+          <artifactId>base</artifactId>
+          <version>HEAD-SNAPSHOT</version>
+          <relativePath>../parents/base/pom.xml</relativePath>
+        </parent>
+        <groupId>com.example</groupId>
+        <artifactId>{artifact_id}</artifactId>
+        <dependencies>{deps}
+        </dependencies>
+      </project>
+    '''.format(artifact_id=artifact_id or module, deps=deps))
+
+  def _create_repo(self, root):
+    self._write(os.path.join(root, 'pom.xml'), '''<?xml version="1.0" encoding="UTF-8"?>
+      <project>
+        <groupId>com.example</groupId>
+        <artifactId>all</artifactId>
+        <modules>
+          <module>parents/base</module>
+          <module>a</module>
+          <module>b</module>
+          <module>c</module>
+        </modules>
+      </project>
+    ''')
+    self._write(os.path.join(root, 'parents', 'base', 'pom.xml'),
+                '''<?xml version="1.0" encoding="UTF-8"?>
+      <project>
+        <groupId>com.example</groupId>
+        <artifactId>base</artifactId>
+      </project>
+    ''')
+    self._write_module_pom(root, 'a')
+    self._write_module_pom(root, 'b', dependencies=['a'])
+    self._write_module_pom(root, 'c')
+    os.makedirs(os.path.join(root, 'c', 'src', 'main', 'java'))
+
+  def _affected(self, root, *paths):
+    PomUtils.reset_caches()
+    modules = PomUtils.get_modules()
+    return compute_affected_modules(root, modules, [os.path.join(root, p) for p in paths])
+
+  def test_affected_modules(self):
+    with temporary_dir() as tmpdir:
+      root = os.path.realpath(tmpdir)
+      self._create_repo(root)
+      os.chdir(root)
+      self.assertEquals({'a', 'b'}, self._affected(root, 'a/pom.xml'))
+      self.assertEquals({'b'}, self._affected(root, 'b/pom.xml'))
+      self.assertEquals({'c'}, self._affected(root, 'c/src/main/java'))
+      self.assertEquals({'c'}, self._affected(root, 'c/src/test/java/BUILD'))
+
+  def test_affected_modules_requires_full_rebuild(self):
+    with temporary_dir() as tmpdir:
+      root = os.path.realpath(tmpdir)
+      self._create_repo(root)
+      os.chdir(root)
+      # Removed pom.
+      self.assertIsNone(self._affected(root, 'd/pom.xml'))
+      # Not under any module.
+      self.assertIsNone(self._affected(root, 'src/main/java'))
+      # Decides which dependencies of every module are 3rdparty targets.
+      self.assertIsNone(self._affected(root, 'parents/base/pom.xml'))
+      # Changes to the generator itself.
+      modules = PomUtils.get_modules()
+      self.assertIsNone(compute_affected_modules(root, modules,
+                                                 ['squarepants/src/main/python/squarepants/x.py']))
+
+  def test_affected_modules_renamed_artifact(self):
+    with temporary_dir() as tmpdir:
+      root = os.path.realpath(tmpdir)
+      self._create_repo(root)
+      os.chdir(root)
+      dependees_index = os.path.join(root, 'dependees.index')
+      write_dependees_index(dependees_index, compute_module_dependees(PomUtils.get_modules()))
+
+      # b still depends on the old artifactId, so nothing currently depends on a.
+      self._write_module_pom(root, 'a', artifact_id='a-renamed')
+      self.assertEquals({'a'}, self._affected(root, 'a/pom.xml'))
+      modules = PomUtils.get_modules()
+      self.assertEquals({'a', 'b'}, compute_affected_modules(
+        root, modules, [os.path.join(root, 'a/pom.xml')],
+        previous_dependees=read_dependees_index(dependees_index)))
+      self.assertEquals({}, read_dependees_index(os.path.join(root, 'missing.index')))
+
+  def test_generated_files_of_modules(self):
+    root = '/repo'
+    generated = ['/repo/a/BUILD.gen', '/repo/a/src/main/proto/BUILD.gen', '/repo/a/nested/BUILD.aux',
+                 '/repo/b/BUILD.aux', '/repo/3rdparty/BUILD.gen']
+    self.assertEquals(['/repo/a/BUILD.gen', '/repo/a/src/main/proto/BUILD.gen'],
+                      generated_files_of_modules(root, ['a', 'a/nested', 'b'], {'a'}, generated))
+    self.assertEquals(['/repo/a/nested/BUILD.aux', '/repo/b/BUILD.aux'],
+                      generated_files_of_modules(root, ['a', 'a/nested', 'b'], {'a/nested', 'b'},
+                                                 generated))
+
+  def test_stat_cache(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'pom.xml')
+      with open(path, 'w') as f:
+        f.write('contents')
+      stats = []
+      compute_hashes([path], stats=stats)
+      self.assertEquals([stat_key(path)], stats)
+
+      index_file = os.path.join(tmpdir, 'poms.index')
+      write_index(index_file, [(path, 'cached-sha') + stats[0]])
+      entries = read_index(index_file, num_fields=5)
+      # Entries modified at or after the time the index was written are not trusted.
+      self.assertEquals({}, load_stat_cache(entries, trusted_before=os.path.getmtime(path)))
+      stat_cache = load_stat_cache(entries, trusted_before=os.path.getmtime(path) + 1)
+      self.assertEquals(['cached-sha'], compute_hashes([path], stat_cache=stat_cache))
+
+      with open(path, 'a') as f:
+        f.write(' and more')
+      self.assertNotEquals(['cached-sha'], compute_hashes([path], stat_cache=stat_cache))
+
+  def test_noop_run_stores_new_stat_keys(self):
+    with temporary_dir() as tmpdir:
+      root = os.path.realpath(tmpdir)
+      self._create_repo(root)
+      os.chdir(root)
+      checkpoms = CheckPoms(root, [])
+      os.makedirs(checkpoms.index_dir)
+      deps, hashes, stats = find_and_hash_deps(root)
+      # As if the files were checked out again since the index was written.
+      write_index(checkpoms.index_file, [(dep, sha, '1.0', size, inode)
+                                         for dep, sha, (_, size, inode) in zip(deps, hashes, stats)])
+
+      checkpoms._find_dependencies()
+      checkpoms._find_dependency_differences()
+      self.assertEquals(0, checkpoms.total_diffs)
+      checkpoms._regenerate_if_necessary_and_reindex()
+      self.assertEquals(set((dep, sha) + key for dep, sha, key in zip(deps, hashes, stats)),
+                        read_index(checkpoms.index_file, num_fields=5))
+
+  def test_find_files(self):
+    with temporary_dir() as tmpdir:
+      for path in ['pom.xml', 'a/pom.xml', 'a/BUILD', 'a/target/pom.xml', 'b/.pants.d/BUILD',
+                   'a/src/main/java/Foo.java']:
+        touch(os.path.join(tmpdir, path), makedirs=True)
+      found = find_files([tmpdir], ['pom.xml', 'BUILD*', '*/src/main/java'],
+                         exclude_contains=('/target/', '/.pants.d/'))
+      self.assertEquals(set(os.path.join(tmpdir, path) for path in
+                            ['pom.xml', 'a/pom.xml', 'a/BUILD', 'a/src/main/java']),
+                        found)
@@ -3,9 +3,10 @@
 # Run with:
 # ./pants test squarepants/src/test/python/squarepants_test:graph_util
 
+import random
 import unittest2 as unittest
 
-from squarepants.graph_util import Graph
+from squarepants.graph_util import CompactGraph, Graph
 
 class GraphUtilTest(unittest.TestCase):
 
@@ -86,3 +87,123 @@ Edges:
 
     with self.assertRaises(Graph.CycleError):
       self._char_graph('ab', ('ab', 'ba')).topological_ordering()
+
+  def test_remove_vertex(self):
+    graph = self._char_graph('abcd', ('ab', 'bc', 'cb', 'bd', 'ad'))
+    graph.remove_vertex('b')
+    self.assertEquals(set('acd'), graph.vertices)
+    self.assertEquals({Graph.Edge('a', 'd')}, graph.edges)
+    self.assertEquals(set(), graph.outgoing_vertices('c'))
+    self.assertEquals(set('a'), graph.incoming_vertices('d'))
+    self.assertEquals(('a', 'c', 'd'), tuple(graph.topological_ordering(stable=True)))
+
+  def test_search_paths(self):
+    graph = self._char_graph('abcde', ('ab', 'bc', 'cd', 'ae', 'ca'))
+    self.assertEquals([((), 'a'), (('a',), 'b'), (('a',), 'e'), (('a', 'b'), 'c'),
+                       (('a', 'b', 'c'), 'd')],
+                      sorted(graph.search('a'), key=lambda (path, vertex): (len(path), vertex)))
+
+    cycles = []
+    graph.search_set('a', cycle_handler=lambda path, vertex: cycles.append((path, vertex)))
+    self.assertEquals([(('a', 'b', 'c'), 'a')], cycles)
+
+    dfs = [vertex for path, vertex in graph.search('a', next_index=lambda frontier: -1)]
+    self.assertEquals('a', dfs[0])
+    self.assertEquals(set('abcde'), set(dfs))
+    # Depth first: once b is expanded, c and d come straight after it.
+    self.assertEquals(list('bcd'), dfs[dfs.index('b'):dfs.index('b') + 3])
+
+    self.assertEquals(set('abcde'), graph.search_set('ce', multistart=True,
+                                                     adjacent=graph.outgoing_vertices))
+
+  def test_search_next_index(self):
+    graph = self._char_graph('abcde', ('ab', 'ac', 'bd', 'ce'))
+    frontiers = []
+    def first(frontier):
+      frontiers.append(set(frontier))
+      return 0
+    self.assertEquals(set('abcde'), graph.search_set('a', next_index=first))
+    # The frontier holds the paths to the vertices waiting to be expanded.
+    self.assertEquals([{('a',)}, {('a', 'b'), ('a', 'c')}], frontiers[:2])
+    self.assertIn(frontiers[2], ({('a', 'c'), ('a', 'b', 'd')}, {('a', 'b'), ('a', 'c', 'e')}))
+
+    uniform_cost = lambda _: min(range(len(_)), key=_.__getitem__)
+    self.assertEquals(list('abdce'),
+                      [vertex for path, vertex in graph.search('a', next_index=uniform_cost)])
+
+  def test_topological_ordering_cycle_edges(self):
+    graph = self._char_graph('abcd', ('ab', 'bc', 'cb', 'cd'))
+    with self.assertRaises(Graph.CycleError) as cm:
+      graph.topological_ordering()
+    self.assertIn('b -> c', str(cm.exception))
+    self.assertIn('c -> b', str(cm.exception))
+    self.assertIn('c -> d', str(cm.exception))
+    self.assertNotIn('a -> b', str(cm.exception))
+
+
+class CompactGraphTest(unittest.TestCase):
+
+  def _brute_force_reachable(self, vertices, edges, src):
+    return Graph(vertices=vertices, edges=[Graph.Edge(u, v) for u, v in edges]).search_set(
+      [dst for u, dst in edges if u == src], multistart=True)
+
+  def _random_edges(self, vertex_count, edge_count, acyclic, seed):
+    rng = random.Random(seed)
+    edges = set()
+    while len(edges) < edge_count:
+      u, v = rng.randrange(vertex_count), rng.randrange(vertex_count)
+      if acyclic and u >= v:
+        continue
+      edges.add((u, v))
+    return edges
+
+  def test_closure(self):
+    graph = CompactGraph('abcde', ('ab', 'bc', 'cb', 'cd', 'ee'))
+    self.assertEquals(set('bcd'), graph.reachable_vertices('a'))
+    self.assertEquals(set('bcd'), graph.reachable_vertices('b'))
+    self.assertEquals(set(), graph.reachable_vertices('d'))
+    self.assertEquals(set('e'), graph.reachable_vertices('e'))
+    self.assertTrue(graph.reaches('a', 'd'))
+    self.assertFalse(graph.reaches('d', 'a'))
+    self.assertFalse(graph.reaches('a', 'a'))
+
+    for acyclic in (True, False):
+      edges = self._random_edges(40, 80, acyclic, seed=1)
+      graph = CompactGraph(range(40), edges)
+      for vertex in range(40):
+        self.assertEquals(self._brute_force_reachable(range(40), edges, vertex),
+                          graph.reachable_vertices(vertex))
+
+  def test_strongly_connected_components(self):
+    graph = CompactGraph('abcdef', ('ab', 'bc', 'cb', 'cd', 'ee', 'fa'))
+    components = graph.strongly_connected_components()
+    self.assertEquals({'a', 'bc', 'd', 'e', 'f'}, {''.join(sorted(c)) for c in components})
+    position = {vertex: index for index, component in enumerate(components) for vertex in component}
+    for src, dst in graph.edges:
+      self.assertTrue(position[src] >= position[dst])
+
+  def test_transitive_reduction(self):
+    graph = CompactGraph('abcd', ('ab', 'bc', 'ac', 'ad', 'cd'))
+    self.assertEquals(set('cd'), graph.implied_successors('a'))
+    self.assertEquals({('a', 'b'), ('b', 'c'), ('c', 'd')}, set(graph.transitive_reduction().edges))
+
+    # Edges within a cycle are kept, and so are edges only implied by paths around the cycle.
+    graph = CompactGraph('abcde', ('ab', 'ba', 'bc', 'ac', 'cd', 'ce', 'de'))
+    self.assertEquals({('a', 'b'), ('b', 'a'), ('b', 'c'), ('a', 'c'), ('c', 'd'), ('d', 'e')},
+                      set(graph.transitive_reduction().edges))
+
+    for acyclic in (True, False):
+      edges = self._random_edges(40, 100, acyclic, seed=2)
+      graph = CompactGraph(range(40), edges)
+      reduced = graph.transitive_reduction()
+      for vertex in range(40):
+        self.assertEquals(graph.reachable_vertices(vertex), reduced.reachable_vertices(vertex))
+      if acyclic:
+        for u, v in reduced.edges:
+          self.assertFalse(any(graph.reaches(w, v) for w in graph.outgoing_vertices(u) if w != v))
+
+  def test_from_graph(self):
+    graph = Graph(vertices='abc', edges=[Graph.Edge('a', 'b')])
+    compact = CompactGraph.from_graph(graph)
+    self.assertEquals(set('abc'), set(compact.vertices))
+    self.assertEquals([('a', 'b')], list(compact.edges))
@@ -0,0 +1,89 @@
+# Tests for code in squarepants/src/main/python/squarepants/pom_directory_index.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:pom_directory_index
+
+import os
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir, touch
+from squarepants.pom_directory_index import PomDirectoryIndex
+
+
+class PomDirectoryIndexTest(unittest.TestCase):
+
+  def _touch_all(self, root, paths):
+    for path in paths:
+      touch(os.path.join(root, path), makedirs=True)
+
+  def test_closest_pom_dir(self):
+    with temporary_dir() as root:
+      self._touch_all(root, [
+        'pom.xml',
+        'foo/pom.xml',
+        'foo/src/main/java/com/example/Foo.java',
+        'foo/bar/pom.xml',
+        'foo/bar/baz/BUILD',
+        'loose/BUILD',
+      ])
+      index = PomDirectoryIndex.scan(root)
+      self.assertEquals('foo', index.closest_pom_dir('foo'))
+      self.assertEquals('foo', index.closest_pom_dir('foo/src/main/java/com/example'))
+      self.assertEquals('foo/bar', index.closest_pom_dir('foo/bar/baz'))
+      self.assertEquals('foo/bar', index.closest_pom_dir(os.path.join(root, 'foo', 'bar')))
+      self.assertEquals('', index.closest_pom_dir('loose'))
+      self.assertEquals('', index.closest_pom_dir('.'))
+      self.assertEquals(None, index.closest_pom_dir('..'))
+      self.assertTrue(index.has_pom('foo/bar'))
+      self.assertFalse(index.has_pom('foo/bar/baz'))
+
+  def test_closest_pom_dir_without_top_pom(self):
+    with temporary_dir() as root:
+      self._touch_all(root, ['foo/pom.xml', 'loose/BUILD'])
+      index = PomDirectoryIndex.scan(root)
+      self.assertEquals(None, index.closest_pom_dir('loose'))
+      self.assertEquals(None, index.closest_pom_dir(''))
+      self.assertEquals('foo', index.closest_pom_dir('foo/src'))
+
+  def test_skips_output_and_hidden_dirs(self):
+    with temporary_dir() as root:
+      self._touch_all(root, [
+        'pom.xml',
+        'foo/pom.xml',
+        'foo/target/classes/META-INF/maven/com.example/foo/pom.xml',
+        '.pants.d/gen/pom.xml',
+        'target/pom.xml',
+      ])
+      index = PomDirectoryIndex.scan(root)
+      self.assertEquals('foo', index.closest_pom_dir('foo/target/classes/META-INF/maven'))
+      self.assertEquals('', index.closest_pom_dir('.pants.d/gen'))
+      self.assertEquals('', index.closest_pom_dir('target'))
+
+  def test_pom_dirs_under(self):
+    with temporary_dir() as root:
+      self._touch_all(root, [
+        'pom.xml',
+        'foo/pom.xml',
+        'foo/bar/pom.xml',
+        'foo/bar/baz/qux/pom.xml',
+        'foo-bar/pom.xml',
+        'foo.bar/pom.xml',
+        'other/pom.xml',
+      ])
+      index = PomDirectoryIndex.scan(root)
+      self.assertEquals(['foo', 'foo/bar', 'foo/bar/baz/qux'], index.pom_dirs_under('foo'))
+      self.assertEquals(['foo/bar/baz/qux'], index.pom_dirs_under('foo/bar/baz'))
+      self.assertEquals(['foo/bar', 'foo/bar/baz/qux'],
+                        index.pom_dirs_under(os.path.join(root, 'foo', 'bar')))
+      self.assertEquals(['', 'foo', 'foo-bar', 'foo.bar', 'foo/bar', 'foo/bar/baz/qux', 'other'],
+                        index.pom_dirs_under(''))
+      self.assertEquals([], index.pom_dirs_under('missing'))
+      self.assertEquals([], index.pom_dirs_under('..'))
+
+  def test_scan_is_a_snapshot(self):
+    with temporary_dir() as root:
+      self._touch_all(root, ['foo/pom.xml'])
+      index = PomDirectoryIndex.scan(root)
+      self._touch_all(root, ['bar/pom.xml'])
+      self.assertEquals(None, index.closest_pom_dir('bar'))
+      self.assertEquals('bar', PomDirectoryIndex.scan(root).closest_pom_dir('bar'))
@@ -92,6 +92,79 @@ class BuildComponentTest(unittest.TestCase):
       self.assertEquals(None, mock_pom_file.parent)
       self.assertEquals('1.2.3', mock_pom_file.properties['foo'])
 
+  def _write_pom(self, root, path, artifact_id, parent=None, body=''):
+    parent_block = ''
+    if parent:
+      parent_block = """
+            <parent>
+              <groupId>com.example</groupId>
+              <artifactId>{parent}</artifactId>
+              <version>HEAD-SNAPSHOT</version>
+              <relativePath>../parents/base/pom.xml</relativePath>
+            </parent>""".format(parent=parent)
+    full_path = os.path.join(root, path)
+    if not os.path.exists(os.path.dirname(full_path)):
+      os.makedirs(os.path.dirname(full_path))
+    with open(full_path, 'w') as f:
+      f.write("""<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>{artifact_id}</artifactId>
+            <version>HEAD-SNAPSHOT</version>
+            {parent_block}
+            {body}
+          </project>
+          """.format(artifact_id=artifact_id, parent_block=parent_block, body=body))
+
+  def _compiler_plugin(self, source, *args):
+    return """
+            <build>
+              <plugins>
+                <plugin>
+                  <groupId>org.apache.maven.plugins</groupId>
+                  <artifactId>maven-compiler-plugin</artifactId>
+                  <configuration>
+                    <source>{source}</source>
+                    <compilerArgs>{args}</compilerArgs>
+                  </configuration>
+                </plugin>
+              </plugins>
+            </build>""".format(source=source, args=''.join('<arg>{}</arg>'.format(a) for a in args))
+
+  def test_inherited_settings(self):
+    with temporary_dir() as temp_path:
+      self._write_pom(temp_path, 'pom.xml', 'all',
+                      body='<modules><module>one</module><module>two</module></modules>')
+      self._write_pom(temp_path, 'parents/base/pom.xml', 'mock-parent',
+                      body='<properties><foo>1.2.3</foo><bar>parent</bar></properties>'
+                           + self._compiler_plugin('1.7', '-Xlint:all', '-Xbootclasspath:/a'))
+      self._write_pom(temp_path, 'one/pom.xml', 'one', parent='mock-parent',
+                      body='<properties><bar>one</bar></properties>'
+                           + self._compiler_plugin('1.8', '-Xlint:unchecked'))
+      self._write_pom(temp_path, 'two/pom.xml', 'two', parent='mock-parent')
+
+      one = PomFile('one/pom.xml', temp_path)
+      two = PomFile('two/pom.xml', temp_path)
+      self.assertEquals('1.2.3', one.properties['foo'])
+      self.assertEquals('one', one.properties['bar'])
+      self.assertEquals('parent', two.properties['bar'])
+      self.assertEquals("' + symbols.module_directory + '", two.properties['project.basedir'])
+      self.assertEquals('1.8', one.java_options.source_level)
+      self.assertEquals(['-C-Xlint:all', '-C-Xbootclasspath:/a', '-C-Xlint:unchecked'],
+                        one.java_options.compile_args)
+      self.assertEquals('1.7', two.java_options.source_level)
+      self.assertEquals(['-C-Xlint:all', '-C-Xbootclasspath:/a'], two.java_options.compile_args)
+
+      # The parent's settings are only resolved once, and are shared by its children.
+      self.assertIs(one.settings.parent, two.settings.parent)
+      self.assertIs(two.settings, PomFile('two/pom.xml', temp_path).settings)
+      self.assertEquals('parents/base/pom.xml', one.parent.path)
+      self.assertEquals(None, one.parent.parent)
+
+      # Once the parsed poms are forgotten, so are the settings resolved from them.
+      PomUtils.reset_caches()
+      self.assertIsNot(two.settings, PomFile('two/pom.xml', temp_path).settings)
+
   def _find_node_text(self, tree, path):
     prefix = tree.tag[:tree.tag.rfind('}')+1]
     path = ['{0}{1}'.format(prefix, tag) for tag in path]
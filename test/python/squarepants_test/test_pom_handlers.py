@@ -3,17 +3,23 @@
 # Run with:
 # ./pants test squarepants/src/test/python/squarepants_test:pom_handlers
 
+import cPickle as pickle
 import os
 import pytest
+import sys
 from textwrap import dedent
 import unittest2 as unittest
 import xml.sax
 import logging
+from xml.etree import ElementTree
 
 import squarepants.pom_handlers
+from squarepants.pom_parse_cache import PomParseCache
 from squarepants.pom_utils import PomUtils
 from squarepants.file_utils import temporary_dir
 
+from squarepants_benchmark.synthetic_repo import SyntheticRepo, SyntheticRepoConfig
+
 
 ROOT_POM=dedent('''<?xml version="1.0" encoding="UTF-8"?>
     <project xmlns="http://maven.apache.org/POM/4.0.0"
@@ -221,6 +227,73 @@ DEPENDENCY_POM=dedent('''<?xml version="1.0" encoding="UTF-8"?>
       </dependencies>
     </project>''')
 
+WIRE_POM=dedent('''<?xml version="1.0" encoding="UTF-8"?>
+    <project xmlns="http://maven.apache.org/POM/4.0.0"
+        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+        xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xsd/maven-4.0.0.xsd">
+      <modelVersion>4.0.0</modelVersion>
+      <build>
+        <plugins>
+          <plugin>
+            <groupId>org.apache.maven.plugins</groupId>
+            <artifactId>maven-dependency-plugin</artifactId>
+            <executions>
+              <execution>
+                <id>unpack</id>
+                <phase>initialize</phase>
+                <goals>
+                  <goal>unpack</goal>
+                </goals>
+                <configuration>
+                  <artifactItems>
+                    <artifactItem>
+                      <groupId>com.squareup.protos</groupId>
+                      <artifactId>all-protos</artifactId>
+                      <overWrite>true</overWrite>
+                      <outputDirectory>${project.build.directory}/../src/main/wire_proto</outputDirectory>
+                      <includes>squareup/xp/validation.proto,squareup/xp/oauth/**,squareup/xp/v1/common.proto,squareup/xp/v1/http.proto</includes>
+                    </artifactItem>
+                    <artifactItem>
+                      <groupId>com.google.protobuf</groupId>
+                      <artifactId>protobuf-java</artifactId>
+                      <overWrite>true</overWrite>
+                      <outputDirectory>${project.build.directory}/../src/main/wire_proto</outputDirectory>
+                      <includes>**/descriptor.proto</includes>
+                    </artifactItem>
+                  </artifactItems>
+                </configuration>
+              </execution>
+            </executions>
+          </plugin>
+          <plugin>
+            <groupId>com.squareup.wire</groupId>
+            <artifactId>wire-maven-plugin</artifactId>
+            <executions>
+              <execution>
+                <goals>
+                  <goal>generate-sources</goal>
+                </goals>
+                <phase>generate-sources</phase>
+              </execution>
+            </executions>
+            <configuration>
+              <noOptions>true</noOptions>
+              <serviceFactory>com.squareup.wire.java.SimpleServiceFactory</serviceFactory>
+              <serviceFactory>com.squareup.wire.java.SimpleServiceFactory</serviceFactory>
+              <protoFiles>
+                <protoFile>squareup/protobuf/rpc/rpc.proto</protoFile>
+                <protoFile>squareup/sake/wire_format.proto</protoFile>
+              </protoFiles>
+              <roots>
+                <root>squareup.franklin.settings.UnlinkSmsRequest</root>
+                <root>squareup.franklin.settings.VerifyEmailRequest</root>
+              </roots>
+            </configuration>
+          </plugin>
+        </plugins>
+      </build>
+    </project>''')
+
 
 
 class PomHandlerTest(unittest.TestCase):
@@ -493,6 +566,48 @@ class PomHandlerTest(unittest.TestCase):
                         }, df.dependencies[4])
 
       self.assertEquals(5, len(df.dependencies))
+      # Inherited entries are shared with the parent pom rather than copied.
+      self.assertIs(df.parent.dependencies[-1], df.dependencies[4])
+
+  def test_dependency_entries(self):
+    Dependency = squarepants.pom_handlers.Dependency
+    dep = Dependency.from_dict({u'groupId': 'com.example', u'artifactId': 'foo',
+                                u'version': '${foo.version}', u'scope': 'test',
+                                u'exclusions': [{u'groupId': 'com.example',
+                                                 u'artifactId': 'bar'}]})
+    self.assertEquals('foo', dep['artifactId'])
+    self.assertEquals('test', dep.get('scope'))
+    self.assertIsNone(dep.get('classifier'))
+    self.assertIn('version', dep)
+    self.assertNotIn('type', dep)
+    self.assertEquals(('com.example', 'foo'), dep.key)
+    self.assertEquals(('com.example', 'bar'), dep['exclusions'][0].key)
+    self.assertIs(intern('com.example'), dep.groupId)
+    with self.assertRaises(AttributeError):
+      dep.version = '1.0'
+
+    # Compares equal to the dict it was made from, whether the exclusions are a list or a tuple.
+    entry = {u'groupId': 'com.example', u'artifactId': 'foo', u'version': '${foo.version}',
+             u'scope': 'test', u'exclusions': [{u'groupId': 'com.example', u'artifactId': 'bar'}]}
+    self.assertEquals(entry, dep)
+    self.assertEquals(dep, dict(entry, exclusions=tuple(entry['exclusions'])))
+    self.assertNotEquals(dep, dict(entry, exclusions=[]))
+    self.assertNotEquals(dep, dict(entry, classifier=None))
+    self.assertNotEquals(dep, {u'groupId': 'com.example', u'artifactId': 'foo'})
+
+    substituted = dep.substituted({'foo.version': '1.0'})
+    self.assertEquals('1.0', substituted['version'])
+    self.assertEquals(dep['exclusions'], substituted['exclusions'])
+    self.assertIs(substituted, substituted.substituted({'foo.version': '2.0'}))
+
+    unpickled = pickle.loads(pickle.dumps(substituted, pickle.HIGHEST_PROTOCOL))
+    self.assertEquals(substituted, unpickled)
+    self.assertIs(substituted.artifactId, unpickled.artifactId)
+
+    parent = Dependency.from_dict({u'groupId': 'com.example', u'artifactId': 'parent',
+                                   u'relativePath': '../pom.xml'})
+    self.assertNotIn('exclusions', parent)
+    self.assertEquals(['groupId', 'artifactId', 'relativePath'], parent.keys())
 
   def test_dependency_finder_parent_properties(self):
     with temporary_dir() as tmpdir:
@@ -686,6 +801,253 @@ xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xs
       self.assertEquals(set([('com.squareup.protos', 'all-protos',), ('com.google.protobuf', 'protobuf-java',),]), set(wf.artifacts))
       self.assertEquals('**/descriptor.proto', wf.artifacts[('com.google.protobuf', 'protobuf-java',)]['includes'])
 
+  def test_single_parse_per_pom(self):
+    with temporary_dir() as tmpdir:
+      with open(os.path.join(tmpdir, 'pom.xml'), 'w') as pomfile:
+        pomfile.write(DEPENDENCY_MANAGEMENT_POM)
+      invocations = squarepants.pom_handlers.PomContentHandler.num_invocations()
+
+      df = squarepants.pom_handlers.DependencyInfo('pom.xml', rootdir=tmpdir)
+      dmf = squarepants.pom_handlers.DependencyManagementFinder(rootdir=tmpdir)
+      deps = dmf.find_dependencies('pom.xml')
+      wf = squarepants.pom_handlers.WireInfo.from_pom('pom.xml', rootdir=tmpdir)
+      manager = squarepants.pom_handlers.PomHandlerManager.parse('pom.xml', rootdir=tmpdir)
+
+      self.assertEquals(invocations + 1,
+                        squarepants.pom_handlers.PomContentHandler.num_invocations())
+      self.assertEquals('base', df.artifactId)
+      self.assertEquals(2, len(deps))
+      self.assertEquals([], wf.protos)
+      self.assertIs(wf, manager.infos[squarepants.pom_handlers.WireInfo])
+
+  def test_path_dispatch(self):
+    pom_handlers = squarepants.pom_handlers
+
+    class RecordingHandler(pom_handlers.GenericPomHandler):
+      def __init__(self, parent):
+        super(RecordingHandler, self).__init__(parent)
+        self.seen = []
+
+      def endElement(self, name):
+        self.seen.append('/'.join(self.path))
+
+    class ModulesHandler(RecordingHandler):
+      path_prefixes = (['project', 'modules'],)
+
+    class ParentAndDepsHandler(RecordingHandler):
+      path_prefixes = (['project', 'parent'], ['project', 'dependencies', 'dependency'])
+
+    parser = pom_handlers._DispatchingContentHandler()
+    handlers = [ModulesHandler(parser), ParentAndDepsHandler(parser), RecordingHandler(parser)]
+    parser._set_handlers(handlers)
+    xml.sax.parseString(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+        <project>
+          <parent><artifactId>base</artifactId></parent>
+          <modules><module>foo</module></modules>
+          <dependencies><dependency><artifactId>bar</artifactId></dependency></dependencies>
+        </project>
+        '''), parser)
+
+    self.assertEquals(['project/modules/module', 'project/modules'], handlers[0].seen)
+    self.assertEquals(['project/parent/artifactId', 'project/parent',
+                       'project/dependencies/dependency/artifactId',
+                       'project/dependencies/dependency'], handlers[1].seen)
+    self.assertEquals(8, len(handlers[2].seen))
+    self.assertEquals('project', handlers[2].seen[-1])
+
+  def test_content_collection(self):
+    pom_handlers = squarepants.pom_handlers
+    handler = pom_handlers.PomContentHandler()
+    handler.startElement('project', {})
+    handler.startElement('properties', {})
+    handler.startElement('foo', {})
+    for chunk in (u'  a', u'&', u'\u00e9b', u'  '):
+      handler.characters(chunk)
+    self.assertEquals('  a&b  ', handler.content)
+    handler.endElement('foo')
+    self.assertEquals('a&b', handler.properties['foo'])
+
+    # Text is only collected for the elements that someone reads it from.
+    parser = pom_handlers.TopPomContentHandler()
+    xml.sax.parseString(ROOT_POM, parser)
+    self.assertEquals(['foo', 'bar'], parser.modules)
+    self.assertEquals('top', parser.artifactId)
+    self.assertEquals('${prop.foo}-BAZ', parser.properties['prop.baz'])
+    trie = pom_handlers._PathDispatchTrie.compile(parser.handlers, parser.text_path_prefixes)
+    self.assertTrue(trie.child('project').child('modules').child('module').collects_text)
+    self.assertTrue(trie.child('project').child('properties').child('prop.foo').collects_text)
+    self.assertFalse(trie.child('project').collects_text)
+    self.assertFalse(trie.child('project').child('scm').child('url').collects_text)
+
+  def test_pom_handler_manager_content_collection(self):
+    pom_handlers = squarepants.pom_handlers
+
+    class RecordingManager(pom_handlers.PomHandlerManager):
+      def __init__(self, source_file_name):
+        pom_handlers.PomHandlerManager.__init__(self, source_file_name)
+        self.collected = []
+
+      def endElement(self, name):
+        if ''.join(self._chunks).strip():
+          self.collected.append(self.path[:])
+        pom_handlers.PomHandlerManager.endElement(self, name)
+
+    manager = RecordingManager('pom.xml')
+    for handler in manager.handlers:
+      self.assertNotIn([], handler.path_prefixes, type(handler).__name__)
+    prefixes = [prefix for handler in manager.handlers for prefix in handler.path_prefixes]
+    prefixes.extend(manager.text_path_prefixes)
+
+    xml.sax.parseString(WIRE_POM.replace('<build>', dedent('''
+        <name>wire-example</name>
+        <description>Not read by any handler.</description>
+        <scm><url>https://example.com/wire-example</url></scm>
+        <reporting>
+          <plugins>
+            <plugin>
+              <groupId>org.apache.maven.plugins</groupId>
+              <artifactId>maven-javadoc-plugin</artifactId>
+            </plugin>
+          </plugins>
+        </reporting>
+        <build>
+          <extensions>
+            <extension>
+              <groupId>kr.motd.maven</groupId>
+              <artifactId>os-maven-plugin</artifactId>
+            </extension>
+          </extensions>
+        ''')), manager)
+
+    self.assertIn(['project', 'build', 'plugins', 'plugin', 'configuration', 'roots', 'root'],
+                  manager.collected)
+    for path in manager.collected:
+      self.assertTrue(any(path[:len(prefix)] == prefix for prefix in prefixes), path)
+    for path in (['project', 'modelVersion'], ['project', 'description'],
+                 ['project', 'scm', 'url'],
+                 ['project', 'reporting', 'plugins', 'plugin', 'artifactId'],
+                 ['project', 'build', 'extensions', 'extension', 'groupId']):
+      self.assertNotIn(path, manager.collected)
+    wire_info = manager.infos[pom_handlers.WireInfo]
+    self.assertEquals(['squareup/protobuf/rpc/rpc.proto', 'squareup/sake/wire_format.proto'],
+                      wire_info.protos)
+
+  def _parse_with_backend(self, backend, pom_contents):
+    """:returns: everything a PomHandlerManager parsed from pom_contents, as comparable dicts."""
+    manager = squarepants.pom_handlers.PomHandlerManager
+    manager.parse_backend = backend
+    try:
+      with temporary_dir() as tmpdir:
+        with open(os.path.join(tmpdir, 'pom.xml'), 'w') as pomfile:
+          pomfile.write(pom_contents)
+        state = manager.parse('pom.xml', rootdir=tmpdir)._cacheable_state()
+    finally:
+      manager.parse_backend = None
+      manager.reset()
+    infos = state.pop('infos')
+    for info_type, info in infos.items():
+      state[info_type.__name__] = {name: (value if name != 'config_tree'
+                                          else value is not None and ElementTree.tostring(value))
+                                   for name, value in vars(info).items()}
+    return state
+
+  def _fixture_poms(self):
+    """:returns: (name, contents) of the poms above, and of every pom in a synthetic repo."""
+    poms = [('ROOT_POM', ROOT_POM), ('DEPENDENCY_MANAGEMENT_POM', DEPENDENCY_MANAGEMENT_POM),
+            ('DEPENDENCY_POM', DEPENDENCY_POM), ('WIRE_POM', WIRE_POM)]
+    with temporary_dir() as tmpdir:
+      SyntheticRepo(tmpdir, SyntheticRepoConfig(modules=8, third_party=20)).create()
+      for dirpath, dirnames, filenames in sorted(os.walk(tmpdir)):
+        if 'pom.xml' in filenames:
+          with open(os.path.join(dirpath, 'pom.xml')) as pomfile:
+            poms.append((os.path.relpath(dirpath, tmpdir), pomfile.read()))
+    return poms
+
+  def test_parse_backends(self):
+    backends = squarepants.pom_handlers.PARSE_BACKENDS
+    self.assertIn('sax', backends)
+    self.assertIn('expat', backends)
+    for name, pom_contents in self._fixture_poms():
+      expected = self._parse_with_backend('sax', pom_contents)
+      for backend in backends:
+        self.assertEquals(expected, self._parse_with_backend(backend, pom_contents),
+                          '{} with {}'.format(name, backend))
+
+    malformed = ROOT_POM.replace('</modules>', '</module>')
+    errors = {}
+    for backend in backends:
+      with self.assertRaises(squarepants.pom_handlers.MalformattedPOMException) as cm:
+        self._parse_with_backend(backend, malformed)
+      # Drop the temporary directory the pom.xml was in.
+      errors[backend] = str(cm.exception).rsplit('/pom.xml:', 1)[1]
+      self.assertTrue(errors[backend].startswith('45:'), errors[backend])
+    self.assertEquals(errors['sax'], errors['expat'])
+
+    with self.assertRaises(ValueError):
+      self._parse_with_backend('no-such-backend', ROOT_POM)
+
+  def test_pom_handler_manager_missing_pom(self):
+    with temporary_dir() as tmpdir:
+      manager = squarepants.pom_handlers.PomHandlerManager
+      self.assertIsNone(manager.parse('pom.xml', rootdir=tmpdir))
+      with self.assertRaises(IOError):
+        manager.parse('pom.xml', rootdir=tmpdir, ignore_missing=False)
+
+  def test_persistent_parse_cache(self):
+    manager = squarepants.pom_handlers.PomHandlerManager
+    with temporary_dir() as tmpdir:
+      with open(os.path.join(tmpdir, 'pom.xml'), 'w') as pomfile:
+        pomfile.write(DEPENDENCY_MANAGEMENT_POM)
+      manager.persistent_cache = PomParseCache(os.path.join(tmpdir, 'cache'))
+      try:
+        parsed = manager.parse('pom.xml', rootdir=tmpdir)
+        PomUtils.reset_caches()
+        invocations = squarepants.pom_handlers.PomContentHandler.num_invocations()
+        cached = manager.parse('pom.xml', rootdir=tmpdir)
+        self.assertEquals(invocations, squarepants.pom_handlers.PomContentHandler.num_invocations())
+        self.assertIsNot(parsed, cached)
+        self.assertEquals(parsed.artifactId, cached.artifactId)
+        self.assertEquals(parsed.properties, cached.properties)
+        self.assertEquals(parsed.dependency_management, cached.dependency_management)
+      finally:
+        manager.persistent_cache = None
+
+  def test_persistent_parse_cache_platform(self):
+    manager = squarepants.pom_handlers.PomHandlerManager
+    platform = sys.platform
+    with temporary_dir() as tmpdir:
+      with open(os.path.join(tmpdir, 'pom.xml'), 'w') as pomfile:
+        pomfile.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <profiles>
+              <profile>
+                <activation><os><name>mac os x</name></os></activation>
+                <properties><java.home>/Library/Java</java.home></properties>
+              </profile>
+            </profiles>
+          </project>
+        '''))
+      manager.persistent_cache = PomParseCache(os.path.join(tmpdir, 'cache'))
+      try:
+        properties = {}
+        for name in ('darwin', 'linux2'):
+          sys.platform = name
+          manager.reset()
+          parsed = manager.parse('pom.xml', rootdir=tmpdir)
+          properties[name] = parsed.infos[squarepants.pom_handlers.SpecialPropertiesInfo].properties
+      finally:
+        sys.platform = platform
+        manager.persistent_cache = None
+        manager.reset()
+    self.assertEquals({'java.home': '/Library/Java'}, properties['darwin'])
+    self.assertEquals({}, properties['linux2'])
+
+  def test_pickle_shading_rule(self):
+    rule = squarepants.pom_handlers.ShadingInfo.Rule('com.google.common.', 'shaded.com.google.common.')
+    unpickled = pickle.loads(pickle.dumps(rule, pickle.HIGHEST_PROTOCOL))
+    self.assertEquals(rule, unpickled)
+    self.assertEquals(rule.text, unpickled.text)
+
   @pytest.mark.xfail
   def test_pom_provides_target(self):
     # TODO(zundel): Not implemented
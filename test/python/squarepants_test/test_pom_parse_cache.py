@@ -0,0 +1,67 @@
+# Tests for code in squarepants/src/main/python/squarepants/pom_parse_cache.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:pom_parse_cache
+
+import os
+import unittest2 as unittest
+
+from squarepants import file_utils
+from squarepants.file_utils import temporary_dir
+from squarepants.pom_parse_cache import PomParseCache
+
+
+class PomParseCacheTest(unittest.TestCase):
+
+  def test_get_put(self):
+    with temporary_dir() as tmpdir:
+      cache = PomParseCache(tmpdir)
+      self.assertIsNone(cache.get('abc'))
+      cache.put('abc', {'artifactId': 'foo'})
+      self.assertEquals({'artifactId': 'foo'}, cache.get('abc'))
+      self.assertEquals({'artifactId': 'foo'}, PomParseCache(tmpdir).get('abc'))
+      self.assertEquals(1, cache.hits)
+      self.assertEquals(1, cache.misses)
+
+  def test_corrupt_entry(self):
+    with temporary_dir() as tmpdir:
+      cache = PomParseCache(tmpdir)
+      os.makedirs(cache.entries_dir)
+      with open(os.path.join(cache.entries_dir, 'abc'), 'w') as f:
+        f.write('not a pickle')
+      self.assertIsNone(cache.get('abc'))
+      cache.put('abc', 'value')
+      self.assertEquals('value', cache.get('abc'))
+
+  def test_prune_removes_other_versions(self):
+    with temporary_dir() as tmpdir:
+      old_version = os.path.join(tmpdir, 'v0')
+      os.makedirs(old_version)
+      cache = PomParseCache(tmpdir)
+      cache.put('abc', 'value')
+      cache.prune()
+      self.assertFalse(os.path.exists(old_version))
+      self.assertEquals('value', cache.get('abc'))
+
+  def test_prune_evicts_least_recently_used(self):
+    with temporary_dir() as tmpdir:
+      cache = PomParseCache(tmpdir)
+      for index, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, 'x' * 100)
+        os.utime(os.path.join(cache.entries_dir, key), (index, index))
+      entry_size = os.path.getsize(os.path.join(cache.entries_dir, 'a'))
+      PomParseCache(tmpdir, max_bytes=2 * entry_size).prune()
+      self.assertEquals(['b', 'c'], sorted(os.listdir(cache.entries_dir)))
+
+  def test_source_modules_in_key(self):
+    class OtherSourceCache(PomParseCache):
+      SOURCE_MODULES = (file_utils,)
+
+    with temporary_dir() as tmpdir:
+      cache = PomParseCache(tmpdir)
+      cache.put('abc', 'value')
+      other_cache = OtherSourceCache(tmpdir)
+      self.assertNotEquals(cache.entries_dir, other_cache.entries_dir)
+      self.assertIsNone(other_cache.get('abc'))
+      other_cache.prune()
+      self.assertFalse(os.path.exists(cache.entries_dir))
@@ -10,7 +10,7 @@ from textwrap import dedent
 import unittest2 as unittest
 
 from squarepants.pom_to_build import PomToBuild
-from squarepants.generation_context import GenerationContext
+from squarepants.generation_context import DeferredGenerationContext, GenerationContext
 from squarepants.file_utils import temporary_dir, touch
 from squarepants.pom_utils import PomUtils
 
@@ -92,6 +92,39 @@ class PomToBuildTest(unittest.TestCase):
         with open(os.path.join(build_dir, 'BUILD.aux')) as build_file:
           self.assertEquals('contents of BUILD.aux', build_file.read())
 
+  def test_write_build_file_if_changed(self):
+    gen_context = GenerationContext(print_headers=False)
+    with temporary_dir() as build_dir:
+      build_file = os.path.join(build_dir, 'BUILD.gen')
+      gen_context.write_build_file(build_dir, 'contents of BUILD.gen')
+      self.assertEquals(set([os.path.abspath(build_file)]), gen_context.written_files)
+      os.utime(build_file, (1, 1))
+
+      gen_context.write_build_file(build_dir, 'contents of BUILD.gen')
+      self.assertEquals(1, os.path.getmtime(build_file))
+
+      gen_context.write_build_file(build_dir, 'new contents of BUILD.gen')
+      self.assertNotEquals(1, os.path.getmtime(build_file))
+      with open(build_file) as f:
+        self.assertEquals('new contents of BUILD.gen', f.read())
+      # Only the BUILD file itself, no leftover temporary files.
+      self.assertEquals(['BUILD.gen'], os.listdir(build_dir))
+
+  def test_merge_deferred_platforms(self):
+    gen_context = GenerationContext(print_headers=False)
+    self.assertEquals('1.7', gen_context.jvm_platform('1.7', '1.7', []))
+    with temporary_dir() as build_dir:
+      deferred = DeferredGenerationContext()
+      first = deferred.jvm_platform('1.7', '1.7', ['-Xlint'])
+      second = deferred.jvm_platform('1.8', None, [])
+      self.assertEquals(first, deferred.jvm_platform('1.7', '1.7', ['-Xlint']))
+      deferred.write_build_file(build_dir, "platform='{}'\nplatform='{}'\n".format(first, second))
+      self.assertFalse(os.path.exists(os.path.join(build_dir, 'BUILD.gen')))
+      gen_context.merge_deferred(deferred.deferred_platforms, deferred.deferred_build_files)
+      with open(os.path.join(build_dir, 'BUILD.gen')) as build_file:
+        self.assertEquals("platform='1.7-v2'\nplatform='1.8'\n", build_file.read())
+    self.assertEquals('1.7-v2', gen_context.jvm_platform('1.7', '1.7', ['-Xlint']))
+
   def create_pom_with_modules(self, path, modules, extra_project_contents=None,
                               extra_parent_contents=None,
                               extra_root_contents=None):
@@ -263,6 +296,29 @@ class PomToBuildTest(unittest.TestCase):
       self.assertEquals([], os.listdir('child1/src/test/resources'))
 
 
+  def test_ignore_stale_build_files(self):
+    with self.setup_two_child_poms() as tmpdir:
+      # BUILD.gen files left by the previous run are only removed after conversion, so they must
+      # not make the directories look like they hold sources.
+      self.make_file('child1/src/main/java/BUILD.gen', "java_library(name='lib')")
+      self.make_file('child2/src/main/java/BUILD.gen', "java_library(name='lib')")
+      self.make_file('child2/src/main/proto/BUILD.aux', "java_protobuf_library(name='proto')")
+      PomToBuild().convert_pom('child1/pom.xml', rootdir=tmpdir,
+                               generation_context=GenerationContext(print_headers=False))
+
+      triple_quote_string = """
+        target(name='lib')
+
+
+        target(name='test',
+          dependencies = [
+            ':lib'
+          ],
+        )
+      """
+      self.assert_file_contents('child1/BUILD.gen', smart_dedent(triple_quote_string))
+      self.assertEquals(['BUILD.gen'], os.listdir('child1/src/main/java'))
+
   def test_ignore_empty_dirs_in_dep(self):
     with self.setup_two_child_poms() as tmpdir:
       # Create some sources in child1 to create more BUILD.gen files
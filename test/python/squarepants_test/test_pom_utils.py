@@ -4,8 +4,12 @@
 # ./pants test squarepants/src/test/python/squarepants_test:pom_utils
 
 import logging
+import os
+from textwrap import dedent
 import unittest2 as unittest
 
+from squarepants.file_utils import temporary_dir
+from squarepants.pom_handlers import PomHandlerManager
 from squarepants.pom_utils import PomUtils
 
 
@@ -43,6 +47,27 @@ class PomUtilsTest(unittest.TestCase):
     self.assertIsNotNone(epch)
     self.assertIs(epch, PomUtils.external_protos_content_handler())
 
+  def test_top_pom_content_handler_shares_parse(self):
+    with temporary_dir() as tmpdir:
+      with open(os.path.join(tmpdir, 'pom.xml'), 'w') as f:
+        f.write('<project><modules><module>a</module></modules></project>')
+      try:
+        PomUtils.reset_caches()
+        tpch = PomUtils.top_pom_content_handler(rootdir=tmpdir)
+        self.assertEquals(['a'], tpch.modules)
+        self.assertIs(tpch, PomHandlerManager.parse('pom.xml', rootdir=tmpdir))
+      finally:
+        PomUtils.reset_caches()
+
+    with temporary_dir() as tmpdir:
+      try:
+        with self.assertRaises(IOError):
+          PomUtils.top_pom_content_handler(rootdir=tmpdir)
+        # Later calls get an empty handler, like they did when the file was parsed with xml.sax.
+        self.assertEquals([], PomUtils.top_pom_content_handler(rootdir=tmpdir).modules)
+      finally:
+        PomUtils.reset_caches()
+
   def test_get_modules(self):
     top_modules = PomUtils.top_pom_content_handler()
     self.assertIsNotNone(top_modules)
@@ -64,3 +89,50 @@ class PomUtilsTest(unittest.TestCase):
 
   def test_is_external_dep(self):
     self.assertTrue(PomUtils.is_external_dep('bogus-dep'))
+
+  def test_classify_dep(self):
+    def write(path, contents):
+      if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      with open(path, 'w') as f:
+        f.write(dedent(contents))
+
+    cwd = os.getcwd()
+    with temporary_dir() as tmpdir:
+      write(os.path.join(tmpdir, 'pom.xml'), '''<?xml version="1.0" encoding="UTF-8"?>
+        <project>
+          <modules>
+            <module>a</module>
+          </modules>
+        </project>
+      ''')
+      write(os.path.join(tmpdir, 'a', 'pom.xml'), '''<?xml version="1.0" encoding="UTF-8"?>
+        <project>
+          <groupId>com.example</groupId>
+          <artifactId>a</artifactId>
+        </project>
+      ''')
+      write(os.path.join(tmpdir, 'parents', 'base', 'pom.xml'), '''<?xml version="1.0" encoding="UTF-8"?>
+        <project>
+          <dependencyManagement>
+            <dependencies>
+              <dependency>
+                <groupId>com.example</groupId>
+                <artifactId>lib</artifactId>
+                <version>1.0</version>
+              </dependency>
+            </dependencies>
+          </dependencyManagement>
+        </project>
+      ''')
+      try:
+        os.chdir(tmpdir)
+        PomUtils.reset_caches()
+        self.assertEquals((PomUtils.LOCAL_DEP, 'a/pom.xml'), PomUtils.classify_dep('com.example.a'))
+        self.assertEquals((PomUtils.THIRD_PARTY_DEP, None), PomUtils.classify_dep('com.example.lib'))
+        self.assertEquals((PomUtils.EXTERNAL_DEP, None), PomUtils.classify_dep('bogus-dep'))
+        self.assertTrue(PomUtils.is_local_dep('com.example.a'))
+        self.assertTrue(PomUtils.is_external_dep('bogus-dep'))
+      finally:
+        os.chdir(cwd)
+        PomUtils.reset_caches()
@@ -0,0 +1,72 @@
+# Tests for code in squarepants/src/main/python/squarepants/profiling.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:profiling
+
+import json
+import os
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir
+from squarepants.pom_handlers import PomHandlerManager
+from squarepants.pom_utils import PomUtils
+from squarepants.profiling import Profiler
+
+
+class ProfilingTest(unittest.TestCase):
+
+  def setUp(self):
+    PomUtils.reset_caches()
+    Profiler.enable()
+
+  def tearDown(self):
+    Profiler.disable()
+    Profiler.reset()
+    PomUtils.reset_caches()
+
+  def test_disabled(self):
+    Profiler.disable()
+    Profiler.increment('xml.parses')
+    with Profiler.phase('convert_poms'):
+      pass
+    self.assertEquals({}, Profiler.to_dict()['counters'])
+    self.assertEquals([], Profiler.to_dict()['phases']['children'])
+
+  def test_nested_phases(self):
+    with Profiler.phase('main'):
+      for _ in range(3):
+        with Profiler.phase('find_branch'):
+          pass
+      with Profiler.phase('convert_poms'):
+        pass
+    phases = Profiler.to_dict()['phases']
+    self.assertEquals(['main'], [phase['name'] for phase in phases['children']])
+    main = phases['children'][0]
+    self.assertEquals(1, main['calls'])
+    self.assertEquals([('find_branch', 3), ('convert_poms', 1)],
+                      [(phase['name'], phase['calls']) for phase in main['children']])
+
+  def test_modules_and_ratios(self):
+    Profiler.record_module('a/pom.xml', 1.0)
+    Profiler.record_module('b/pom.xml', 3.0)
+    Profiler.merge_counters({'local_targets.hits': 3, 'local_targets.misses': 1})
+    profile = Profiler.to_dict()
+    self.assertEquals(['b/pom.xml', 'a/pom.xml'], [m['module'] for m in profile['modules']])
+    self.assertEquals({'local_targets': 0.75}, profile['cache_hit_ratios'])
+
+  def test_parse_counters(self):
+    with temporary_dir() as tmpdir:
+      pom = os.path.join(tmpdir, 'pom.xml')
+      with open(pom, 'w') as f:
+        f.write('<project><artifactId>a</artifactId></project>')
+      PomHandlerManager.parse(pom)
+      PomHandlerManager.parse(pom)
+
+      output = os.path.join(tmpdir, 'profile.json')
+      Profiler.write_json(output)
+      with open(output) as f:
+        counters = json.load(f)['counters']
+    self.assertEquals(1, counters['xml.parses'])
+    self.assertEquals(1, counters['fs.files_read'])
+    self.assertEquals(1, counters['pom_handler_manager.misses'])
+    self.assertEquals(1, counters['pom_handler_manager.hits'])